@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-19 06:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_auto_20161002_1352'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='date_joined',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
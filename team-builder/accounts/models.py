@@ -2,6 +2,7 @@ from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
 from django.core.mail import send_mail
 from django.db import models
+from django.utils import timezone
 
 
 class MyUserManager(BaseUserManager):
@@ -43,6 +44,9 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
     is_superuser = models.BooleanField(default=False)
+    # Inactive users that joined more than ACCOUNT_ACTIVATION_DAYS ago are
+    # deleted by purge_inactive_users.
+    date_joined = models.DateTimeField(default=timezone.now, db_index=True)
     objects = MyUserManager()
 
     USERNAME_FIELD = 'email'
@@ -1,6 +1,12 @@
 from django.contrib.auth import get_user_model
+from django.core import mail
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from projects import mail as projects_mail
+from projects import models as projects_models
 
 from . import forms
 
@@ -232,3 +238,33 @@ class SignUpViewTests(TestCase):
         user = get_user_model().objects.get(email='user@example.com')
         self.assertEqual(user.userprofile.full_name, 'User Name')
         self.assertEqual(user.is_active, False)
+
+    def test_sign_up_queues_activation_email(self):
+        url = reverse('accounts:sign-up')
+        post_data = {
+            'full_name': 'User Name',
+            'email': 'user@example.com',
+            'password1': 'testpassword',
+            'password2': 'testpassword'
+        }
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, post_data)
+        sql = [query['sql'] for query in queries]
+        # The user, the profile with the full name and the email.
+        self.assertEqual(
+            [query.split()[2] for query in sql if query.startswith('INSERT')],
+            ['"accounts_myuser"', '"projects_userprofile"',
+             '"projects_outboundemail"'])
+        self.assertFalse([query for query in sql
+                          if query.startswith('UPDATE')])
+        # Nothing is sent during the request.
+        self.assertEqual(len(mail.outbox), 0)
+
+        email = projects_models.OutboundEmail.objects.get()
+        self.assertEqual(email.to, 'user@example.com')
+        self.assertIn('Dear User Name,', email.body)
+        self.assertIn('/accounts/activate/', email.body)
+
+        projects_mail.send_queued_emails()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
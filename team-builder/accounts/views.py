@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.core.urlresolvers import reverse_lazy
+from django.db import transaction
 from django.views.generic import RedirectView
 from django.views.generic.edit import FormView
 
@@ -8,6 +10,8 @@ from braces.views import LoginRequiredMixin
 from registration.backends.hmac.views import RegistrationView, ActivationView
 from registration.signals import user_activated
 
+from projects import mail
+
 from . import forms
 
 
@@ -44,21 +48,35 @@ class SignUpView(RegistrationView):
 
     def create_inactive_user(self, form):
         """
-        Create the inactive user account and send an email containing
+        Create the inactive user account and queue an email containing
         activation instructions.
-        Save user's full name to UserProfile.
+        The user and the profile with the user's full name are inserted in
+        one transaction, together with the email.
         """
         new_user = form.save(commit=False)
         new_user.is_active = False
-        new_user.save()
-
-        new_user.userprofile.full_name = form.cleaned_data['full_name']
-        new_user.userprofile.save()
-
-        self.send_activation_email(new_user)
+        # Read by create_profile.
+        new_user.full_name = form.cleaned_data['full_name']
+        with transaction.atomic():
+            new_user.save()
+            self.send_activation_email(new_user)
 
         return new_user
 
+    def send_activation_email(self, user):
+        """
+        Queue the activation email in the outbox. The send_queued_emails
+        worker (the worker process of the Procfile) delivers it once the
+        registration is committed.
+        """
+        context = self.get_email_context(self.get_activation_key(user))
+        context['user'] = user
+        subject, message = mail.render_email(self.email_subject_template,
+                                             self.email_body_template,
+                                             context)
+        mail.queue_email(subject=subject, body=message, to=(user.email,),
+                         from_email=settings.DEFAULT_FROM_EMAIL)
+
 
 class AccountActivateView(ActivationView):
     """Account activation view."""
@@ -75,4 +93,5 @@ def login_and_flash_messages(**kwargs):
                      'You have successfully registered and logged in.')
     messages.success(request, 'Tell us a little bit about yourself.')
 
+
 user_activated.connect(login_and_flash_messages)
@@ -8,3 +8,4 @@ admin.site.register(models.Skill)
 admin.site.register(models.Position)
 admin.site.register(models.UserProfile)
 admin.site.register(models.Role)
+admin.site.register(models.OutboundEmail)
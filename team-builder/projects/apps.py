@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class ProjectsConfig(AppConfig):
     name = 'projects'
+
+    def ready(self):
+        from team_builder import identity, sqlite, user_cache
+        connection_created.connect(sqlite.configure,
+                                   dispatch_uid='team_builder.sqlite')
+        identity.install(getattr(settings, 'IDENTITY_MAP_MODELS', ()))
+        user_cache.install('projects.UserProfile')
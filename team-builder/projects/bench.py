@@ -0,0 +1,338 @@
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.template.base import Template
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import models
+
+
+Endpoint = namedtuple('Endpoint', ('name', 'method', 'url', 'user', 'data'))
+
+# Metrics compared against the baseline. Latency and memory may grow by the
+# threshold, the number of queries may not grow at all.
+COMPARED_METRICS = (('p95_ms', True), ('peak_kb', True), ('queries', False))
+
+# Stack depth recorded by tracemalloc to find the project line responsible
+# for an allocation.
+TRACEBACK_FRAMES = 40
+
+
+def get_endpoints():
+    """Builds the list of benchmarked requests from existing data. Project
+    deletion is left out as it removes uploaded images from disk.
+    Raises ValueError if the database has no project with new
+    applications (run seed_bench first)."""
+    application = models.Application.objects.filter(
+        status='n'
+    ).select_related(
+        'applicant', 'position', 'position__project',
+        'position__project__owner'
+    ).order_by('id').first()
+    if application is None:
+        raise ValueError('No applications found, run seed_bench first.')
+    project = application.position.project
+    owner = project.owner
+    applicant = application.applicant
+    position = models.Position.objects.exclude(
+        applications__applicant=applicant
+    ).exclude(
+        project__owner=applicant
+    ).order_by('id').first()
+    new_ids = list(models.Application.objects.filter(
+        position__project=project,
+        status='n',
+    ).values_list('id', flat=True)[:20])
+
+    endpoints = [
+        Endpoint('home', 'get', reverse('projects:home'), None, None),
+        Endpoint('search', 'get', reverse('projects:search'), None,
+                 {'q': project.name.split()[0]}),
+        Endpoint('projects-for-me', 'get', reverse('projects:projects-for-me'),
+                 applicant, None),
+        Endpoint('project-detail', 'get',
+                 reverse('projects:project-detail', kwargs={'pk': project.pk}),
+                 applicant, None),
+        Endpoint('project-detail-owner', 'get',
+                 reverse('projects:project-detail', kwargs={'pk': project.pk}),
+                 owner, None),
+        Endpoint('project-create', 'get', reverse('projects:project-create'),
+                 owner, None),
+        Endpoint('project-update', 'get',
+                 reverse('projects:project-update', kwargs={'pk': project.pk}),
+                 owner, None),
+        Endpoint('user-profile-detail', 'get',
+                 reverse('projects:user-profile-detail',
+                         kwargs={'pk': applicant.userprofile.pk}),
+                 owner, None),
+        Endpoint('user-profile-update', 'get',
+                 reverse('projects:user-profile-update'), applicant, None),
+        Endpoint('applications', 'get', reverse('projects:applications'),
+                 owner, None),
+        Endpoint('applications-filtered', 'get',
+                 reverse('projects:applications'), owner,
+                 {'status': 'new applications',
+                  'project': project.name.lower()}),
+        Endpoint('applications-update', 'post',
+                 reverse('projects:applications-update',
+                         kwargs={'status': 'accept'}),
+                 owner, {'id': application.id}),
+        Endpoint('applications-bulk-update', 'post',
+                 reverse('projects:applications-bulk-update',
+                         kwargs={'status': 'reject'}),
+                 owner, {'ids': new_ids}),
+        Endpoint('sign-in', 'get', reverse('accounts:sign-in'), None, None),
+        Endpoint('sign-in-post', 'post', reverse('accounts:sign-in'), None,
+                 {'email': owner.email, 'password': 'password'}),
+        Endpoint('sign-up', 'get', reverse('accounts:sign-up'), None, None),
+        Endpoint('sign-out', 'get', reverse('accounts:sign-out'), owner,
+                 None),
+        Endpoint('registration-activate', 'get',
+                 reverse('accounts:registration-activate',
+                         kwargs={'activation_key': 'invalid-key'}),
+                 None, None),
+    ]
+    if position is not None:
+        endpoints.append(Endpoint(
+            'applications-create', 'post',
+            reverse('projects:applications-create',
+                    kwargs={'pk': position.project_id}),
+            applicant, {'position': position.id}))
+    return endpoints
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of a list of numbers."""
+    values = sorted(values)
+    index = max(int(round(percent / 100 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def _request(client, endpoint):
+    """Sends one request. Database changes are rolled back, so writes can be
+    repeated and the data stays the same between runs."""
+    if endpoint.user is not None:
+        client.force_login(endpoint.user)
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, endpoint.method)(endpoint.url,
+                                                        endpoint.data or {})
+            elapsed = time.perf_counter() - start
+        transaction.set_rollback(True)
+    return response, elapsed, len(queries)
+
+
+def run_endpoint(endpoint, requests=20, warmup=2):
+    """Benchmarks one endpoint. Returns a dict of metrics."""
+    client = Client()
+    for _ in range(warmup):
+        _request(client, endpoint)
+
+    timings = []
+    queries = 0
+    for _ in range(requests):
+        response, elapsed, count = _request(client, endpoint)
+        timings.append(elapsed)
+        queries = max(queries, count)
+
+    # Tracing slows requests down, so memory is measured separately.
+    tracemalloc.start()
+    try:
+        _request(client, endpoint)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'requests': requests,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p95_ms': percentile(timings, 95) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'rps': requests / sum(timings),
+        'queries': queries,
+        'peak_kb': peak / 1024,
+    }
+
+
+class PeakSnapshot(object):
+    """Keeps the tracemalloc snapshot taken when the traced memory was the
+    highest."""
+
+    def __init__(self):
+        self.size = -1
+        self.snapshot = None
+
+    def take(self):
+        size = tracemalloc.get_traced_memory()[0]
+        if size > self.size:
+            self.size = size
+            self.snapshot = tracemalloc.take_snapshot()
+
+
+@contextmanager
+def snapshot_renders(peak):
+    """Offers a snapshot to peak after every template render, when the
+    objects of the context and the rendered content are still alive."""
+    render = Template.render
+
+    def render_and_snapshot(template, context):
+        content = render(template, context)
+        peak.take()
+        return content
+
+    Template.render = render_and_snapshot
+    try:
+        yield
+    finally:
+        Template.render = render
+
+
+@lru_cache(maxsize=None)
+def application_path(filename):
+    """Returns the path of a file relative to the project if it is
+    application code, None otherwise. The team_builder package (middleware,
+    settings) and the benchmark itself are not application code."""
+    filename = os.path.abspath(filename)
+    if (not filename.startswith(settings.BASE_DIR) or
+            filename == os.path.abspath(__file__)):
+        return None
+    path = os.path.relpath(filename, settings.BASE_DIR)
+    if (path.startswith('team_builder' + os.sep) or
+            'management' + os.sep in path):
+        return None
+    return path
+
+
+def allocation_site(traceback):
+    """Returns 'path:line' of the innermost application frame of a
+    tracemalloc traceback, or of the innermost frame if no application code
+    is on it."""
+    frames = list(traceback)
+    if sys.version_info < (3, 7):
+        # Older versions list the most recent frame first.
+        frames.reverse()
+    for frame in reversed(frames):
+        path = application_path(frame.filename)
+        if path is not None:
+            return '{}:{}'.format(path, frame.lineno)
+    frame = frames[-1]
+    return '{}:{}'.format(frame.filename, frame.lineno)
+
+
+def top_sites(snapshot, limit=5):
+    """Returns the limit largest [site, KiB] pairs of a snapshot."""
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ))
+    sizes = Counter()
+    for statistic in snapshot.statistics('traceback'):
+        sizes[allocation_site(statistic.traceback)] += statistic.size
+    return [[site, size / 1024] for site, size in sizes.most_common(limit)]
+
+
+def measure_memory(endpoint, warmup=1, sites=5):
+    """Measures the memory of one endpoint. The peak and the memory still
+    allocated once the response is gone (retained) are measured in one
+    request, the allocation sites at the peak in another, as taking
+    snapshots allocates memory itself. Returns a dict of metrics."""
+    client = Client()
+    # Leave one-time allocations (imports, caches, connections) out.
+    for _ in range(max(warmup, 1)):
+        _request(client, endpoint)
+
+    gc.collect()
+    tracemalloc.start(TRACEBACK_FRAMES)
+    try:
+        response = _request(client, endpoint)[0]
+        status = response.status_code
+        peak = tracemalloc.get_traced_memory()[1]
+        del response
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0]
+
+        tracemalloc.clear_traces()
+        snapshots = PeakSnapshot()
+        with snapshot_renders(snapshots):
+            _request(client, endpoint)
+        snapshots.take()
+        sites = top_sites(snapshots.snapshot, sites)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'peak_kb': peak / 1024,
+        'retained_kb': retained / 1024,
+        'sites': sites,
+    }
+
+
+@contextmanager
+def bench_settings():
+    with override_settings(
+        ALLOWED_HOSTS=['testserver'],
+        # Keep the debug toolbar out of the measurements.
+        INTERNAL_IPS=[],
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    ):
+        yield
+
+
+def run(endpoints, requests=20, warmup=2):
+    """Benchmarks the endpoints. Returns {endpoint name: metrics}."""
+    results = {}
+    with bench_settings():
+        for endpoint in endpoints:
+            results[endpoint.name] = run_endpoint(endpoint, requests, warmup)
+    return results
+
+
+def run_memory(endpoints, warmup=1, sites=5):
+    """Measures the memory of the endpoints. Returns {endpoint name:
+    metrics}."""
+    results = {}
+    with bench_settings():
+        for endpoint in endpoints:
+            results[endpoint.name] = measure_memory(endpoint, warmup, sites)
+    return results
+
+
+def compare(results, baseline, threshold=0.25):
+    """Compares results with baseline results. Returns a list of
+    (endpoint, metric, baseline value, value) tuples for the regressions."""
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for metric, relative in COMPARED_METRICS:
+            value, base = metrics[metric], baseline[name][metric]
+            limit = base * (1 + threshold) if relative else base
+            if value > limit:
+                regressions.append((name, metric, base, value))
+    return regressions
+
+
+def check_budgets(results, budgets):
+    """Returns a list of (endpoint, budget, peak) tuples for the endpoints
+    whose peak memory in KiB is over their budget."""
+    return [(name, budgets[name], metrics['peak_kb'])
+            for name, metrics in sorted(results.items())
+            if name in budgets and metrics['peak_kb'] > budgets[name]]
+
+
+def make_budgets(results, headroom=0.25):
+    """Returns budgets allowing the measured peaks to grow by headroom."""
+    return {name: int(metrics['peak_kb'] * (1 + headroom)) + 1
+            for name, metrics in results.items()}
@@ -0,0 +1,56 @@
+import itertools
+
+from django.core.management.color import no_style
+from django.db import connection, reset_queries, transaction
+from django.db.models import Max
+
+
+def next_id(model):
+    """Returns the first free primary key of a model. Rows inserted with
+    bulk_create get explicit ids so related rows can point to them without
+    reading them back."""
+    max_id = model.objects.aggregate(max_id=Max('id'))['max_id']
+    return (max_id or 0) + 1
+
+
+def chunks(iterable, size):
+    """Yields lists of at most size items from an iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def batches(queryset, fields, batch_size):
+    """Yields lists of value tuples (id first) ordered by id, batch_size rows
+    at a time, without loading the whole table."""
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', *fields)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def insert(rows):
+    """Inserts lists of model instances in one transaction. rows is a list of
+    (model, instances) pairs in dependency order. No signals are sent.
+    Sequences are reset afterwards, so rows inserted later without an id do
+    not reuse the ids from next_id()."""
+    with transaction.atomic():
+        models = []
+        for model, instances in rows:
+            if instances:
+                model.objects.bulk_create(instances)
+                models.append(model)
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+    # With DEBUG on, every query would otherwise be kept in memory.
+    reset_queries()
@@ -104,12 +104,8 @@ class PositionForm(forms.ModelForm):
             value = self.cleaned_data['related_skills']
             data = []
             if value:
-                for val in value:
-                    skill, created = models.Skill.objects.get_or_create(
-                        name__iexact=val,
-                        defaults={'name': val}
-                    )
-                    data.append(skill.id)
+                skills = models.Skill.objects.get_or_create_names(value)
+                data = [skills[val.lower()].id for val in value]
             self.cleaned_data['related_skills'] = data
 
         if 'role_name' in self.cleaned_data and (
@@ -126,7 +122,44 @@ class PositionForm(forms.ModelForm):
         return super(PositionForm, self).save(commit)
 
 
-class BaseProjectFormset(forms.BaseInlineFormSet):
+class FormSetObjectField(forms.ModelChoiceField):
+    """Primary key field of model formset forms. Looks objects up among the
+    ones the formset has loaded instead of querying each of them."""
+    def __init__(self, objects, *args, **kwargs):
+        self.objects = objects
+        super(FormSetObjectField, self).__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.objects[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'],
+                                        code='invalid_choice')
+
+
+class LoadedObjectsFormSetMixin(object):
+    """Validates the ids of submitted forms against the formset queryset,
+    so the number of queries does not grow with the number of forms."""
+    def add_fields(self, form, index):
+        super(LoadedObjectsFormSetMixin, self).add_fields(form, index)
+        name = self._pk_field.name
+        field = form.fields.get(name)
+        if isinstance(field, forms.ModelChoiceField):
+            if not hasattr(self, '_loaded_objects'):
+                self._loaded_objects = {obj.pk: obj for obj in
+                                        self.get_queryset()}
+            form.fields[name] = FormSetObjectField(
+                self._loaded_objects,
+                field.queryset,
+                initial=field.initial,
+                required=False,
+                widget=field.widget,
+            )
+
+
+class BaseProjectFormset(LoadedObjectsFormSetMixin, forms.BaseInlineFormSet):
     """Project Inline Formset."""
     def clean(self):
         """Adds validation that each input skills are unique."""
@@ -235,8 +268,10 @@ class UserProfileSkillForm(forms.ModelForm):
         get or create a corresponding Skill object and assign it to a skill
         attribute of UserProfileSkill instance. While changing skill attribute,
         check that the old Skill is in use by any other UserProfileSkill or
-        Position. If not the case, delete the old Skill object.
+        Position. If not the case, delete the old Skill object once the
+        instance is saved.
         """
+        old_skill_id = None
         if 'skill_name' in self.cleaned_data and (
                 'skill_name' in self.changed_data):
             value = self.cleaned_data['skill_name']
@@ -244,15 +279,17 @@ class UserProfileSkillForm(forms.ModelForm):
                 name__iexact=value,
                 defaults={'name': value}
             )
-            if self.instance.skill:
-                if self.instance.skill.positions.count() == 0 and (
-                        self.instance.skill.users.count() == 1):
-                    self.instance.skill.delete()
+            if self.instance.skill_id != skill.id:
+                old_skill_id = self.instance.skill_id
             self.instance.skill = skill
-        return super(UserProfileSkillForm, self).save(commit)
+        instance = super(UserProfileSkillForm, self).save(commit)
+        if commit:
+            models.release_skills([old_skill_id])
+        return instance
 
 
-class BaseUserProfileSkillFormset(forms.BaseInlineFormSet):
+class BaseUserProfileSkillFormset(LoadedObjectsFormSetMixin,
+                                  forms.BaseInlineFormSet):
     """"UserProfileSkill Inline Formset."""
     def clean(self):
         """Adds validation that each input skills are unique."""
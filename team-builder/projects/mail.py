@@ -0,0 +1,195 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import models
+
+
+BACKEND_ALIASES = {
+    'console': 'django.core.mail.backends.console.EmailBackend',
+    'file': 'django.core.mail.backends.filebased.EmailBackend',
+    'locmem': 'django.core.mail.backends.locmem.EmailBackend',
+    'smtp': 'django.core.mail.backends.smtp.EmailBackend',
+}
+
+
+def render_email(subject_template, body_template, context):
+    """Renders subject and body templates. Returns (subject, body)."""
+    subject = render_to_string(subject_template, context)
+    # Force subject to a single line to avoid header-injection issues.
+    subject = ''.join(subject.splitlines())
+    body = render_to_string(body_template, context)
+    return subject, body
+
+
+def queue_email(subject, body, to, from_email='', dedupe_key=''):
+    """Adds an email to the outbox. The row is written in the current
+    transaction, so it is only delivered if the transaction commits.
+    If a pending email with the same dedupe key is already queued, nothing
+    is added. Returns the queued OutboundEmail or None."""
+    queued = queue_emails([{
+        'subject': subject,
+        'body': body,
+        'to': to,
+        'from_email': from_email,
+        'dedupe_key': dedupe_key,
+    }])
+    return queued[0] if queued else None
+
+
+def queue_emails(emails):
+    """Adds several emails to the outbox with a fixed number of queries.
+    Each email is a dict of queue_email keyword arguments. Returns a list of
+    the queued OutboundEmail instances (pk is only set on databases that
+    return it from bulk inserts)."""
+    keys = [email['dedupe_key'] for email in emails
+            if email.get('dedupe_key')]
+    pending = set()
+    if keys:
+        pending = set(models.OutboundEmail.objects.filter(
+            dedupe_key__in=keys,
+            status='p',
+        ).values_list('dedupe_key', flat=True))
+
+    queued = []
+    for email in emails:
+        dedupe_key = email.get('dedupe_key', '')
+        if dedupe_key:
+            if dedupe_key in pending:
+                continue
+            pending.add(dedupe_key)
+        queued.append(models.OutboundEmail(
+            subject=email['subject'],
+            body=email['body'],
+            to=','.join(email['to']),
+            from_email=email.get('from_email', ''),
+            dedupe_key=dedupe_key,
+        ))
+    if queued:
+        models.OutboundEmail.objects.bulk_create(queued)
+    return queued
+
+
+def retry_delay(attempts):
+    """Returns the delay before the next attempt (exponential backoff)."""
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def get_backend(backend=None):
+    """Resolves a backend alias ('file', 'locmem', ...) to a dotted path."""
+    if backend is None:
+        return None
+    return BACKEND_ALIASES.get(backend, backend)
+
+
+def _message(email, connection):
+    return EmailMessage(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or None,
+        to=email.recipients,
+        connection=connection,
+    )
+
+
+def _mark_failed(email, error, max_attempts):
+    """Records a failed attempt and schedules a retry or gives up."""
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = 'f'
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status',
+                              'next_attempt_at'])
+
+
+def claim_emails(batch_size):
+    """Returns a batch of due emails and makes them due again only after
+    EMAIL_OUTBOX_CLAIM_TIMEOUT seconds, so other workers skip them while they
+    are sent. Identical messages in the batch are marked sent at once.
+    Returns (emails, number of duplicates)."""
+    with transaction.atomic():
+        emails = list(
+            models.OutboundEmail.objects.select_for_update().filter(
+                status='p',
+                next_attempt_at__lte=timezone.now(),
+            ).order_by('id')[:batch_size]
+        )
+        if not emails:
+            return [], 0
+
+        # Skip identical messages queued more than once.
+        unique = []
+        duplicate_ids = []
+        seen = set()
+        for email in emails:
+            key = (email.to, email.subject, email.body)
+            if key in seen:
+                duplicate_ids.append(email.id)
+            else:
+                seen.add(key)
+                unique.append(email)
+
+        now = timezone.now()
+        models.OutboundEmail.objects.filter(
+            id__in=[email.id for email in unique]
+        ).update(next_attempt_at=now + timedelta(
+            seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT))
+        models.OutboundEmail.objects.filter(id__in=duplicate_ids).update(
+            status='s', sent_at=now, last_error='duplicate')
+    return unique, len(duplicate_ids)
+
+
+def send_queued_emails(batch_size=None, max_attempts=None, backend=None):
+    """Sends one batch of due emails over a single connection.
+    Returns a dict with the number of sent, retried, failed and duplicate
+    emails.
+
+    The batch is claimed in a short transaction, so no lock is held while
+    talking to the mail server. Messages are sent one at a time and each
+    one is marked sent right away: a failure only retries the messages that
+    were not delivered. If the worker dies in between, the claimed messages
+    are sent again after EMAIL_OUTBOX_CLAIM_TIMEOUT."""
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+    stats = {'sent': 0, 'retried': 0, 'failed': 0, 'duplicates': 0}
+
+    emails, stats['duplicates'] = claim_emails(batch_size)
+    if not emails:
+        return stats
+
+    failed = []
+    connection = get_connection(backend=get_backend(backend),
+                                fail_silently=False)
+    try:
+        connection.open()
+    except Exception as error:
+        # Nothing can be sent without a connection.
+        failed = [(email, error) for email in emails]
+    else:
+        try:
+            for email in emails:
+                try:
+                    connection.send_messages([_message(email, connection)])
+                except Exception as error:
+                    failed.append((email, error))
+                else:
+                    models.OutboundEmail.objects.filter(id=email.id).update(
+                        status='s', sent_at=timezone.now())
+                    stats['sent'] += 1
+        finally:
+            connection.close()
+
+    for email, error in failed:
+        _mark_failed(email, error, max_attempts)
+        if email.status == 'f':
+            stats['failed'] += 1
+        else:
+            stats['retried'] += 1
+    return stats
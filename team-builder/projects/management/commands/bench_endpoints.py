@@ -0,0 +1,121 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from projects import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks every page with the test client against the current "
+        "database (see seed_bench) and reports latency percentiles, "
+        "requests per second, SQL queries and peak memory per endpoint. "
+        "Fails if a result regresses against --baseline. With --memory, "
+        "reports the peak and retained memory per request and the largest "
+        "allocation sites instead, and fails if a peak is over its budget "
+        "in --budgets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20,
+                            help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Unmeasured requests per endpoint.')
+        parser.add_argument('--endpoint', action='append', default=[],
+                            help='Only run this endpoint (repeatable).')
+        parser.add_argument('--output', default=None,
+                            help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', default=None,
+                            help='JSON results to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed relative increase of latency and '
+                                 'memory over the baseline, and headroom of '
+                                 'written budgets.')
+        parser.add_argument('--memory', action='store_true',
+                            help='Measure memory with tracemalloc.')
+        parser.add_argument('--sites', type=int, default=5,
+                            help='Allocation sites shown per endpoint.')
+        parser.add_argument('--budgets', default=None,
+                            help='JSON file of peak memory budgets in KiB '
+                                 'per endpoint. memory_budgets.json holds '
+                                 'the budgets for the default seed_bench '
+                                 'data.')
+        parser.add_argument('--write-budgets', action='store_true',
+                            help='Write the measured peaks plus --threshold '
+                                 'to --budgets instead of checking them.')
+
+    def handle(self, **options):
+        try:
+            endpoints = bench.get_endpoints()
+        except ValueError as error:
+            raise CommandError(error)
+        if options['endpoint']:
+            endpoints = [endpoint for endpoint in endpoints
+                         if endpoint.name in options['endpoint']]
+
+        if options['memory']:
+            return self.handle_memory(endpoints, options)
+
+        results = bench.run(endpoints, options['requests'], options['warmup'])
+
+        self.stdout.write('{:<26} {:>6} {:>8} {:>8} {:>8} {:>8} {:>7} '
+                          '{:>9}'.format('endpoint', 'status', 'p50 ms',
+                                         'p95 ms', 'p99 ms', 'req/s',
+                                         'queries', 'peak KiB'))
+        for name, metrics in sorted(results.items()):
+            self.stdout.write(
+                '{name:<26} {status:>6} {p50_ms:>8.1f} {p95_ms:>8.1f} '
+                '{p99_ms:>8.1f} {rps:>8.1f} {queries:>7} '
+                '{peak_kb:>9.0f}'.format(name=name, **metrics))
+
+        self.write_output(results, options['output'])
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                regressions = bench.compare(results, json.load(baseline),
+                                            options['threshold'])
+            for name, metric, base, value in regressions:
+                self.stderr.write('{}: {} went from {:.1f} to {:.1f}'.format(
+                    name, metric, base, value))
+            if regressions:
+                raise CommandError('{} regression(s) found.'.format(
+                    len(regressions)))
+
+    def handle_memory(self, endpoints, options):
+        results = bench.run_memory(endpoints, options['warmup'],
+                                   options['sites'])
+
+        self.stdout.write('{:<26} {:>6} {:>9} {:>13}'.format(
+            'endpoint', 'status', 'peak KiB', 'retained KiB'))
+        for name, metrics in sorted(results.items()):
+            self.stdout.write(
+                '{name:<26} {status:>6} {peak_kb:>9.0f} '
+                '{retained_kb:>13.0f}'.format(name=name, **metrics))
+        for name, metrics in sorted(results.items()):
+            if not metrics['sites']:
+                continue
+            self.stdout.write('\n{} allocation sites at peak:'.format(name))
+            for site, size in metrics['sites']:
+                self.stdout.write('  {:>9.0f} KiB  {}'.format(size, site))
+
+        self.write_output(results, options['output'])
+
+        if not options['budgets']:
+            return
+        if options['write_budgets']:
+            with open(options['budgets'], 'w') as output:
+                json.dump(bench.make_budgets(results, options['threshold']),
+                          output, indent=2, sort_keys=True)
+            return
+        with open(options['budgets']) as budgets:
+            over = bench.check_budgets(results, json.load(budgets))
+        for name, budget, peak in over:
+            self.stderr.write('{}: peak memory of {:.0f} KiB is over the '
+                              'budget of {} KiB'.format(name, peak, budget))
+        if over:
+            raise CommandError('{} endpoint(s) over budget.'.format(len(over)))
+
+    def write_output(self, results, path):
+        if path:
+            with open(path, 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.test import Client, override_settings
+
+from projects import bench
+from projects import models
+from team_builder.sqlite import copy_sqlite
+
+
+MODES = (('stock', False), ('tuned', True))
+
+
+def get_plans(workers, requests):
+    """Returns a list of request plans, one per worker. Each worker applies
+    for positions as one user and rejects applications to the projects of
+    another, so workers write concurrently without touching the same
+    rows. A plan is a list of (user id, url, data) tuples."""
+    owners = list(models.Project.objects.filter(
+        positions__applications__status='n'
+    ).values_list('owner', flat=True).distinct().order_by('owner')[:workers])
+    applicants = list(models.UserProfile.objects.exclude(
+        user__in=owners
+    ).order_by('user').values_list('user', flat=True)[:workers])
+    if len(owners) < workers or len(applicants) < workers:
+        raise CommandError('Not enough data for {} workers, run seed_bench '
+                           'first.'.format(workers))
+
+    plans = []
+    for owner, applicant in zip(owners, applicants):
+        positions = models.Position.objects.exclude(
+            project__owner__in=owners + [applicant]
+        ).exclude(
+            applications__applicant=applicant
+        ).order_by('?').values_list('id', 'project')[:requests // 2]
+        positions = list(positions)
+        applications = models.Application.objects.filter(
+            position__project__owner=owner, status='n'
+        ).values_list('id', flat=True)[:requests - len(positions)]
+
+        creates = [(applicant,
+                    reverse('projects:applications-create',
+                            kwargs={'pk': project}),
+                    {'position': position})
+                   for position, project in positions]
+        updates = [(owner,
+                    reverse('projects:applications-update',
+                            kwargs={'status': 'reject'}),
+                    {'id': application})
+                   for application in applications]
+        plan = []
+        while creates or updates:
+            for pending in (creates, updates):
+                if pending:
+                    plan.append(pending.pop())
+        plans.append(plan)
+    return plans
+
+
+def run_worker(plan, barrier, results):
+    """Sends the requests of a plan once all workers are ready and puts
+    (timings, locked errors, other errors, start, end) on results."""
+    clients = {}
+    for user_id in {user_id for user_id, url, data in plan}:
+        clients[user_id] = Client()
+        clients[user_id].force_login(
+            get_user_model().objects.get(id=user_id))
+    connections.close_all()
+    timings, locked, errors = [], 0, 0
+    barrier.wait()
+    start = time.perf_counter()
+    with bench.bench_settings():
+        for user_id, url, data in plan:
+            request_start = time.perf_counter()
+            try:
+                response = clients[user_id].post(url, data)
+            except OperationalError as error:
+                if 'locked' in str(error):
+                    locked += 1
+                else:
+                    errors += 1
+                continue
+            if response.status_code >= 500:
+                errors += 1
+            else:
+                timings.append(time.perf_counter() - request_start)
+    results.put((timings, locked, errors, start, time.perf_counter()))
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks concurrent writers on copies of the SQLite database, "
+        "without and with SQLITE_TUNING. Every worker process creates and "
+        "rejects applications through the views, and the command reports "
+        "the throughput, latency and \"database is locked\" errors of each "
+        "mode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=40,
+                            help='Requests per worker.')
+
+    def handle(self, **options):
+        source = connections[DEFAULT_DB_ALIAS]
+        if (source.vendor != 'sqlite' or
+                source.is_in_memory_db(source.settings_dict['NAME'])):
+            raise CommandError('The default database is not an SQLite file.')
+        plans = get_plans(options['workers'], options['requests'])
+
+        self.stdout.write('{:<6} {:>8} {:>6} {:>7} {:>6} {:>8} {:>8} '
+                          '{:>8}'.format('mode', 'requests', 'ok', 'locked',
+                                         'other', 'req/s', 'p50 ms',
+                                         'p95 ms'))
+        with tempfile.TemporaryDirectory() as directory:
+            for mode, tuning in MODES:
+                path = os.path.join(directory, mode + '.sqlite3')
+                copy_sqlite(source, path)
+                with override_settings(SQLITE_TUNING=tuning):
+                    results = self.run(source, path, plans)
+                self.report(mode, plans, results)
+
+    def run(self, source, path, plans):
+        """Runs the plans in parallel processes on the database at path."""
+        name = source.settings_dict['NAME']
+        # Forked workers must not share the connection of this process.
+        connections.close_all()
+        source.settings_dict['NAME'] = path
+        try:
+            barrier = multiprocessing.Barrier(len(plans))
+            queue = multiprocessing.Queue()
+            processes = [multiprocessing.Process(target=run_worker,
+                                                 args=(plan, barrier, queue))
+                         for plan in plans]
+            for process in processes:
+                process.start()
+            results = [queue.get() for process in processes]
+            for process in processes:
+                process.join()
+        finally:
+            connections.close_all()
+            source.settings_dict['NAME'] = name
+        return results
+
+    def report(self, mode, plans, results):
+        timings = sorted(timing for result in results for timing in result[0])
+        elapsed = (max(result[4] for result in results) -
+                   min(result[3] for result in results))
+        self.stdout.write(
+            '{:<6} {:>8} {:>6} {:>7} {:>6} {:>8.1f} {:>8.1f} {:>8.1f}'.format(
+                mode, sum(len(plan) for plan in plans), len(timings),
+                sum(result[1] for result in results),
+                sum(result[2] for result in results),
+                len(timings) / elapsed,
+                bench.percentile(timings, 50) * 1000 if timings else 0,
+                bench.percentile(timings, 95) * 1000 if timings else 0))
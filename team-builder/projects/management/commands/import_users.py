@@ -0,0 +1,171 @@
+import csv
+import json
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from projects import bulk, models
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports users with profiles and skills from CSV or JSON Lines. "
+        "Rows are read in batches and inserted with bulk_create, so no "
+        "signals are sent. Users whose email exists already are skipped, so "
+        "an interrupted import can be run again. Ids are assigned by the "
+        "command: do not run it while users sign up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, - for stdin.')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            default=None,
+                            help='Defaults to csv for .csv files, jsonl '
+                                 'otherwise.')
+        parser.add_argument('--hashed-passwords', action='store_true',
+                            help='The password column holds Django password '
+                                 'hashes. Otherwise passwords are hashed one '
+                                 'by one, which is slow.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, **options):
+        self.hashed_passwords = options['hashed_passwords']
+        self.counts = dict.fromkeys(
+            ('users', 'skills', 'existing', 'invalid'), 0)
+        start = time.time()
+
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            file_format = 'csv' if path.endswith('.csv') else 'jsonl'
+        if path == '-':
+            self.import_file(sys.stdin, file_format, options['batch_size'])
+        else:
+            try:
+                with open(path, encoding='utf-8', newline='') as f:
+                    self.import_file(f, file_format, options['batch_size'])
+            except OSError as e:
+                raise CommandError(e)
+
+        self.stdout.write(
+            'Imported {users} users with {skills} skill links, skipped '
+            '{existing} existing users and {invalid} invalid rows in '
+            '{seconds:.1f}s.'.format(seconds=time.time() - start,
+                                     **self.counts))
+
+    def read_rows(self, f, file_format):
+        """Yields (line number, row dict) pairs. Skills are a list of names.
+        """
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                # A CSV cell holds the skill names separated by semicolons.
+                row['skills'] = (row.get('skills') or '').split(';')
+                yield reader.line_num, row
+        else:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_num, row
+
+    def clean(self, line_num, row, User):
+        """Returns the row with a normalized email, a password hash and
+        stripped skill names, or None if the row is invalid."""
+        if not isinstance(row, dict) or not row.get('email'):
+            self.stderr.write('Line {}: no email.'.format(line_num))
+            return None
+        for field in ('email', 'password', 'full_name', 'biography'):
+            if not isinstance(row.get(field) or '', str):
+                self.stderr.write('Line {}: {} is not a string.'.format(
+                    line_num, field))
+                return None
+        password = row.get('password') or None
+        if password is None:
+            password = make_password(None)
+        elif self.hashed_passwords:
+            try:
+                identify_hasher(password)
+            except ValueError:
+                self.stderr.write(
+                    'Line {}: unknown password hash.'.format(line_num))
+                return None
+        else:
+            password = make_password(password)
+        skills = row.get('skills') or []
+        if (not isinstance(skills, list) or
+                not all(isinstance(name, str) for name in skills)):
+            self.stderr.write('Line {}: skills are not a list of names.'
+                              .format(line_num))
+            return None
+        return {
+            'email': User.objects.normalize_email(row['email']),
+            'password': password,
+            'full_name': row.get('full_name') or '',
+            'biography': row.get('biography') or '',
+            'skills': [name.strip() for name in skills
+                       if name and name.strip()],
+        }
+
+    def import_file(self, f, file_format, batch_size):
+        User = get_user_model()
+        for chunk in bulk.chunks(self.read_rows(f, file_format), batch_size):
+            rows = {}
+            for line_num, row in chunk:
+                row = self.clean(line_num, row, User)
+                if row is None:
+                    self.counts['invalid'] += 1
+                elif row['email'] in rows:
+                    self.counts['existing'] += 1
+                else:
+                    rows[row['email']] = row
+            existing = set(User.objects.filter(
+                email__in=rows.keys()).values_list('email', flat=True))
+            self.counts['existing'] += len(existing)
+            self.import_rows([row for email, row in rows.items()
+                              if email not in existing], User)
+
+    def import_rows(self, rows, User):
+        """Inserts the users of one batch with their profiles and skills."""
+        if not rows:
+            return
+        skills = models.Skill.objects.get_or_create_names(
+            [name for row in rows for name in row['skills']])
+        user_id = bulk.next_id(User)
+        profile_id = bulk.next_id(models.UserProfile)
+        link_id = bulk.next_id(models.UserProfileSkill)
+
+        users, profiles, links = [], [], []
+        for row in rows:
+            users.append(User(id=user_id, email=row['email'],
+                              password=row['password']))
+            # bulk_create skips the create_profile signal.
+            profiles.append(models.UserProfile(
+                id=profile_id,
+                user_id=user_id,
+                full_name=row['full_name'],
+                biography=row['biography'],
+            ))
+            skill_ids = {skills[name.lower()].id for name in row['skills']}
+            for skill_id in sorted(skill_ids):
+                links.append(models.UserProfileSkill(
+                    id=link_id,
+                    user_profile_id=profile_id,
+                    skill_id=skill_id,
+                ))
+                link_id += 1
+            user_id += 1
+            profile_id += 1
+        bulk.insert([
+            (User, users),
+            (models.UserProfile, profiles),
+            (models.UserProfileSkill, links),
+        ])
+        self.counts['users'] += len(users)
+        self.counts['skills'] += len(links)
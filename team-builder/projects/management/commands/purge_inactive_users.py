@@ -0,0 +1,73 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from projects import models
+from projects.bulk import batches
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the accounts that were never activated within "
+        "ACCOUNT_ACTIVATION_DAYS, with their profiles and avatars. Users "
+        "are deleted in batches, one short transaction each. Run it daily "
+        "as a cronjob."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to wait between batches.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the expired accounts without '
+                                 'deleting them.')
+
+    def get_queryset(self):
+        """Returns the expired inactive users. Users that logged in once
+        were deactivated later and are kept."""
+        expired = timezone.now() - datetime.timedelta(
+            days=settings.ACCOUNT_ACTIVATION_DAYS)
+        return get_user_model().objects.filter(
+            is_active=False,
+            last_login__isnull=True,
+            date_joined__lt=expired,
+        )
+
+    def handle(self, **options):
+        queryset = self.get_queryset()
+        if options['dry_run']:
+            self.stdout.write('Expired inactive users: {}'.format(
+                queryset.count()))
+            return
+
+        deleted = 0
+        start = time.time()
+        for rows in batches(queryset, (), options['batch_size']):
+            if deleted and options['pause']:
+                time.sleep(options['pause'])
+            deleted += self.delete_users(queryset.filter(
+                id__in=[row[0] for row in rows]))
+        seconds = time.time() - start
+        self.stdout.write(
+            'Deleted {} expired inactive users in {:.1f}s ({:.0f} users/s).'
+            .format(deleted, seconds, deleted / seconds if seconds else 0))
+
+    def delete_users(self, users):
+        """Deletes the users with their profiles, then the avatar files.
+        Returns the number of users deleted. The users are filtered again
+        inside the transaction, so one activated meanwhile is kept. Unused
+        skills are deleted once per batch."""
+        avatar = models.UserProfile._meta.get_field('avatar')
+        with transaction.atomic(), models.defer_skill_cleanup():
+            avatars = list(models.UserProfile.objects.filter(
+                user__in=users
+            ).exclude(avatar='').values_list('avatar', flat=True))
+            count = users.delete()[1].get(users.model._meta.label, 0)
+        for name in avatars:
+            avatar.storage.delete(name)
+        return count
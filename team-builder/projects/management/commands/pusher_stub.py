@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from projects.notifications import StubPusherServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a local stand-in for the Pusher REST API and prints the "
+        "events it receives. Set PUSHER_HOST, PUSHER_PORT and "
+        "PUSHER_SSL = False in local settings to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, **options):
+        stub = StubPusherServer(options['host'], options['port']).start()
+        self.stdout.write('Pusher stub listening on {}:{}'.format(
+            stub.host, stub.port))
+        printed = 0
+        try:
+            while True:
+                time.sleep(0.5)
+                for event in stub.events[printed:]:
+                    self.stdout.write('{channel} {name}: {data}'.format(
+                        **event))
+                printed = len(stub.events)
+        except KeyboardInterrupt:
+            stub.stop()
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from projects import models
+from projects.bulk import batches
+
+
+# Fields compared to find listings that drifted from their projects.
+FIELDS = ('name', 'needs_summary', 'roles', 'search_text')
+# Fields of the ProjectListingSkill rows of a listing.
+SKILL_FIELDS = ('position_id', 'skill_id', 'skill_count')
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks ProjectListing against the projects in batches, rebuilds "
+        "missing and stale listings and deletes those of inactive projects."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without fixing it.')
+
+    def handle(self, **options):
+        fixed = 0
+        for rows in batches(models.Project.objects.all(), (),
+                            options['batch_size']):
+            ids = [row[0] for row in rows]
+            stale = self.find_stale(ids)
+            if stale and not options['dry_run']:
+                models.ProjectListing.objects.refresh(stale)
+            fixed += len(stale)
+        self.stdout.write('Projects with stale listings: {}'.format(fixed))
+
+    def find_stale(self, project_ids):
+        """Returns the ids of the projects whose listing differs from what
+        ProjectListing.objects.build() makes of them."""
+        stored = {
+            row[0]: row[1:] + ([],) for row in
+            models.ProjectListing.objects.filter(
+                project__in=project_ids
+            ).values_list('project', *FIELDS)
+        }
+        for row in models.ProjectListingSkill.objects.filter(
+                listing__in=stored.keys()).order_by(
+                'position_id', 'skill_id').values_list('listing',
+                                                       *SKILL_FIELDS):
+            stored[row[0]][-1].append(row[1:])
+        built = {}
+        for listing in models.ProjectListing.objects.build(project_ids):
+            needed_skills = [
+                tuple(getattr(needed_skill, field) for field in SKILL_FIELDS)
+                for needed_skill in listing.needed_skills
+            ]
+            built[listing.project_id] = tuple(
+                getattr(listing, field) for field in FIELDS
+            ) + (needed_skills,)
+        return [pk for pk in project_ids if stored.get(pk) != built.get(pk)]
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Sum, When
+
+from projects import models
+from projects.bulk import batches
+
+
+class Command(BaseCommand):
+    help = (
+        "Recounts Project.open_positions, Position.application_count and "
+        "Position.new_application_count in batches and repairs drift. Also "
+        "rebuilds Project.needs_summary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without fixing it.')
+
+    def handle(self, **options):
+        self.dry_run = options['dry_run']
+        batch_size = options['batch_size']
+
+        fixed = 0
+        for rows in batches(models.Position.objects.all(),
+                            ('application_count', 'new_application_count'),
+                            batch_size):
+            fixed += self.reconcile_positions(rows)
+        self.stdout.write('Positions with drifted counters: {}'.format(fixed))
+
+        fixed = 0
+        for rows in batches(models.Project.objects.all(),
+                            ('open_positions',), batch_size):
+            fixed += self.reconcile_projects(rows)
+        self.stdout.write('Projects with drifted counters: {}'.format(fixed))
+
+    def reconcile_positions(self, rows):
+        counts = {
+            row['position']: row for row in
+            models.Application.objects.filter(
+                position__in=[row[0] for row in rows]
+            ).values('position').annotate(
+                total=Count('id'),
+                new=Sum(Case(When(status='n', then=1), default=0,
+                             output_field=IntegerField())),
+            )
+        }
+        total, new = {}, {}
+        for pk, application_count, new_application_count in rows:
+            row = counts.get(pk, {'total': 0, 'new': 0})
+            if row['total'] != application_count:
+                total[pk] = row['total'] - application_count
+            if row['new'] != new_application_count:
+                new[pk] = row['new'] - new_application_count
+        if not self.dry_run:
+            with transaction.atomic():
+                models.Position.objects.adjust_application_counts(total, new)
+        return len(set(total) | set(new))
+
+    def reconcile_projects(self, rows):
+        ids = [row[0] for row in rows]
+        counts = dict(
+            models.Position.objects.filter(
+                project__in=ids,
+                user__isnull=True,
+            ).values('project').annotate(
+                open_positions=Count('id')
+            ).values_list('project', 'open_positions')
+        )
+        deltas = {}
+        for pk, open_positions in rows:
+            if counts.get(pk, 0) != open_positions:
+                deltas[pk] = counts.get(pk, 0) - open_positions
+        if not self.dry_run:
+            with transaction.atomic():
+                models.Project.objects.adjust_open_positions(deltas)
+                models.Project.objects.filter(id__in=ids).update_active()
+                models.Project.objects.filter(
+                    id__in=ids).update_needs_summary()
+        return len(deltas)
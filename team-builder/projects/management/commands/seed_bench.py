@@ -0,0 +1,247 @@
+import bisect
+import itertools
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+
+from projects import bulk, models
+
+
+ROLES = (
+    'Python Developer', 'Designer', 'Android Developer', 'iOS Developer',
+    'Frontend Developer', 'Backend Developer', 'Data Scientist',
+    'DevOps Engineer', 'Project Manager', 'QA Engineer', 'Copywriter',
+    'Marketing Specialist', 'UX Researcher', 'Database Administrator',
+    'Security Engineer', 'Technical Writer',
+)
+
+WORDS = (
+    'app', 'build', 'community', 'data', 'design', 'easy', 'fast', 'game',
+    'help', 'idea', 'local', 'map', 'mobile', 'music', 'open', 'people',
+    'platform', 'project', 'simple', 'share', 'social', 'team', 'tool',
+    'users', 'web', 'work',
+)
+
+TIMELINES = ('1 week', '2 weeks', '1 month', '3 months', '6 months')
+
+
+class Zipf(object):
+    """Draws values with probability proportional to 1 / rank ** exponent,
+    so a few values are very common and most are rare."""
+
+    def __init__(self, values, rng, exponent=1.0):
+        self.values = list(values)
+        self.rng = rng
+        self.cum_weights = list(itertools.accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.values) + 1)))
+
+    def choice(self):
+        x = self.rng.random() * self.cum_weights[-1]
+        return self.values[bisect.bisect(self.cum_weights, x)]
+
+    def sample(self, k):
+        """Returns k distinct values."""
+        k = min(k, len(self.values))
+        chosen = []
+        while len(chosen) < k:
+            value = self.choice()
+            if value not in chosen:
+                chosen.append(value)
+        return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with a synthetic dataset for load testing: users "
+        "with profiles and skills, projects, positions and applications. "
+        "Rows are inserted with bulk_create in batches and the output only "
+        "depends on --seed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--projects', type=int, default=None,
+                            help='Defaults to a fifth of --users.')
+        parser.add_argument('--positions', type=int, default=4,
+                            help='Maximum number of positions per project.')
+        parser.add_argument('--applications', type=int, default=5,
+                            help='Maximum number of applications per '
+                                 'position.')
+        parser.add_argument('--skills', type=int, default=500,
+                            help='Size of the skill vocabulary.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.counts = dict.fromkeys(
+            ('users', 'skills', 'projects', 'positions', 'applications'), 0)
+        start = time.time()
+
+        self.roles = Zipf(self.vocabulary(models.Role, ROLES), self.rng)
+        self.skills = Zipf(self.vocabulary(
+            models.Skill,
+            ['Skill {}'.format(i) for i in range(1, options['skills'] + 1)]
+        ), self.rng)
+
+        first_user = self.create_users(options['users'])
+        projects = options['projects']
+        if projects is None:
+            projects = options['users'] // 5
+        self.create_projects(projects, range(first_user,
+                                             first_user + options['users']),
+                             options['positions'], options['applications'])
+
+        self.stdout.write(
+            'Created {users} users, {skills} skill links, {projects} '
+            'projects, {positions} positions and {applications} '
+            'applications in {seconds:.1f}s.'.format(
+                seconds=time.time() - start, **self.counts))
+
+    def vocabulary(self, model, names):
+        """Returns ids of the named rows, creating the missing ones."""
+        ids = dict(model.objects.filter(name__in=names)
+                   .values_list('name', 'id'))
+        pk = bulk.next_id(model)
+        missing = []
+        for name in names:
+            if name not in ids:
+                ids[name] = pk
+                missing.append(model(id=pk, name=name))
+                pk += 1
+        for chunk in bulk.chunks(missing, self.batch_size):
+            bulk.insert([(model, chunk)])
+        return [ids[name] for name in names]
+
+    def words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def create_users(self, count):
+        """Creates users with profiles and skills. Returns the first user
+        id."""
+        User = get_user_model()
+        # Hashing is slow, so every user shares the password 'password'.
+        password = make_password('password')
+        first_user = bulk.next_id(User)
+        profile_id = bulk.next_id(models.UserProfile)
+        link_id = bulk.next_id(models.UserProfileSkill)
+
+        ids = range(first_user, first_user + count)
+        for chunk in bulk.chunks(ids, self.batch_size):
+            users, profiles, links = [], [], []
+            for user_id in chunk:
+                users.append(User(
+                    id=user_id,
+                    email='bench{}@example.com'.format(user_id),
+                    password=password,
+                ))
+                # bulk_create skips the create_profile signal.
+                profiles.append(models.UserProfile(
+                    id=profile_id,
+                    user_id=user_id,
+                    full_name='Bench User {}'.format(user_id),
+                    biography=self.words(30),
+                ))
+                for skill_id in self.skills.sample(self.rng.randint(0, 5)):
+                    links.append(models.UserProfileSkill(
+                        id=link_id,
+                        user_profile_id=profile_id,
+                        skill_id=skill_id,
+                    ))
+                    link_id += 1
+                profile_id += 1
+            bulk.insert([
+                (User, users),
+                (models.UserProfile, profiles),
+                (models.UserProfileSkill, links),
+            ])
+            self.counts['users'] += len(users)
+            self.counts['skills'] += len(links)
+        return first_user
+
+    def create_projects(self, count, user_ids, max_positions,
+                        max_applications):
+        """Creates projects with positions and applications. Counters, the
+        active flag, the needs summary and the listings are set directly, as
+        bulk_create sends no signals."""
+        PositionSkill = models.Position.related_skills.through
+        first_project = bulk.next_id(models.Project)
+        position_id = bulk.next_id(models.Position)
+        application_id = bulk.next_id(models.Application)
+        link_id = bulk.next_id(PositionSkill)
+
+        ids = range(first_project, first_project + count)
+        for chunk in bulk.chunks(ids, self.batch_size):
+            projects, positions, links, applications = [], [], [], []
+            for project_id in chunk:
+                open_positions = 0
+                for _ in range(self.rng.randint(1, max_positions)):
+                    applicants = self.rng.sample(
+                        user_ids,
+                        min(self.rng.randint(0, max_applications),
+                            len(user_ids)))
+                    # Fill some positions with one of their applicants.
+                    user_id = None
+                    if applicants and self.rng.random() < 0.3:
+                        user_id = applicants[0]
+                    new = 0
+                    for applicant_id in applicants:
+                        if user_id:
+                            status = 'a' if applicant_id == user_id else 'r'
+                        else:
+                            status = 'r' if self.rng.random() < 0.2 else 'n'
+                        new += status == 'n'
+                        applications.append(models.Application(
+                            id=application_id,
+                            applicant_id=applicant_id,
+                            position_id=position_id,
+                            status=status,
+                        ))
+                        application_id += 1
+                    positions.append(models.Position(
+                        id=position_id,
+                        role_id=self.roles.choice(),
+                        description=self.words(40),
+                        project_id=project_id,
+                        user_id=user_id,
+                        involvement='{} hours/week'.format(
+                            self.rng.choice((5, 10, 20, 40))),
+                        application_count=len(applicants),
+                        new_application_count=new,
+                    ))
+                    for skill_id in self.skills.sample(self.rng.randint(1, 4)):
+                        links.append(PositionSkill(
+                            id=link_id,
+                            position_id=position_id,
+                            skill_id=skill_id,
+                        ))
+                        link_id += 1
+                    open_positions += user_id is None
+                    position_id += 1
+                projects.append(models.Project(
+                    id=project_id,
+                    name=self.words(3).title(),
+                    description=self.words(80),
+                    timeline=self.rng.choice(TIMELINES),
+                    requirements=self.words(20),
+                    url='https://example.com/projects/{}'.format(project_id),
+                    owner_id=self.rng.choice(user_ids),
+                    active=open_positions > 0,
+                    open_positions=open_positions,
+                ))
+            bulk.insert([
+                (models.Project, projects),
+                (models.Position, positions),
+                (PositionSkill, links),
+                (models.Application, applications),
+            ])
+            models.Project.objects.filter(
+                id__in=chunk).update_needs_summary()
+            models.ProjectListing.objects.refresh(chunk)
+            self.counts['projects'] += len(projects)
+            self.counts['positions'] += len(positions)
+            self.counts['applications'] += len(applications)
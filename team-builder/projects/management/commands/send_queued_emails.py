@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from projects import mail
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends emails queued in the outbox in batches over a single "
+        "connection. Run it as a cronjob or with --loop as a worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Number of emails sent per connection.')
+        parser.add_argument('--max-attempts', type=int, default=None,
+                            help='Attempts before an email is marked failed.')
+        parser.add_argument('--backend', default=None,
+                            help='Email backend: file, locmem, console, smtp '
+                                 'or a dotted path. Defaults to '
+                                 'EMAIL_BACKEND.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox for new emails.')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to wait when the outbox is empty.')
+
+    def handle(self, **options):
+        while True:
+            stats = mail.send_queued_emails(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+                backend=options['backend'],
+            )
+            if any(stats.values()):
+                self.stdout.write(
+                    'Sent {sent}, retried {retried}, failed {failed}, '
+                    'skipped {duplicates} duplicates.'.format(**stats))
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
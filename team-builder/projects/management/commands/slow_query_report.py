@@ -0,0 +1,72 @@
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Aggregates the slow query log (see SLOW_QUERY_THRESHOLD) by query "
+        "shape and prints the top queries with their callers and plans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None,
+                            help='Defaults to SLOW_QUERY_LOG_FILE.')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--order', default='total',
+                            choices=('total', 'max', 'count'))
+
+    def handle(self, **options):
+        path = options['file'] or settings.SLOW_QUERY_LOG_FILE
+        try:
+            with open(path) as log:
+                entries = [json.loads(line) for line in log if line.strip()]
+        except FileNotFoundError:
+            raise CommandError('No slow query log at {}.'.format(path))
+
+        shapes = {}
+        for entry in entries:
+            shape = shapes.setdefault(entry['sql'], {
+                'sql': entry['sql'],
+                'count': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'params': None,
+                'callers': Counter(),
+                'views': Counter(),
+                'explain': None,
+            })
+            shape['count'] += 1
+            shape['total'] += entry['duration_ms']
+            if entry['duration_ms'] >= shape['max']:
+                shape['max'] = entry['duration_ms']
+                shape['params'] = entry['params']
+            shape['callers'][entry['caller']] += 1
+            shape['views'][entry['view']] += 1
+            if entry.get('explain'):
+                shape['explain'] = entry['explain']
+
+        top = sorted(shapes.values(),
+                     key=lambda shape: shape[options['order']],
+                     reverse=True)[:options['top']]
+        self.stdout.write('{} slow queries, {} distinct shapes.'.format(
+            len(entries), len(shapes)))
+        for rank, shape in enumerate(top, 1):
+            self.stdout.write('')
+            self.stdout.write(
+                '#{} total {:.1f} ms, {} calls, mean {:.1f} ms, '
+                'max {:.1f} ms'.format(rank, shape['total'], shape['count'],
+                                       shape['total'] / shape['count'],
+                                       shape['max']))
+            self.stdout.write(shape['sql'])
+            self.stdout.write('Slowest params: {}'.format(shape['params']))
+            for caller, count in shape['callers'].most_common(3):
+                self.stdout.write('Caller: {} ({})'.format(caller, count))
+            for view, count in shape['views'].most_common(3):
+                self.stdout.write('View: {} ({})'.format(view, count))
+            if shape['explain']:
+                self.stdout.write('Plan:')
+                for line in shape['explain'].splitlines():
+                    self.stdout.write('  ' + line)
@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from team_builder.sqlite import copy_sqlite
+
+
+class Command(BaseCommand):
+    help = (
+        "Stand-in for replication of local SQLite databases: copies the "
+        "default database over the DATABASE_REPLICAS, once or every "
+        "--interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', action='append', default=[],
+                            help='Replica to copy to (repeatable). Defaults '
+                                 'to DATABASE_REPLICAS.')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep copying with this delay, simulating '
+                                 'replication lag.')
+
+    def handle(self, **options):
+        aliases = options['alias'] or getattr(settings, 'DATABASE_REPLICAS',
+                                              [])
+        if not aliases:
+            raise CommandError('No replicas configured, set '
+                               'DATABASE_REPLICAS or pass --alias.')
+        source = connections[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            if alias not in connections.databases:
+                raise CommandError('Unknown database {}.'.format(alias))
+            replica = connections[alias]
+            if source.vendor != 'sqlite' or replica.vendor != 'sqlite':
+                raise CommandError('Only SQLite databases can be copied, use '
+                                   'the replication of the database server.')
+            if replica.settings_dict['NAME'] == source.settings_dict['NAME']:
+                raise CommandError('{} is the default database.'.format(alias))
+
+        while True:
+            for alias in aliases:
+                start = time.perf_counter()
+                path = connections[alias].settings_dict['NAME']
+                # The next query reopens the connection on the new copy.
+                connections[alias].close()
+                copy_sqlite(source, path)
+                self.stdout.write('Copied {} to {} in {:.0f} ms.'.format(
+                    DEFAULT_DB_ALIAS, alias,
+                    (time.perf_counter() - start) * 1000))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-19 05:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def count(apps, schema_editor):
+    """Fill the counters of existing projects and positions."""
+    Project = apps.get_model('projects', 'Project')
+    Position = apps.get_model('projects', 'Position')
+    Application = apps.get_model('projects', 'Application')
+    for position in Position.objects.all():
+        applications = Application.objects.filter(position=position)
+        Position.objects.filter(id=position.id).update(
+            application_count=applications.count(),
+            new_application_count=applications.filter(status='n').count(),
+        )
+    for project in Project.objects.all():
+        open_positions = Position.objects.filter(
+            project=project,
+            user__isnull=True,
+        ).count()
+        Project.objects.filter(id=project.id).update(
+            open_positions=open_positions,
+            active=open_positions > 0,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0005_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='position',
+            name='application_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='position',
+            name='new_application_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='open_positions',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-19 05:32
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='application',
+            index_together=set([('position', 'status')]),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-19 05:34
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_applications(apps, schema_editor):
+    """Keep only the first application of a user for a position."""
+    Position = apps.get_model('projects', 'Position')
+    Application = apps.get_model('projects', 'Application')
+    duplicates = Application.objects.values(
+        'applicant', 'position'
+    ).annotate(
+        first_id=Min('id'),
+        total=Count('id'),
+    ).filter(total__gt=1)
+    for row in duplicates:
+        extra = Application.objects.filter(
+            applicant=row['applicant'],
+            position=row['position'],
+        ).exclude(id=row['first_id'])
+        new = extra.filter(status='n').count()
+        extra.delete()
+        Position.objects.filter(id=row['position']).update(
+            application_count=F('application_count') - (row['total'] - 1),
+            new_application_count=F('new_application_count') - new,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('projects', '0007_application_position_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_applications,
+                             migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='application',
+            unique_together=set([('applicant', 'position')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='position',
+            index_together=set([('project', 'user')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='project',
+            index_together=set([('active', 'id')]),
+        ),
+    ]
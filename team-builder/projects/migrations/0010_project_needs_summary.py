@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-19 06:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def summarize(apps, schema_editor):
+    """Fill the needs summary of existing projects with up to three role
+    names, see Project.needs."""
+    Project = apps.get_model('projects', 'Project')
+    Position = apps.get_model('projects', 'Position')
+    for project in Project.objects.all():
+        names = Position.objects.filter(
+            project=project
+        ).order_by('id').values_list('role__name', flat=True)[:3]
+        Project.objects.filter(id=project.id).update(
+            needs_summary='\n'.join(name or '' for name in names))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0009_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='needs_summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(summarize, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-19 06:26
+from __future__ import unicode_literals
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill(apps, schema_editor):
+    """Create the listings of the active projects, see the rebuild_listings
+    command."""
+    Project = apps.get_model('projects', 'Project')
+    Position = apps.get_model('projects', 'Position')
+    ProjectListing = apps.get_model('projects', 'ProjectListing')
+    listings = []
+    for project in Project.objects.filter(active=True):
+        positions = Position.objects.filter(
+            project=project
+        ).select_related('role').prefetch_related('related_skills')
+        positions = positions.order_by('id')
+        roles = sorted({position.role.name.lower() for position in positions
+                        if position.role})
+        listings.append(ProjectListing(
+            project=project,
+            name=project.name,
+            needs_summary=project.needs_summary,
+            roles=''.join('\n' + role for role in roles) + '\n',
+            skill_ids=json.dumps([
+                sorted(skill.id for skill in position.related_skills.all())
+                for position in positions
+            ]),
+            search_text='{}\n{}'.format(project.name,
+                                        project.description).lower(),
+        ))
+    ProjectListing.objects.bulk_create(listings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0010_project_needs_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectListing',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='projects.Project')),
+                ('name', models.CharField(max_length=255)),
+                ('needs_summary', models.TextField(blank=True, default='')),
+                ('roles', models.TextField(default='\n')),
+                ('skill_ids', models.TextField(default='[]')),
+                ('search_text', models.TextField(default='')),
+                ('refreshed_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(fill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-19 07:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill(apps, schema_editor):
+    """Create the skill rows of the existing listings, see the
+    rebuild_listings command."""
+    Position = apps.get_model('projects', 'Position')
+    ProjectListing = apps.get_model('projects', 'ProjectListing')
+    ProjectListingSkill = apps.get_model('projects', 'ProjectListingSkill')
+    needed_skills = []
+    positions = Position.objects.filter(
+        project__in=ProjectListing.objects.values('project')
+    ).prefetch_related('related_skills').order_by('id')
+    for position in positions:
+        skill_ids = sorted(skill.id for skill in position.related_skills.all())
+        for skill_id in skill_ids or [None]:
+            needed_skills.append(ProjectListingSkill(
+                listing_id=position.project_id,
+                position_id=position.id,
+                skill_id=skill_id,
+                skill_count=len(skill_ids),
+            ))
+    ProjectListingSkill.objects.bulk_create(needed_skills)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0011_projectlisting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectListingSkill',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position_id', models.IntegerField()),
+                ('skill_id', models.IntegerField(blank=True, db_index=True, null=True)),
+                ('skill_count', models.PositiveIntegerField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='position_skills', to='projects.ProjectListing')),
+            ],
+        ),
+        migrations.RunPython(fill, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='projectlisting',
+            name='skill_ids',
+        ),
+    ]
@@ -1,17 +1,54 @@
 import os
 import re
-
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Lower
 from django.db.models.signals import (m2m_changed, post_save, post_delete,
                                       pre_delete, pre_save)
+from django.utils import timezone
+
+
+class SkillQuerySet(models.QuerySet):
+    """Skill queryset."""
+
+    def get_or_create_names(self, names):
+        """Returns a {lowercased name: Skill} dict for the names, creating
+        missing skills. Names are matched case-insensitively. Uses at most
+        three queries."""
+        names = {name.lower(): name for name in reversed(names)}
+        skills = {
+            skill.name.lower(): skill for skill in
+            self.annotate(lower_name=Lower('name')).filter(
+                lower_name__in=names.keys())
+        }
+        missing = [self.model(name=name) for lower_name, name in names.items()
+                   if lower_name not in skills]
+        if missing:
+            self.bulk_create(missing)
+            # Bulk inserts do not return ids on every database.
+            skills.update({
+                skill.name.lower(): skill for skill in
+                self.filter(name__in=[skill.name for skill in missing])
+            })
+        return skills
+
+    def delete_unused(self):
+        """Deletes skills that no user and no position has."""
+        return self.filter(users__isnull=True,
+                           positions__isnull=True).delete()
 
 
 class Skill(models.Model):
     """Skill model class."""
     name = models.CharField(max_length=100, unique=True)
 
+    objects = SkillQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -24,7 +61,96 @@ class Role(models.Model):
         return self.name
 
 
-class Project(models.Model):
+def delta_case(deltas):
+    """Builds a CASE expression that maps object ids to counter deltas."""
+    return Case(
+        *[When(id=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(0),
+        output_field=models.IntegerField()
+    )
+
+
+class CounterFieldsMixin(object):
+    """Counter fields are maintained with F() updates, so a possibly stale
+    in-memory value is never written back when an existing row is saved."""
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get('force_insert') and
+                kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in self.counter_fields and
+                field.attname not in deferred
+            ]
+        super(CounterFieldsMixin, self).save(*args, **kwargs)
+
+
+class ProjectQuerySet(models.QuerySet):
+    """Project queryset."""
+
+    def adjust_open_positions(self, deltas):
+        """Adds {project id: delta} deltas to the open positions counters and
+        updates the active flag of the changed projects."""
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if deltas:
+            self.filter(id__in=deltas.keys()).update(
+                open_positions=F('open_positions') + delta_case(deltas))
+            self.filter(id__in=deltas.keys()).update_active()
+            schedule_listing_refresh(deltas.keys())
+
+    def update_needs_summary(self):
+        """Stores the role names of the first positions of the projects in
+        needs_summary, with one update per distinct summary. updated_at is
+        set as well, as the project pages show the role names."""
+        ids = list(self.values_list('id', flat=True))
+        names = {pk: [] for pk in ids}
+        for project_id, role_name in Position.objects.filter(
+                project__in=ids).order_by('project', 'id').values_list(
+                'project', 'role__name'):
+            # One more name than is shown tells the listing there are more.
+            if len(names[project_id]) <= Project.NEEDS_SHOWN:
+                names[project_id].append(role_name or '')
+        summaries = defaultdict(list)
+        for pk, project_names in names.items():
+            summaries['\n'.join(project_names)].append(pk)
+        now = timezone.now()
+        for summary, pks in summaries.items():
+            self.model.objects.filter(id__in=pks).update(
+                needs_summary=summary, updated_at=now)
+
+    def update_active(self):
+        """Marks projects active if they have open positions and inactive
+        otherwise."""
+        return self.update(active=Case(
+            When(open_positions__gt=0, then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField()
+        ))
+
+
+class PositionQuerySet(models.QuerySet):
+    """Position queryset."""
+
+    def adjust_application_counts(self, total=None, new=None):
+        """Adds {position id: delta} deltas to the application counters."""
+        total = {pk: delta for pk, delta in (total or {}).items() if delta}
+        new = {pk: delta for pk, delta in (new or {}).items() if delta}
+        if not total and not new:
+            return
+        counters = {}
+        if total:
+            counters['application_count'] = (F('application_count') +
+                                             delta_case(total))
+        if new:
+            counters['new_application_count'] = (F('new_application_count') +
+                                                 delta_case(new))
+        self.filter(id__in=set(total) | set(new)).update(**counters)
+
+
+class Project(CounterFieldsMixin, models.Model):
     """Project model class."""
     name = models.CharField(max_length=255)
     description = models.TextField(default='')
@@ -35,12 +161,41 @@ class Project(models.Model):
                               on_delete=models.CASCADE,
                               related_name='projects')
     active = models.BooleanField(default=True)
+    # Number of positions without a user.
+    open_positions = models.IntegerField(default=0)
+    # Last change of the project page, see touch().
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Newline separated role names of the first positions, for listings.
+    # Maintained by summarize_project_needs(), see needs.
+    needs_summary = models.TextField(blank=True, default='')
+
+    objects = ProjectQuerySet.as_manager()
+    # Maintained with queryset updates, so save() leaves them alone.
+    counter_fields = ('open_positions', 'needs_summary')
+    # Number of role names listings show.
+    NEEDS_SHOWN = 2
+
+    class Meta:
+        # Active projects are listed in id order.
+        index_together = [('active', 'id')]
 
     def __str__(self):
         return self.name
 
+    @property
+    def needs(self):
+        """Role names of the first positions."""
+        if not self.needs_summary:
+            return []
+        return self.needs_summary.split('\n')[:self.NEEDS_SHOWN]
+
+    @property
+    def more_needs(self):
+        """Whether the project has more positions than needs lists."""
+        return self.needs_summary.count('\n') >= self.NEEDS_SHOWN
+
 
-class Position(models.Model):
+class Position(CounterFieldsMixin, models.Model):
     """Position model class."""
     role = models.ForeignKey(Role, related_name='positions',
                              on_delete=models.SET_NULL, null=True)
@@ -52,10 +207,31 @@ class Position(models.Model):
                              on_delete=models.SET_NULL, blank=True,
                              null=True, related_name='positions')
     involvement = models.CharField(max_length=100, blank=True, null=True)
+    application_count = models.IntegerField(default=0)
+    new_application_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PositionQuerySet.as_manager()
+    counter_fields = ('application_count', 'new_application_count')
+
+    class Meta:
+        # Open positions of a project.
+        index_together = [('project', 'user')]
 
     def __str__(self):
         return self.role.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Position, cls).from_db(db, field_names, values)
+        # Remember the stored user to keep Project.open_positions in step
+        # and to update the former user's profile.
+        instance._loaded_user_id = instance.__dict__.get('user_id')
+        instance._touched_user_id = instance._loaded_user_id
+        # Remember the stored role to keep Project.needs_summary in step.
+        instance._loaded_role_id = instance.__dict__.get('role_id')
+        return instance
+
 
 class UserProfile(models.Model):
     """User profile model class."""
@@ -68,6 +244,8 @@ class UserProfile(models.Model):
                                default='')
     skills = models.ManyToManyField(Skill, through='UserProfileSkill',
                                     related_name='users')
+    # Last change of the profile page, see touch().
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         if self.full_name:
@@ -99,25 +277,401 @@ class Application(models.Model):
         )
     )
 
+    class Meta:
+        # A user can apply for a position only once.
+        unique_together = [('applicant', 'position')]
+        index_together = [('position', 'status')]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Application, cls).from_db(db, field_names, values)
+        # Remember the stored status to keep Position counters in step.
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+
+class ProjectListingQuerySet(models.QuerySet):
+    """ProjectListing queryset."""
+
+    def build(self, project_ids):
+        """Returns unsaved listings of the active projects among project_ids,
+        with three queries. The unsaved ProjectListingSkill rows of a listing
+        are in its needed_skills list."""
+        listings = {
+            pk: self.model(project_id=pk, name=name,
+                           needs_summary=needs_summary,
+                           search_text='{}\n{}'.format(name,
+                                                       description).lower())
+            for pk, name, description, needs_summary in
+            Project.objects.filter(id__in=project_ids, active=True)
+            .values_list('id', 'name', 'description', 'needs_summary')
+        }
+        roles, skills = defaultdict(set), defaultdict(dict)
+        for pk, project_id, role_name in Position.objects.filter(
+                project__in=listings.keys()).order_by('id').values_list(
+                'id', 'project', 'role__name'):
+            if role_name:
+                roles[project_id].add(role_name.lower())
+            skills[project_id][pk] = []
+        for position_id, project_id, skill_id in (
+                Position.related_skills.through.objects.filter(
+                    position__project__in=listings.keys()
+                ).order_by('skill').values_list('position',
+                                                'position__project',
+                                                'skill')):
+            skills[project_id][position_id].append(skill_id)
+        for pk, listing in listings.items():
+            listing.roles = ''.join('\n' + role
+                                    for role in sorted(roles[pk])) + '\n'
+            listing.needed_skills = [
+                ProjectListingSkill(listing_id=pk, position_id=position_id,
+                                    skill_id=skill_id,
+                                    skill_count=len(skill_ids))
+                for position_id, skill_ids in sorted(skills[pk].items())
+                # A position without skills gets one row without a skill.
+                for skill_id in skill_ids or [None]
+            ]
+        return [listings[pk] for pk in sorted(listings)]
+
+    def refresh(self, project_ids):
+        """Rebuilds the listings of the projects, deleting those of inactive
+        and deleted projects. The projects are locked first, so concurrent
+        refreshes of a project run one after the other instead of inserting
+        the same listing twice."""
+        project_ids = sorted(set(project_ids) - {None})
+        if not project_ids:
+            return
+        with transaction.atomic():
+            list(Project.objects.select_for_update().filter(
+                id__in=project_ids).order_by('id').values_list('id'))
+            self.filter(project__in=project_ids).delete()
+            listings = self.build(project_ids)
+            self.bulk_create(listings)
+            ProjectListingSkill.objects.bulk_create([
+                needed_skill for listing in listings
+                for needed_skill in listing.needed_skills
+            ])
+
+    def for_skills(self, skill_ids):
+        """Returns the listings with a position that needs no skill outside
+        skill_ids, an iterable or a values queryset of skill ids."""
+        matched = ProjectListingSkill.objects.filter(
+            models.Q(skill_id__isnull=True) | models.Q(skill_id__in=skill_ids)
+        ).values('listing', 'position_id', 'skill_count').annotate(
+            matched=models.Count('skill_id')
+        ).filter(matched=F('skill_count')).values('listing')
+        return self.filter(project__in=matched)
+
+
+class ProjectListing(models.Model):
+    """Read model of an active project for IndexView and ForMeView. Rows
+    are refreshed from Project, Position, Role and Skill after every
+    transaction that changes them, see schedule_listing_refresh()."""
+    project = models.OneToOneField(Project, on_delete=models.CASCADE,
+                                   primary_key=True, related_name='listing')
+    name = models.CharField(max_length=255)
+    needs_summary = models.TextField(blank=True, default='')
+    # Lowercased role names, each followed by a newline and the first one
+    # preceded by one, so a role matches '\n' + name + '\n'.
+    roles = models.TextField(default='\n')
+    # Lowercased name and description.
+    search_text = models.TextField(default='')
+    refreshed_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ProjectListingQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+    def as_project(self):
+        """Returns the project with only the listed fields loaded."""
+        return Project.from_db(self._state.db,
+                               ['id', 'name', 'needs_summary'],
+                               [self.project_id, self.name,
+                                self.needs_summary])
+
+
+class ProjectListingSkill(models.Model):
+    """Skill that a position of a listed project needs, with the number of
+    skills the position needs. A position without skills has one row
+    without a skill. Positions whose rows for a user's skills add up to
+    skill_count fit the user, see ProjectListingQuerySet.for_skills()."""
+    listing = models.ForeignKey(ProjectListing, on_delete=models.CASCADE,
+                                related_name='position_skills')
+    position_id = models.IntegerField()
+    skill_id = models.IntegerField(blank=True, null=True, db_index=True)
+    skill_count = models.PositiveIntegerField()
+
+    def __str__(self):
+        return '{} {}'.format(self.position_id, self.skill_id)
+
+
+class OutboundEmail(models.Model):
+    """Email message waiting to be delivered by the send_queued_emails
+    command."""
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, default='')
+    to = models.TextField()
+    dedupe_key = models.CharField(max_length=255, blank=True, default='',
+                                  db_index=True)
+    status = models.CharField(
+        max_length=1,
+        default='p',
+        choices=(
+            ('p', 'pending'),
+            ('s', 'sent'),
+            ('f', 'failed'),
+        )
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        index_together = [('status', 'next_attempt_at')]
+
+    def __str__(self):
+        return '{} ({})'.format(self.subject, self.to)
+
+    @property
+    def recipients(self):
+        """Returns a list of recipient addresses."""
+        return [address for address in self.to.split(',') if address]
+
 
 def create_profile(sender, **kwargs):
     """Create UserProfile instance whenever User is created."""
     user = kwargs["instance"]
     if kwargs["created"]:
-        user_profile = UserProfile(user=user)
+        # Sign up sets the full name on the user, so the profile is complete
+        # with one INSERT.
+        user_profile = UserProfile(user=user,
+                                   full_name=getattr(user, 'full_name', ''))
         user_profile.save()
 
 post_save.connect(create_profile, sender=settings.AUTH_USER_MODEL)
 
 
+def count_open_positions(sender, instance, **kwargs):
+    """Keeps Project.open_positions up to date when a Position is saved or
+    deleted."""
+    is_open = instance.user_id is None
+    if kwargs['signal'] is post_delete:
+        delta = -int(is_open)
+    elif kwargs['created']:
+        delta = int(is_open)
+    else:
+        loaded_user_id = getattr(instance, '_loaded_user_id', instance.user_id)
+        delta = int(is_open) - int(loaded_user_id is None)
+    instance._loaded_user_id = instance.user_id
+    Project.objects.adjust_open_positions({instance.project_id: delta})
+
+post_save.connect(count_open_positions, sender=Position)
+post_delete.connect(count_open_positions, sender=Position)
+
+
+def summarize_project_needs(sender, instance, **kwargs):
+    """Keeps Project.needs_summary up to date when a Position is added,
+    deleted or gets another role."""
+    loaded_role_id = getattr(instance, '_loaded_role_id', instance.role_id)
+    instance._loaded_role_id = instance.role_id
+    if (kwargs['signal'] is post_save and not kwargs['created'] and
+            loaded_role_id == instance.role_id):
+        return
+    Project.objects.filter(id=instance.project_id).update_needs_summary()
+
+post_save.connect(summarize_project_needs, sender=Position)
+post_delete.connect(summarize_project_needs, sender=Position)
+
+
+def summarize_role_needs(sender, instance, created, **kwargs):
+    """Updates Project.needs_summary of the projects with positions of a
+    renamed Role."""
+    if not created:
+        Project.objects.filter(
+            positions__role=instance
+        ).distinct().update_needs_summary()
+
+post_save.connect(summarize_role_needs, sender=Role)
+
+
+def count_applications(sender, instance, **kwargs):
+    """Keeps Position application counters up to date when an Application is
+    saved or deleted."""
+    is_new = instance.status == 'n'
+    if kwargs['signal'] is post_delete:
+        total, new = -1, -int(is_new)
+    elif kwargs['created']:
+        total, new = 1, int(is_new)
+    else:
+        loaded_status = getattr(instance, '_loaded_status', instance.status)
+        total, new = 0, int(is_new) - int(loaded_status == 'n')
+    instance._loaded_status = instance.status
+    Position.objects.adjust_application_counts(
+        total={instance.position_id: total},
+        new={instance.position_id: new},
+    )
+
+post_save.connect(count_applications, sender=Application)
+post_delete.connect(count_applications, sender=Application)
+
+
+def touch(project_ids=(), position_ids=(), user_ids=()):
+    """Sets updated_at of projects, positions and the profiles of users to
+    now, for changes that do not save them: queryset updates and changes of
+    related rows shown on their pages."""
+    now = timezone.now()
+    project_ids = set(project_ids) - {None}
+    position_ids = set(position_ids) - {None}
+    user_ids = set(user_ids) - {None}
+    if project_ids:
+        Project.objects.filter(id__in=project_ids).update(updated_at=now)
+    if position_ids:
+        Position.objects.filter(id__in=position_ids).update(updated_at=now)
+    if user_ids:
+        UserProfile.objects.filter(user__in=user_ids).update(updated_at=now)
+
+
+def touch_position_pages(sender, instance, **kwargs):
+    """Marks the project page and the profile pages of the former and new
+    position user changed when a Position is saved or deleted."""
+    user_ids = {instance.user_id}
+    if kwargs['signal'] is post_save and not kwargs['created']:
+        user_ids.add(getattr(instance, '_touched_user_id', instance.user_id))
+    instance._touched_user_id = instance.user_id
+    touch(project_ids=[instance.project_id], user_ids=user_ids)
+
+post_save.connect(touch_position_pages, sender=Position)
+post_delete.connect(touch_position_pages, sender=Position)
+
+
+def touch_position_skills(sender, instance, **kwargs):
+    """Marks the position and its project changed when its skills change."""
+    if kwargs['action'] in ('post_add', 'post_remove', 'post_clear'):
+        touch(project_ids=[instance.project_id], position_ids=[instance.id])
+
+m2m_changed.connect(touch_position_skills,
+                    sender=Position.related_skills.through)
+
+
+def touch_application_project(sender, instance, **kwargs):
+    """Marks the project page changed when an Application is saved or
+    deleted, as it shows which positions the viewer applied for."""
+    Project.objects.filter(positions=instance.position_id).update(
+        updated_at=timezone.now())
+
+post_save.connect(touch_application_project, sender=Application)
+post_delete.connect(touch_application_project, sender=Application)
+
+
+def touch_owner_pages(sender, instance, **kwargs):
+    """Marks the owner's projects changed when a profile is saved, as they
+    show the owner's name, and the owner's profile when a project is
+    deleted."""
+    if sender is UserProfile:
+        if not kwargs['created']:
+            Project.objects.filter(owner=instance.user_id).update(
+                updated_at=timezone.now())
+    else:
+        touch(user_ids=[instance.owner_id])
+
+post_save.connect(touch_owner_pages, sender=UserProfile)
+post_delete.connect(touch_owner_pages, sender=Project)
+
+
+_pending_listings = threading.local()
+
+
+def schedule_listing_refresh(project_ids):
+    """Refreshes the listings of the projects once the current transaction
+    commits. Every transaction refreshes its projects with one
+    flush_listings() call."""
+    project_ids = set(project_ids) - {None}
+    if not project_ids:
+        return
+    if getattr(_pending_listings, 'ids', None) is None:
+        _pending_listings.ids = set()
+    _pending_listings.ids.update(project_ids)
+    # Later callbacks of the same transaction find nothing left to do.
+    # Ids of rolled back transactions are refreshed with the next one.
+    transaction.on_commit(flush_listings)
+
+
+def flush_listings():
+    """Refreshes the listings of the projects scheduled so far."""
+    project_ids = getattr(_pending_listings, 'ids', None)
+    _pending_listings.ids = None
+    if project_ids:
+        ProjectListing.objects.refresh(project_ids)
+
+
+def refresh_project_listing(sender, instance, **kwargs):
+    """Schedules a listing refresh when a Project or Position is saved or
+    deleted, or when the skills of a Position change."""
+    if sender is Project:
+        schedule_listing_refresh([instance.id])
+    elif sender is Position:
+        schedule_listing_refresh([instance.project_id])
+    elif kwargs['action'] in ('post_add', 'post_remove', 'post_clear'):
+        schedule_listing_refresh([instance.project_id])
+
+post_save.connect(refresh_project_listing, sender=Project)
+post_delete.connect(refresh_project_listing, sender=Project)
+post_save.connect(refresh_project_listing, sender=Position)
+post_delete.connect(refresh_project_listing, sender=Position)
+m2m_changed.connect(refresh_project_listing,
+                    sender=Position.related_skills.through)
+
+
+def refresh_role_listings(sender, instance, created, **kwargs):
+    """Schedules a listing refresh of the projects with positions of a
+    renamed Role."""
+    if not created:
+        schedule_listing_refresh(Project.objects.filter(
+            positions__role=instance
+        ).values_list('id', flat=True).distinct())
+
+post_save.connect(refresh_role_listings, sender=Role)
+
+
+_released_skills = threading.local()
+
+
+@contextmanager
+def defer_skill_cleanup():
+    """Collects the skills released inside the block and deletes the unused
+    ones with one query when the block ends."""
+    if getattr(_released_skills, 'ids', None) is not None:
+        # Already deferred by an outer block.
+        yield
+        return
+    _released_skills.ids = set()
+    try:
+        yield
+        ids = _released_skills.ids
+    finally:
+        _released_skills.ids = None
+    release_skills(ids)
+
+
+def release_skills(skill_ids):
+    """Deletes the skills that are no longer used by any UserProfile and
+    Position, or collects them inside defer_skill_cleanup()."""
+    skill_ids = set(skill_ids) - {None}
+    if getattr(_released_skills, 'ids', None) is not None:
+        _released_skills.ids.update(skill_ids)
+    elif skill_ids:
+        Skill.objects.filter(id__in=skill_ids).delete_unused()
+
+
 def cascade_delete_skill(sender, instance, **kwargs):
     """Delete Skill instances that are not connected to any UserProfile and
     Position."""
     if kwargs['action'] == 'post_remove':
-        for pk in kwargs['pk_set']:
-            skill = Skill.objects.get(pk=pk)
-            if skill.users.count() == 0 and skill.positions.count() == 0:
-                skill.delete()
+        release_skills(kwargs['pk_set'])
 
 m2m_changed.connect(cascade_delete_skill,
                     sender=Position.related_skills.through)
@@ -127,9 +681,7 @@ def cascade_delete_userprofileskill(sender, instance, **kwargs):
     """Delete Skill instances that are not connected to any UserProfile and
     Position.
     """
-    skill = Skill.objects.get(id=instance.skill_id)
-    if skill.users.count() == 0 and skill.positions.count() == 0:
-        skill.delete()
+    release_skills([instance.skill_id])
 
 post_delete.connect(cascade_delete_userprofileskill,
                     sender=UserProfileSkill)
@@ -0,0 +1,168 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db import transaction
+
+from pusher import Pusher
+
+
+logger = logging.getLogger(__name__)
+
+# Pusher accepts at most 10 events per batch call.
+MAX_BATCH_SIZE = 10
+
+
+class PushDispatcher(object):
+    """Delivers push notifications from a background thread.
+
+    Events are queued after the current transaction commits, coalesced into
+    batch trigger calls and sent with a single long-lived Pusher client, so
+    the request never waits for the Pusher API.
+    """
+
+    def __init__(self, batch_size=MAX_BATCH_SIZE, linger=0.05):
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        # Seconds to wait for more events before sending a batch.
+        self.linger = linger
+        self.queue = queue.Queue()
+        self.metrics = {'queued': 0, 'sent': 0, 'failed': 0, 'batches': 0}
+        self._client = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        """Returns the Pusher client, creating it on first use."""
+        if self._client is None:
+            self._client = Pusher(
+                app_id=settings.PUSHER_APP_ID,
+                key=settings.PUSHER_KEY,
+                secret=settings.PUSHER_SECRET,
+                host=settings.PUSHER_HOST,
+                port=getattr(settings, 'PUSHER_PORT', None),
+                ssl=getattr(settings, 'PUSHER_SSL', True),
+            )
+        return self._client
+
+    def reset_client(self):
+        """Drops the client so it is rebuilt from the current settings."""
+        self._client = None
+
+    def push(self, channel, event, data):
+        """Queues an event once the current transaction has committed."""
+        transaction.on_commit(lambda: self.enqueue(channel, event, data))
+
+    def enqueue(self, channel, event, data):
+        """Queues an event for the background thread."""
+        self._start()
+        with self._lock:
+            self.metrics['queued'] += 1
+        self.queue.put({'channel': channel, 'name': event, 'data': data})
+
+    def flush(self):
+        """Blocks until every queued event has been processed."""
+        self.queue.join()
+
+    def get_metrics(self):
+        """Returns a copy of the delivery counters."""
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics['pending'] = self.queue.qsize()
+        return metrics
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name='push-dispatcher',
+                                                daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get(timeout=self.linger))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.get_client().trigger_batch(batch)
+            except Exception:
+                logger.exception('Failed to send %d push notifications.',
+                                 len(batch))
+                with self._lock:
+                    self.metrics['failed'] += len(batch)
+            else:
+                with self._lock:
+                    self.metrics['sent'] += len(batch)
+                    self.metrics['batches'] += 1
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+
+dispatcher = PushDispatcher()
+
+
+@atexit.register
+def _flush_on_exit():
+    # Give the background thread a chance to send pending events.
+    if dispatcher.queue.unfinished_tasks and dispatcher._thread:
+        dispatcher._thread.join(timeout=2)
+
+
+class StubPusherServer(object):
+    """Local HTTP server implementing the Pusher REST endpoints used by the
+    dispatcher. Received events are kept in ``events``.
+
+    Point PUSHER_HOST/PUSHER_PORT at it and set PUSHER_SSL = False.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        stub = self
+        self.events = []
+        self.requests = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length).decode('utf-8'))
+                stub.requests += 1
+                if urlparse(self.path).path.endswith('/batch_events'):
+                    stub.events.extend(body['batch'])
+                else:
+                    for channel in body['channels']:
+                        stub.events.append({'channel': channel,
+                                            'name': body['name'],
+                                            'data': body['data']})
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        self.host, self.port = self.server.server_address
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
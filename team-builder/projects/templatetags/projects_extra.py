@@ -21,6 +21,12 @@ def qs_to_string(qs):
         return value
 
 
+@register.filter('count')
+def count(counts, key):
+    """Returns the number of applications counted for a filter value."""
+    return counts.get(key, 0)
+
+
 @register.filter('markdownify')
 def markdownify(content):
     """Render Markdown formatted text."""
@@ -55,13 +61,3 @@ def avatarpath(userprofile):
         return settings.MEDIA_URL + 'uploads/no_image.png'
     else:
         return userprofile.avatar.url
-
-
-@register.simple_tag
-def disablebutton(user, position):
-    """Disables a button if a user has already applied for a position."""
-    applications = position.applications.all()
-    filtered_applications = [app for app in applications if
-                             app.applicant == user]
-    if filtered_applications:
-        return 'disabled="disabled"'
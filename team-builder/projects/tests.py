@@ -1,10 +1,40 @@
+import datetime
+import json
+import os
+import pstats
+import re
+import shutil
+import tempfile
+import traceback
+from collections import Counter
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command, CommandError
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 
+from team_builder import (
+    db, identity, routers, slow_queries, sqlite, user_cache,
+)
+
+from . import bench
 from . import forms
+from . import mail as projects_mail
 from . import models
+from . import notifications
+from . import views
 
 
 class ModelTests(TestCase):
@@ -543,6 +573,19 @@ class ProjectDetailViewTests(TestCase):
         self.assertTemplateUsed(response, 'projects/project.html')
         self.assertContains(response, self.project1.name)
 
+    def test_project_detail_views_applied_position(self):
+        models.Application.objects.create(applicant=self.user2,
+                                          position=self.position1)
+        self.client.force_login(self.user2)
+        url = reverse('projects:project-detail',
+                      kwargs={'pk': self.project1.id})
+        response = self.client.get(url)
+        self.assertContains(response, 'disabled="disabled"', count=1)
+
+        self.client.force_login(self.user1)
+        response = self.client.get(url)
+        self.assertNotContains(response, 'disabled="disabled"')
+
     def test_project_detail_views_unauthenticated(self):
         url =reverse(
             'projects:project-detail',
@@ -1113,6 +1156,8 @@ class IndexViewTests(TestCase):
         )
         self.position2.related_skills = [self.skill1, self.skill2]
         self.position2.save()
+        # TestCase never commits, so listings are refreshed directly.
+        models.flush_listings()
 
     def test_index_view_unauthenticated(self):
         response = self.client.get(reverse('projects:home'))
@@ -1196,6 +1241,7 @@ class ForMeViewTests(TestCase):
         )
         self.position3.related_skills = [self.skill5]
         self.position3.save()
+        models.flush_listings()
 
     def test_for_me_view_unauthenticated(self):
         url = reverse('projects:projects-for-me')
@@ -1230,6 +1276,72 @@ class ForMeViewTests(TestCase):
         self.assertIn(self.project2, response.context['projects'])
         self.assertContains(response, self.project2.name)
 
+    def test_filter_by_position_matches_whole_role(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:projects-for-me') + '?position=role'
+        response = self.client.get(url)
+        self.assertEqual(response.context['projects'], [])
+
+    def test_listings_for_skills(self):
+        def for_skills(*skills):
+            return set(models.ProjectListing.objects.for_skills(
+                [skill.id for skill in skills]
+            ).values_list('project', flat=True))
+
+        self.assertEqual(for_skills(), set())
+        self.assertEqual(for_skills(self.skill1), set())
+        self.assertEqual(for_skills(self.skill1, self.skill2),
+                         {self.project2.id})
+        self.assertEqual(for_skills(self.skill5), {self.project2.id})
+        self.assertEqual(for_skills(self.skill1, self.skill2, self.skill4),
+                         {self.project1.id, self.project2.id})
+        # A position without skills fits everyone.
+        models.Position.objects.create(role=self.role3, project=self.project1)
+        models.flush_listings()
+        self.assertEqual(for_skills(), {self.project1.id})
+
+
+class ProjectUpdateTransactionTests(TransactionTestCase):
+    """Saving a project with its positions, committed."""
+
+    def setUp(self):
+        ModelTests.setUp(self)
+        self.client.force_login(self.user1)
+        self.url = reverse('projects:project-update',
+                           kwargs={'pk': self.project1.id})
+        self.post_data = {
+            'name': 'New Project Name1',
+            'description': 'New Project Description1',
+            'timeline': 'New Project Timeline',
+            'requirements': 'New Project Requirements',
+            'positions-TOTAL_FORMS': '2',
+            'positions-INITIAL_FORMS': '1',
+            'positions-0-id': str(self.position1.id),
+            'positions-0-role_name': self.role1.name,
+            'positions-0-description': 'role1 description',
+            'positions-1-id': '',
+            'positions-1-role_name': self.role2.name,
+            'positions-1-description': 'role2 description',
+        }
+
+    def test_listing_is_refreshed_once(self):
+        with mock.patch.object(models.ProjectListingQuerySet, 'refresh',
+                               autospec=True) as refresh:
+            response = self.client.post(self.url, self.post_data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(set(refresh.call_args[0][1]), {self.project1.id})
+
+    def test_failure_saves_nothing(self):
+        with mock.patch.object(models.Position, 'save',
+                               side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(self.url, self.post_data)
+        self.assertEqual(models.Project.objects.get(id=self.project1.id).name,
+                         self.project1.name)
+        self.assertEqual(
+            models.Position.objects.filter(project=self.project1).count(), 1)
+
 
 class ProjectDeleteViewTests(TestCase):
     def setUp(self):
@@ -1460,6 +1572,44 @@ class ApplicationListViewTests(TestCase):
         self.assertEqual(response.context['applications'].count(), 1)
         self.assertIn(self.application11, response.context['applications'])
 
+    def test_application_list_view_filter_counts(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications') + '?status=accepted'
+        response = self.client.get(url)
+        self.assertEqual(response.context['new_applications'], 5)
+        self.assertEqual(response.context['projects'],
+                         ['all projects', 'project1', 'project2'])
+        status_counts = response.context['status_counts']
+        self.assertEqual(status_counts['all applications'], 7)
+        self.assertEqual(status_counts['new applications'], 5)
+        self.assertEqual(status_counts['accepted'], 2)
+        # Project counts are narrowed by the selected status.
+        project_counts = response.context['project_counts']
+        self.assertEqual(project_counts['all projects'], 2)
+        self.assertEqual(project_counts['project1'], 1)
+        self.assertEqual(project_counts['project2'], 1)
+        self.assertContains(response, 'Accepted (2)')
+
+    def test_application_list_view_new_applications_from_counters(self):
+        models.Position.objects.filter(id=self.position11.id).update(
+            new_application_count=10)
+        self.client.force_login(self.user1)
+        response = self.client.get(reverse('projects:applications'))
+        self.assertEqual(response.context['new_applications'],
+                         models.Position.objects.filter(
+                             project__owner=self.user1
+                         ).aggregate(n=Sum('new_application_count'))['n'])
+        self.assertContains(response, '{} new</span>'.format(
+            response.context['new_applications']))
+
+    def test_application_list_view_query_count(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications')
+        # Session, user with the profile for the navigation, counts,
+        # applications count and applications page.
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
 
 class ApplicationsUpdateViewTests(TestCase):
     def setUp(self):
@@ -1517,3 +1667,1563 @@ class ApplicationsUpdateViewTests(TestCase):
         )
         project = self.application12.position.project
         self.assertTrue(project.active)
+
+
+class OutboundEmailTests(TestCase):
+    def setUp(self):
+        ApplicationListViewTests.setUp(self)
+
+    def test_application_create_queues_email(self):
+        self.client.force_login(self.user2)
+        url = reverse('projects:applications-create',
+                      kwargs={'pk': self.project1.pk})
+        self.client.post(url, {'position': self.position11.id})
+        self.assertEqual(len(mail.outbox), 0)
+        email = models.OutboundEmail.objects.get()
+        self.assertEqual(email.recipients, [self.user1.email])
+        self.assertEqual(email.status, 'p')
+
+    def test_accept_queues_email_for_every_applicant(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications-update',
+                      kwargs={'status': 'accept'})
+        self.client.post(url, {'id': self.application12.id})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(models.OutboundEmail.objects.count(), 3)
+
+    def test_queue_email_dedupe(self):
+        queue = projects_mail.queue_email
+        self.assertIsNotNone(queue('Subject', 'Body', ['a@example.com'],
+                                   dedupe_key='key'))
+        self.assertIsNone(queue('Subject', 'Body', ['a@example.com'],
+                                dedupe_key='key'))
+        self.assertEqual(models.OutboundEmail.objects.count(), 1)
+
+    def test_send_queued_emails(self):
+        for i in range(3):
+            projects_mail.queue_email('Subject', 'Body {}'.format(i),
+                                      ['a@example.com'])
+        projects_mail.queue_email('Subject', 'Body 0', ['a@example.com'])
+        call_command('send_queued_emails', backend='locmem',
+                     stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(
+            models.OutboundEmail.objects.exclude(status='s').exists())
+
+    def test_send_queued_emails_retry(self):
+        projects_mail.queue_email('Subject', 'Body', ['a@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.'
+                        'send_messages', side_effect=OSError('down')):
+            stats = projects_mail.send_queued_emails(backend='locmem',
+                                                     max_attempts=2)
+        self.assertEqual(stats['retried'], 1)
+        email = models.OutboundEmail.objects.get()
+        self.assertEqual(email.status, 'p')
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        # The email is not due yet.
+        stats = projects_mail.send_queued_emails(backend='locmem')
+        self.assertEqual(stats['sent'], 0)
+
+        models.OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.'
+                        'send_messages', side_effect=OSError('down')):
+            stats = projects_mail.send_queued_emails(backend='locmem',
+                                                     max_attempts=2)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(models.OutboundEmail.objects.get().status, 'f')
+
+    def test_send_queued_emails_partial_failure(self):
+        for i in range(3):
+            projects_mail.queue_email('Subject', 'Body {}'.format(i),
+                                      ['a@example.com'])
+        sent = []
+
+        def send_messages(messages):
+            if messages[0].body == 'Body 1':
+                raise OSError('rejected')
+            sent.extend(messages)
+            return len(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.'
+                        'send_messages', side_effect=send_messages):
+            stats = projects_mail.send_queued_emails(backend='locmem')
+        self.assertEqual((stats['sent'], stats['retried']), (2, 1))
+        self.assertEqual([message.body for message in sent],
+                         ['Body 0', 'Body 2'])
+        self.assertEqual(
+            dict(models.OutboundEmail.objects.values_list('body', 'status')),
+            {'Body 0': 's', 'Body 1': 'p', 'Body 2': 's'})
+
+    def test_claimed_emails_are_skipped(self):
+        projects_mail.queue_email('Subject', 'Body', ['a@example.com'])
+        emails, duplicates = projects_mail.claim_emails(10)
+        self.assertEqual(len(emails), 1)
+        self.assertEqual(projects_mail.claim_emails(10), ([], 0))
+
+
+class PushDispatcherTests(TestCase):
+    def setUp(self):
+        self.stub = notifications.StubPusherServer().start()
+        self.settings = override_settings(
+            PUSHER_APP_ID='1',
+            PUSHER_KEY='key',
+            PUSHER_SECRET='secret',
+            PUSHER_HOST=self.stub.host,
+            PUSHER_PORT=self.stub.port,
+            PUSHER_SSL=False,
+        )
+        self.settings.enable()
+        self.dispatcher = notifications.PushDispatcher(linger=0.2)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.stub.stop()
+
+    def test_events_are_batched(self):
+        for i in range(12):
+            self.dispatcher.enqueue('team-builder-1', 'new_notification',
+                                    {'title': 'Title', 'message': str(i)})
+        self.dispatcher.flush()
+        self.assertEqual(len(self.stub.events), 12)
+        self.assertLess(self.stub.requests, 12)
+        metrics = self.dispatcher.get_metrics()
+        self.assertEqual(metrics['queued'], 12)
+        self.assertEqual(metrics['sent'], 12)
+        self.assertEqual(metrics['failed'], 0)
+        self.assertEqual(metrics['pending'], 0)
+
+    def test_push_waits_for_commit(self):
+        # TestCase never commits, so the event must not be queued.
+        self.dispatcher.push('team-builder-1', 'new_notification', {})
+        self.assertEqual(self.dispatcher.get_metrics()['queued'], 0)
+
+    def test_failed_delivery(self):
+        self.stub.stop()
+        self.dispatcher.enqueue('team-builder-1', 'new_notification', {})
+        self.dispatcher.flush()
+        self.assertEqual(self.dispatcher.get_metrics()['failed'], 1)
+
+
+class ApplicationsBulkUpdateViewTests(TestCase):
+    def setUp(self):
+        ApplicationListViewTests.setUp(self)
+
+    def test_bulk_accept(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications-bulk-update',
+                      kwargs={'status': 'accept'})
+        response = self.client.post(
+            url,
+            {'ids': [self.application12.id, self.application311.id]},
+            follow=True
+        )
+        self.assertRedirects(response, reverse('projects:applications'))
+        statuses = dict(models.Application.objects.values_list('id',
+                                                               'status'))
+        self.assertEqual(statuses[self.application12.id], 'a')
+        self.assertEqual(statuses[self.application311.id], 'a')
+        self.assertEqual(statuses[self.application22.id], 'r')
+        self.assertEqual(statuses[self.application32.id], 'r')
+        # Applications to other positions are untouched.
+        self.assertEqual(statuses[self.application21.id], 'n')
+        self.assertEqual(models.Position.objects.get(
+            id=self.position2.id).user, self.user1)
+        self.assertEqual(models.Position.objects.get(
+            id=self.position11.id).user, self.user3)
+        self.assertEqual(models.OutboundEmail.objects.count(), 4)
+
+    def test_bulk_reject(self):
+        models.Position.objects.filter(id=self.position1.id).update(
+            user=self.user1)
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications-bulk-update',
+                      kwargs={'status': 'reject'})
+        self.client.post(
+            url,
+            {'ids': [self.application11.id, self.application21.id,
+                     self.application13.id]}
+        )
+        statuses = dict(models.Application.objects.values_list('id',
+                                                               'status'))
+        self.assertEqual(statuses[self.application11.id], 'r')
+        self.assertEqual(statuses[self.application21.id], 'r')
+        # Not an application to one of user1's projects.
+        self.assertEqual(statuses[self.application13.id], 'n')
+        self.assertIsNone(models.Position.objects.get(
+            id=self.position1.id).user)
+
+    def test_bulk_accept_earliest_application(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications-bulk-update',
+                      kwargs={'status': 'accept'})
+        response = self.client.post(
+            url, {'ids': [self.application31.id, self.application21.id]},
+            follow=True)
+        self.assertEqual(models.Position.objects.get(
+            id=self.position1.id).user, self.user2)
+        self.assertEqual(
+            models.Application.objects.get(id=self.application31.id).status,
+            'r')
+        self.assertContains(
+            response, '1 application(s) have been accepted. 2 other '
+                      'application(s) for the same positions have been '
+                      'rejected.')
+
+    def test_bulk_reject_counts_changed_applications(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications-bulk-update',
+                      kwargs={'status': 'reject'})
+        response = self.client.post(
+            url, {'ids': [self.application21.id, self.application31.id]},
+            follow=True)
+        self.assertContains(response,
+                            '2 application(s) have been rejected.')
+        response = self.client.post(
+            url, {'ids': [self.application21.id]}, follow=True)
+        self.assertContains(
+            response, 'The selected applications have been rejected already.')
+        self.assertEqual(models.Position.objects.get(
+            id=self.position1.id).new_application_count, 0)
+
+    def test_concurrent_accepts_keep_counters(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications-bulk-update',
+                      kwargs={'status': 'accept'})
+        other_client = self.client_class()
+        other_client.force_login(self.user1)
+        lock = views.ApplicationsUpdateView.lock
+        requests = []
+
+        def lock_after_other_request(view, applications):
+            # Another request accepts the same application first.
+            requests.append(view)
+            if len(requests) == 1:
+                other_client.post(url, {'ids': [self.application21.id]})
+            return lock(view, applications)
+
+        with mock.patch.object(views.ApplicationsUpdateView, 'lock',
+                               lock_after_other_request):
+            self.client.post(url, {'ids': [self.application21.id]})
+
+        position = models.Position.objects.get(id=self.position1.id)
+        self.assertEqual(position.new_application_count,
+                         position.applications.filter(status='n').count())
+        project = models.Project.objects.get(id=self.project1.id)
+        self.assertEqual(project.open_positions,
+                         project.positions.filter(user=None).count())
+
+    def test_bulk_accept_fixed_number_of_queries(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications-bulk-update',
+                      kwargs={'status': 'accept'})
+        # Includes locking the positions and reading the applications again.
+        with self.assertNumQueries(19):
+            self.client.post(url, {'ids': [self.application12.id]})
+
+        for i in range(10):
+            applicant = get_user_model().objects.create_user(
+                email='applicant{}@example.com'.format(i))
+            models.Application.objects.create(applicant=applicant,
+                                              position=self.position1)
+        with self.assertNumQueries(19):
+            self.client.post(url, {'ids': [self.application21.id,
+                                           self.application311.id]})
+
+    def test_project_deactivated_when_all_positions_filled(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications-bulk-update',
+                      kwargs={'status': 'accept'})
+        self.client.post(url, {'ids': [self.application11.id,
+                                       self.application311.id]})
+        self.assertFalse(
+            models.Project.objects.get(id=self.project1.id).active)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        ApplicationListViewTests.setUp(self)
+
+    def refresh(self, obj):
+        return obj.__class__.objects.get(id=obj.id)
+
+    def test_counters_after_creation(self):
+        self.assertEqual(self.refresh(self.project1).open_positions, 2)
+        self.assertEqual(self.refresh(self.project2).open_positions, 2)
+        position1 = self.refresh(self.position1)
+        self.assertEqual(position1.application_count, 3)
+        self.assertEqual(position1.new_application_count, 2)
+
+    def test_counters_after_accept_and_reject(self):
+        self.client.force_login(self.user1)
+        self.client.post(
+            reverse('projects:applications-update',
+                    kwargs={'status': 'accept'}),
+            {'id': self.application21.id}
+        )
+        self.assertEqual(self.refresh(self.project1).open_positions, 1)
+        self.assertEqual(self.refresh(self.position1).new_application_count,
+                         0)
+
+        self.client.post(
+            reverse('projects:applications-update',
+                    kwargs={'status': 'reject'}),
+            {'id': self.application21.id}
+        )
+        self.assertEqual(self.refresh(self.project1).open_positions, 2)
+
+    def test_project_active_derived_from_open_positions(self):
+        models.Position.objects.filter(project=self.project1).update(
+            user=self.user2)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertFalse(self.refresh(self.project1).active)
+
+        position = self.refresh(self.position1)
+        position.user = None
+        position.save()
+        project = self.refresh(self.project1)
+        self.assertEqual(project.open_positions, 1)
+        self.assertTrue(project.active)
+
+    def test_counters_after_deletion(self):
+        self.application21.delete()
+        self.assertEqual(self.refresh(self.position1).application_count, 2)
+        self.assertEqual(self.refresh(self.position1).new_application_count,
+                         1)
+        self.position11.delete()
+        self.assertEqual(self.refresh(self.project1).open_positions, 1)
+
+    def test_save_does_not_overwrite_counters(self):
+        project = self.refresh(self.project1)
+        models.Position.objects.create(role=self.role2, project=self.project1)
+        project.name = 'New name'
+        project.save()
+        self.assertEqual(self.refresh(self.project1).open_positions, 3)
+
+    def test_reconcile_counters(self):
+        models.Project.objects.update(open_positions=10, needs_summary='')
+        models.Position.objects.update(application_count=0,
+                                       new_application_count=5)
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=2, stdout=out)
+        self.assertIn('Projects with drifted counters: 3', out.getvalue())
+        self.test_counters_after_creation()
+        self.assertEqual(self.refresh(self.project1).needs,
+                         ['Role1', 'Role3'])
+
+    def test_needs_summary(self):
+        project = self.refresh(self.project1)
+        self.assertEqual(project.needs, ['Role1', 'Role3'])
+        self.assertFalse(project.more_needs)
+
+        models.Position.objects.create(role=self.role2, project=self.project1)
+        project = self.refresh(self.project1)
+        self.assertEqual(project.needs, ['Role1', 'Role3'])
+        self.assertTrue(project.more_needs)
+
+        position = self.refresh(self.position1)
+        position.role = self.role2
+        position.save()
+        self.assertEqual(self.refresh(self.project1).needs,
+                         ['Role2', 'Role3'])
+
+        self.role3.name = 'Designer'
+        self.role3.save()
+        self.assertEqual(self.refresh(self.project1).needs,
+                         ['Role2', 'Designer'])
+
+        self.position11.delete()
+        project = self.refresh(self.project1)
+        self.assertEqual(project.needs, ['Role2', 'Role2'])
+        self.assertFalse(project.more_needs)
+
+    def test_index_lists_needs_without_positions(self):
+        models.Position.objects.create(role=self.role2, project=self.project1)
+        models.flush_listings()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('projects:home'))
+        self.assertContains(response,
+                            '<span class="position-list">Role3</span>')
+        self.assertContains(response,
+                            '<span class="position-list">...</span>')
+        # No prefetch of positions and roles.
+        self.assertFalse([query for query in queries
+                          if 'FROM "projects_role"' in query['sql'] or
+                          query['sql'].startswith(
+                              'SELECT "projects_position"."id"')])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Uses SQLite EXPLAIN QUERY PLAN.')
+class IndexUsageTests(TestCase):
+    def setUp(self):
+        ApplicationListViewTests.setUp(self)
+
+    def get_index(self, model, columns):
+        """Returns the name of the index on exactly these columns."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+        for name, constraint in constraints.items():
+            if constraint['index'] and constraint['columns'] == columns:
+                return name
+        self.fail('No index on {}{}'.format(model._meta.db_table, columns))
+
+    def get_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, model, columns):
+        self.assertIn(self.get_index(model, columns), self.get_plan(queryset))
+
+    def test_active_projects_use_index(self):
+        self.assertUsesIndex(
+            models.Project.objects.filter(active=True).order_by('id'),
+            models.Project, ['active', 'id'])
+
+    def test_applications_by_status_use_index(self):
+        self.assertUsesIndex(
+            models.Application.objects.filter(position=self.position1,
+                                              status='n'),
+            models.Application, ['position_id', 'status'])
+
+    def test_duplicate_application_check_uses_index(self):
+        self.assertUsesIndex(
+            models.Application.objects.filter(applicant=self.user1,
+                                              position=self.position1),
+            models.Application, ['applicant_id', 'position_id'])
+
+    def test_open_positions_use_index(self):
+        self.assertUsesIndex(
+            models.Position.objects.filter(project=self.project1,
+                                           user__isnull=True),
+            models.Position, ['project_id', 'user_id'])
+
+    def test_duplicate_application_is_rejected(self):
+        self.client.force_login(self.user1)
+        url = reverse('projects:applications-create',
+                      kwargs={'pk': self.project1.pk})
+        # Simulate a concurrent request passing the form check first.
+        with mock.patch.object(forms.ApplicationForm, 'clean',
+                               lambda form: form.cleaned_data):
+            response = self.client.post(url, {'position': self.position1.id},
+                                        follow=True)
+        self.assertContains(response,
+                            'You have already applied for this position.')
+        self.assertEqual(models.Application.objects.filter(
+            applicant=self.user1, position=self.position1).count(), 1)
+
+
+class SeedBenchTests(TestCase):
+    def seed(self):
+        call_command('seed_bench', users=30, projects=10, seed=7,
+                     batch_size=8, stdout=StringIO())
+
+    def test_seed_bench_creates_consistent_data(self):
+        self.seed()
+        User = get_user_model()
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(models.UserProfile.objects.count(), 30)
+        self.assertEqual(models.Project.objects.count(), 10)
+        self.assertTrue(models.Application.objects.exists())
+        self.assertTrue(
+            self.client.login(email=User.objects.first().email,
+                              password='password'))
+        # Counters match the rows, so reconciling finds nothing to fix.
+        out = StringIO()
+        call_command('reconcile_counters', dry_run=True, stdout=out)
+        self.assertIn('Positions with drifted counters: 0', out.getvalue())
+        self.assertIn('Projects with drifted counters: 0', out.getvalue())
+
+    def test_seed_bench_is_deterministic(self):
+        def snapshot(positions):
+            return [(position.role.name, position.user_id is None,
+                     position.application_count,
+                     sorted(position.applications.values_list('status',
+                                                              flat=True)))
+                    for position in positions]
+
+        self.seed()
+        first = list(models.Position.objects.order_by('id'))
+        self.seed()
+        second = list(models.Position.objects.order_by('id'))[len(first):]
+        self.assertEqual(snapshot(first), snapshot(second))
+
+
+class ImportUsersTests(TestCase):
+    def write(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def import_users(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_users', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_csv(self):
+        models.Skill.objects.create(name='Python')
+        get_user_model().objects.create_user(email='old@example.com')
+        path = self.write('.csv', (
+            'email,password,full_name,biography,skills\n'
+            'ann@EXAMPLE.com,secret,Ann,Likes tea,python;Django\n'
+            'bob@example.com,,Bob,,\n'
+            'old@example.com,,Old,,\n'
+            ',,No Email,,\n'
+        ))
+        out, err = self.import_users(path)
+        self.assertIn('Imported 2 users with 2 skill links, skipped 1 '
+                      'existing users and 1 invalid rows', out)
+        self.assertIn('Line 5: no email.', err)
+
+        ann = get_user_model().objects.get(email='ann@example.com')
+        self.assertTrue(ann.check_password('secret'))
+        self.assertEqual(ann.userprofile.full_name, 'Ann')
+        self.assertEqual(ann.userprofile.biography, 'Likes tea')
+        self.assertEqual(sorted(ann.userprofile.skills.values_list(
+            'name', flat=True)), ['Django', 'Python'])
+        bob = get_user_model().objects.get(email='bob@example.com')
+        self.assertFalse(bob.has_usable_password())
+        self.assertFalse(bob.userprofile.skills.exists())
+
+    def test_import_jsonl_with_hashed_passwords(self):
+        path = self.write('.jsonl', '\n'.join([
+            json.dumps({'email': 'ann@example.com',
+                        'password': make_password('secret'),
+                        'skills': ['Go']}),
+            json.dumps({'email': 'bob@example.com', 'password': 'plain'}),
+            'not json',
+            json.dumps({'email': 'ann@example.com'}),
+            json.dumps({'email': 42}),
+            json.dumps({'email': 'cy@example.com', 'skills': [1]}),
+        ]))
+        out, err = self.import_users(path, hashed_passwords=True)
+        self.assertIn('Imported 1 users with 1 skill links, skipped 1 '
+                      'existing users and 4 invalid rows', out)
+        self.assertIn('Line 2: unknown password hash.', err)
+        self.assertIn('Line 5: email is not a string.', err)
+        self.assertIn('Line 6: skills are not a list of names.', err)
+        self.assertTrue(self.client.login(email='ann@example.com',
+                                          password='secret'))
+
+        # Running the import again skips everyone.
+        out, err = self.import_users(path, hashed_passwords=True)
+        self.assertIn('Imported 0 users', out)
+        self.assertEqual(get_user_model().objects.count(), 1)
+        # Ids assigned by the database do not collide with imported ones.
+        get_user_model().objects.create_user(email='new@example.com')
+
+    def test_queries_do_not_grow_with_rows(self):
+        def queries(count, offset):
+            path = self.write('.jsonl', '\n'.join(
+                json.dumps({'email': 'user{}@example.com'.format(i),
+                            'skills': ['Skill {}'.format(i % 3)]})
+                for i in range(offset, offset + count)))
+            with CaptureQueriesContext(connection) as captured:
+                self.import_users(path, batch_size=100)
+            return len(captured)
+
+        queries(1, 0)
+        self.assertEqual(queries(2, 100), queries(50, 200))
+
+
+class PurgeInactiveUsersTests(TestCase):
+    def setUp(self):
+        ModelTests.setUp(self)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        expired = timezone.now() - datetime.timedelta(
+            days=settings.ACCOUNT_ACTIVATION_DAYS + 1)
+        User = get_user_model()
+        self.expired = User.objects.create_user(
+            email='expired@example.com', is_active=False,
+            date_joined=expired)
+        self.recent = User.objects.create_user(
+            email='recent@example.com', is_active=False)
+        self.deactivated = User.objects.create_user(
+            email='deactivated@example.com', is_active=False,
+            date_joined=expired, last_login=expired)
+        self.user1.date_joined = expired
+        self.user1.save()
+
+    def purge(self, **options):
+        out = StringIO()
+        with self.settings(MEDIA_ROOT=self.media_root):
+            call_command('purge_inactive_users', stdout=out, **options)
+        return out.getvalue()
+
+    def test_expired_inactive_users_are_deleted(self):
+        avatar = models.UserProfile._meta.get_field('avatar')
+        with self.settings(MEDIA_ROOT=self.media_root):
+            name = avatar.storage.save('uploads/expired.png',
+                                       ContentFile(b'png'))
+        models.UserProfile.objects.filter(user=self.expired).update(
+            avatar=name)
+
+        out = self.purge(batch_size=1)
+        self.assertIn('Deleted 1 expired inactive users', out)
+        self.assertEqual(
+            set(get_user_model().objects.values_list('email', flat=True)),
+            {'user1@example.com', 'user2@example.com', 'recent@example.com',
+             'deactivated@example.com'})
+        self.assertFalse(models.UserProfile.objects.filter(
+            user_id=self.expired.id).exists())
+        self.assertFalse(os.path.exists(
+            os.path.join(self.media_root, name)))
+
+    def test_dry_run(self):
+        self.assertIn('Expired inactive users: 1',
+                      self.purge(dry_run=True))
+        self.assertTrue(get_user_model().objects.filter(
+            id=self.expired.id).exists())
+
+
+class BenchEndpointsTests(TestCase):
+    def setUp(self):
+        ApplicationListViewTests.setUp(self)
+
+    def test_bench_endpoints_writes_results(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        statuses = list(models.Application.objects.order_by('id')
+                        .values_list('status', flat=True))
+        call_command('bench_endpoints', requests=2, warmup=0, output=path,
+                     stdout=StringIO())
+        with open(path) as output:
+            results = json.load(output)
+        self.assertEqual(results['project-detail']['status'], 200)
+        self.assertEqual(results['applications-update']['status'], 302)
+        self.assertGreater(results['applications']['queries'], 0)
+        self.assertGreater(results['home']['peak_kb'], 0)
+        # Writes are rolled back.
+        self.assertEqual(list(models.Application.objects.order_by('id')
+                              .values_list('status', flat=True)), statuses)
+
+    def test_bench_endpoints_fails_on_regression(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as baseline:
+            json.dump({'home': {'p95_ms': 1000, 'peak_kb': 100000,
+                                'queries': 0}}, baseline)
+        self.addCleanup(os.remove, path)
+        with self.assertRaises(CommandError):
+            call_command('bench_endpoints', endpoint=['home'], requests=1,
+                         warmup=0, baseline=path, stdout=StringIO(),
+                         stderr=StringIO())
+
+    def test_bench_endpoints_memory_mode(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+        call_command('bench_endpoints', memory=True, warmup=0,
+                     endpoint=['applications', 'project-detail'],
+                     budgets=path, write_budgets=True, stdout=out)
+        self.assertIn('allocation sites at peak', out.getvalue())
+        with open(path) as budgets:
+            budgets = json.load(budgets)
+        self.assertEqual(sorted(budgets), ['applications', 'project-detail'])
+        # Within budget.
+        call_command('bench_endpoints', memory=True, warmup=0,
+                     endpoint=['applications'], budgets=path,
+                     stdout=StringIO())
+
+        with open(path, 'w') as output:
+            json.dump({'applications': 1}, output)
+        with self.assertRaises(CommandError):
+            call_command('bench_endpoints', memory=True, warmup=0,
+                         endpoint=['applications'], budgets=path,
+                         stdout=StringIO(), stderr=StringIO())
+
+    def test_measure_memory_sites(self):
+        endpoint = [endpoint for endpoint in bench.get_endpoints()
+                    if endpoint.name == 'applications'][0]
+        with bench.bench_settings():
+            metrics = bench.measure_memory(endpoint, sites=3)
+        self.assertEqual(metrics['status'], 200)
+        self.assertGreater(metrics['peak_kb'], metrics['retained_kb'])
+        self.assertEqual(len(metrics['sites']), 3)
+
+    def test_check_budgets(self):
+        results = {'home': {'peak_kb': 120}, 'search': {'peak_kb': 80}}
+        self.assertEqual(bench.check_budgets(results, {'home': 100,
+                                                       'search': 100}),
+                         [('home', 100, 120)])
+        self.assertEqual(bench.make_budgets(results, headroom=0.5),
+                         {'home': 181, 'search': 121})
+
+    def test_compare(self):
+        baseline = {'home': {'p95_ms': 10, 'peak_kb': 100, 'queries': 3}}
+        results = {'home': {'p95_ms': 12, 'peak_kb': 200, 'queries': 4}}
+        self.assertEqual(bench.compare(results, baseline, threshold=0.25),
+                         [('home', 'peak_kb', 100, 200),
+                          ('home', 'queries', 3, 4)])
+
+
+class QueryRecorder(CaptureQueriesContext):
+    """Captures queries together with the stack that executed them."""
+
+    def record_stack(self, execute, sql, params, many, context):
+        # Keep the frames of the project's own code.
+        frames = [frame for frame in traceback.extract_stack()[:-1]
+                  if frame[0].startswith(settings.BASE_DIR)]
+        self.stacks.append(''.join(traceback.format_list(frames)))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self.stacks = []
+        self.wrapper = db.execute_wrapper(self.record_stack,
+                                          using=self.connection.alias)
+        self.wrapper.__enter__()
+        return super(QueryRecorder, self).__enter__()
+
+    def __exit__(self, *args):
+        self.wrapper.__exit__(*args)
+        super(QueryRecorder, self).__exit__(*args)
+
+
+class QueryCountTests(TestCase):
+    """Every page must run the same number of queries for 5 and for 50
+    positions, skills and applications."""
+    sizes = (5, 50)
+
+    def setUp(self):
+        self.worlds = [self.build('small', self.sizes[0]),
+                       self.build('large', self.sizes[1])]
+
+    def build(self, prefix, size):
+        """Creates an owner with a project of size positions, each needing
+        size skills and applied for by size users."""
+        User = get_user_model()
+        world = {'size': size}
+        owner = world['owner'] = User.objects.create_user(
+            email='{}-owner@example.com'.format(prefix), password='password')
+        applicant = world['applicant'] = User.objects.create_user(
+            email='{}-applicant@example.com'.format(prefix),
+            password='password')
+        skills = [models.Skill.objects.create(
+            name='{} skill {}'.format(prefix, i)) for i in range(size)]
+        world['links'] = [models.UserProfileSkill.objects.create(
+            user_profile=applicant.userprofile, skill=skill)
+            for skill in skills]
+
+        project = world['project'] = models.Project.objects.create(
+            name='{} project'.format(prefix), timeline='1 day',
+            requirements='Requirements', owner=owner)
+        positions = []
+        for i in range(size):
+            position = models.Position.objects.create(
+                role=models.Role.objects.create(
+                    name='{} role {}'.format(prefix, i)),
+                project=project)
+            position.related_skills = skills
+            positions.append(position)
+        # The applicant already worked on one position.
+        positions[0].user = applicant
+        positions[0].save()
+
+        applications = []
+        for i in range(size):
+            user = User.objects.create_user(
+                email='{}-user{}@example.com'.format(prefix, i),
+                password='password')
+            applications.append(models.Application.objects.create(
+                applicant=user, position=positions[i]))
+            models.Application.objects.create(applicant=applicant,
+                                              position=positions[i])
+        world['applications'] = applications
+
+        # Project with a single position to edit.
+        other = world['other_project'] = models.Project.objects.create(
+            name='{} other project'.format(prefix), timeline='1 day',
+            requirements='Requirements', owner=owner)
+        world['other_position'] = models.Position.objects.create(
+            role=positions[0].role, project=other)
+        world['prefix'] = prefix
+        return world
+
+    def profile_post_data(self, world):
+        prefix = forms.UserProfileSkillFormSet.get_default_prefix()
+        links = world['links']
+        data = {
+            'full_name': 'Full Name',
+            'biography': 'Biography',
+            prefix + '-TOTAL_FORMS': str(len(links) + 1),
+            prefix + '-INITIAL_FORMS': str(len(links)),
+            prefix + '-{}-skill_name'.format(len(links)): '{} new'.format(
+                world['prefix']),
+        }
+        for i, link in enumerate(links):
+            data[prefix + '-{}-id'.format(i)] = str(link.id)
+            # Keep, rename or delete the skills.
+            name = link.skill.name
+            if i % 3 == 1:
+                name = '{} renamed {}'.format(world['prefix'], i)
+            elif i % 3 == 2:
+                data[prefix + '-{}-DELETE'.format(i)] = 'on'
+            data[prefix + '-{}-skill_name'.format(i)] = name
+        return data
+
+    def project_post_data(self, world):
+        position = world['other_position']
+        return {
+            'name': 'Project',
+            'description': 'Description',
+            'timeline': '1 day',
+            'requirements': 'Requirements',
+            'positions-TOTAL_FORMS': '1',
+            'positions-INITIAL_FORMS': '1',
+            'positions-0-id': str(position.id),
+            'positions-0-role_name': '{} new role'.format(world['prefix']),
+            'positions-0-description': 'Description',
+            'positions-0-related_skills': ', '.join(
+                '{} needed {}'.format(world['prefix'], i)
+                for i in range(world['size'])),
+        }
+
+    def get_requests(self, world):
+        """Returns (name, user, method, url, data) for every page."""
+        owner, applicant = world['owner'], world['applicant']
+        project = world['project']
+        applications = world['applications']
+        return [
+            ('home', None, 'get', reverse('projects:home'), {}),
+            ('search', None, 'get', reverse('projects:search'),
+             {'q': 'project'}),
+            ('for-me', applicant, 'get', reverse('projects:projects-for-me'),
+             {}),
+            ('project-detail', applicant, 'get',
+             reverse('projects:project-detail', kwargs={'pk': project.pk}),
+             {}),
+            ('project-detail-owner', owner, 'get',
+             reverse('projects:project-detail', kwargs={'pk': project.pk}),
+             {}),
+            ('project-create', owner, 'get',
+             reverse('projects:project-create'), {}),
+            ('project-update', owner, 'get',
+             reverse('projects:project-update', kwargs={'pk': project.pk}),
+             {}),
+            ('project-update-post', owner, 'post',
+             reverse('projects:project-update',
+                     kwargs={'pk': world['other_project'].pk}),
+             self.project_post_data(world)),
+            ('profile-detail', owner, 'get',
+             reverse('projects:user-profile-detail',
+                     kwargs={'pk': applicant.userprofile.pk}), {}),
+            ('profile-update', applicant, 'get',
+             reverse('projects:user-profile-update'), {}),
+            ('profile-update-post', applicant, 'post',
+             reverse('projects:user-profile-update'),
+             self.profile_post_data(world)),
+            ('applications', owner, 'get', reverse('projects:applications'),
+             {}),
+            ('applications-update', owner, 'post',
+             reverse('projects:applications-update',
+                     kwargs={'status': 'accept'}),
+             {'id': applications[1].id}),
+            ('applications-bulk-update', owner, 'post',
+             reverse('projects:applications-bulk-update',
+                     kwargs={'status': 'reject'}),
+             {'ids': [application.id for application in applications]}),
+            ('applications-create', owner, 'post',
+             reverse('projects:applications-create',
+                     kwargs={'pk': project.pk}),
+             {'position': world['other_position'].id}),
+        ]
+
+    def record(self, user, method, url, data):
+        if user is None:
+            self.client.logout()
+        else:
+            self.client.force_login(user)
+        with QueryRecorder(connection) as recorder:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 400)
+        return recorder
+
+    def describe_extra_queries(self, small, large):
+        """Lists the queries only the large fixture ran, with stacks."""
+        def normalize(sql):
+            sql = re.sub(r"'[^']*'|\b\d+\b", '?', sql)
+            # Collapse IN lists and bulk inserts.
+            sql = re.sub(r'(?: UNION ALL SELECT [?, ]+)+', ' UNION ALL ...',
+                         sql)
+            return re.sub(r'\((?:\?, )*\?\)', '(...)', sql)
+
+        expected = Counter(normalize(query['sql'])
+                           for query in small.captured_queries)
+        extra = []
+        for query, stack in zip(large.captured_queries, large.stacks):
+            sql = normalize(query['sql'])
+            if expected[sql]:
+                expected[sql] -= 1
+            else:
+                extra.append('{}\n{}'.format(query['sql'], stack))
+        return '\n\n'.join(extra[:5])
+
+    def test_query_counts_do_not_depend_on_data_size(self):
+        small, large = [self.get_requests(world) for world in self.worlds]
+        for small_request, large_request in zip(small, large):
+            name = small_request[0]
+            with self.subTest(view=name):
+                small_queries = self.record(*small_request[1:])
+                large_queries = self.record(*large_request[1:])
+                self.assertEqual(
+                    len(small_queries), len(large_queries),
+                    '{} runs {} queries for {} and {} for {} rows. Extra '
+                    'queries:\n{}'.format(
+                        name, len(small_queries), self.sizes[0],
+                        len(large_queries), self.sizes[1],
+                        self.describe_extra_queries(small_queries,
+                                                    large_queries)))
+
+
+class ServerTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        ProjectDetailViewTests.setUp(self)
+        self.url = reverse('projects:project-detail',
+                           kwargs={'pk': self.project1.pk})
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_server_timing_header(self):
+        self.client.force_login(self.user2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        header = response['Server-Timing']
+        self.assertIn('sql;dur=', header)
+        self.assertIn('"{} queries"'.format(len(queries)), header)
+        self.assertIn('tpl;dur=', header)
+        self.assertIn('view;dur=', header)
+        self.assertIn('total;dur=', header)
+
+    def test_server_timing_log(self):
+        self.client.force_login(self.user2)
+        with self.assertLogs('team_builder.timing', 'INFO') as logs:
+            self.client.get(self.url)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['path'], self.url)
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['queries'], 0)
+        self.assertGreater(line['template_ms'], 0)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0,
+                       SERVER_TIMING_HEADER=True)
+    def test_server_timing_not_sampled(self):
+        self.client.force_login(self.user2)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_execute_wrapper(self):
+        calls = []
+
+        def wrapper(execute, sql, params, many, context):
+            calls.append(sql)
+            return execute(sql, params, many, context)
+
+        with db.execute_wrapper(wrapper):
+            list(models.Project.objects.all())
+        list(models.Project.objects.all())
+        self.assertEqual(len(calls), 1)
+
+
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        ProjectDetailViewTests.setUp(self)
+        fd, self.path = tempfile.mkstemp(suffix='.log')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_normalize(self):
+        self.assertEqual(
+            slow_queries.normalize(
+                'SELECT * FROM t WHERE id IN (%s, %s, %s) AND a = 1'),
+            'SELECT * FROM t WHERE id IN (...) AND a = ?')
+
+    def test_slow_queries_are_logged_with_plans(self):
+        self.client.force_login(self.user2)
+        with override_settings(SLOW_QUERY_THRESHOLD=0,
+                               SLOW_QUERY_LOG_FILE=self.path):
+            self.client.get(reverse('projects:project-detail',
+                                    kwargs={'pk': self.project1.pk}))
+        with open(self.path) as log:
+            entries = [json.loads(line) for line in log]
+        views = {entry['view'] for entry in entries}
+        self.assertIn('projects.views.ProjectDetailView', views)
+        self.assertTrue(any(entry['caller'].startswith('projects/')
+                            for entry in entries if entry['caller']))
+        self.assertTrue(any(entry.get('explain') for entry in entries))
+
+        out = StringIO()
+        call_command('slow_query_report', file=self.path, top=3, stdout=out)
+        self.assertIn('distinct shapes', out.getvalue())
+        self.assertIn('Plan:', out.getvalue())
+
+    def test_failed_explain_keeps_transaction(self):
+        log = slow_queries.SlowQueryLog(0, self.path)
+        with transaction.atomic(), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(log.explain('SELECT missing FROM nowhere', [],
+                                          connection))
+            self.assertTrue(models.Project.objects.exists())
+        # The EXPLAIN is rolled back to a savepoint.
+        self.assertTrue(any(query['sql'].startswith('ROLLBACK TO SAVEPOINT')
+                            for query in queries))
+
+    def test_slow_query_log_disabled(self):
+        self.client.force_login(self.user2)
+        self.client.get(reverse('projects:project-detail',
+                                kwargs={'pk': self.project1.pk}))
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        ProjectDetailViewTests.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.url = reverse('projects:project-detail',
+                           kwargs={'pk': self.project1.pk})
+
+    def get_profiles(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_staff_user_profiles_request(self):
+        self.user2.is_staff = True
+        self.user2.save()
+        self.client.force_login(self.user2)
+        with override_settings(PROFILING_DIR=self.directory):
+            response = self.client.get(self.url, {'profile': '1'})
+        profile_id = response['X-Profile-Id']
+        self.assertIn('projects-project-detail', profile_id)
+        self.assertEqual(self.get_profiles(), [
+            profile_id + '.collapsed',
+            profile_id + '.json',
+            profile_id + '.prof',
+        ])
+
+        path = os.path.join(self.directory, profile_id)
+        with open(path + '.json') as metadata:
+            metadata = json.load(metadata)
+        self.assertEqual(metadata['url_name'], 'projects:project-detail')
+        self.assertEqual(metadata['status'], 200)
+        self.assertEqual(metadata['user'], self.user2.pk)
+        stats = pstats.Stats(path + '.prof')
+        self.assertTrue(any(function[2] == 'get_context_data'
+                            for function in stats.stats))
+        with open(path + '.collapsed') as collapsed:
+            for line in collapsed:
+                self.assertRegex(line, r'^\S.* \d+$')
+
+    def test_token_header_profiles_request(self):
+        with override_settings(PROFILING_DIR=self.directory,
+                               PROFILING_TOKEN='secret'):
+            response = self.client.get(reverse('projects:home'),
+                                       HTTP_X_PROFILE='secret')
+            self.assertIn('projects-home', response['X-Profile-Id'])
+            response = self.client.get(reverse('projects:home'),
+                                       HTTP_X_PROFILE='wrong')
+            self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(len(self.get_profiles()), 3)
+
+    def test_non_staff_user_cannot_profile(self):
+        self.client.force_login(self.user2)
+        with override_settings(PROFILING_DIR=self.directory):
+            response = self.client.get(self.url, {'profile': '1'})
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(self.get_profiles(), [])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(TransactionTestCase):
+    # The replica mirrors the test database through its own connection,
+    # which only sees committed data.
+    multi_db = True
+
+    def setUp(self):
+        ProjectDetailViewTests.setUp(self)
+        self.url = reverse('projects:project-detail',
+                           kwargs={'pk': self.project1.pk})
+        self.client.force_login(self.user2)
+
+    def get_with_queries(self, url):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            with CaptureQueriesContext(connection) as default:
+                response = self.client.get(url)
+        return response, len(replica), len(default)
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(models.Project), 'default')
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(models.Project), 'replica')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(models.Project),
+                                 'default')
+            with override_settings(DATABASE_REPLICAS=[]):
+                self.assertEqual(router.db_for_read(models.Project),
+                                 'default')
+            self.assertEqual(router.db_for_write(models.Project), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'projects'))
+
+    def test_views_read_from_replica(self):
+        response, replica, default = self.get_with_queries(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.project1.name)
+        self.assertGreater(replica, 0)
+        self.assertEqual(default, 0)
+
+    def test_reads_stick_to_primary_after_write(self):
+        response = self.client.post(
+            reverse('projects:applications-create',
+                    kwargs={'pk': self.project1.pk}),
+            {'position': self.position1.pk})
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        self.assertEqual(
+            response.cookies[routers.STICKY_COOKIE]['max-age'],
+            settings.REPLICA_STICKY_SECONDS)
+        response, replica, default = self.get_with_queries(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(replica, 0)
+        self.assertGreater(default, 0)
+
+    def test_sync_replicas_refuses_default_database(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_replicas', stdout=StringIO())
+
+
+class SQLiteTuningTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'db.sqlite3')
+
+    def connect(self):
+        """Opens a new connection to a database file."""
+        tuned = connections['default'].__class__(
+            dict(connection.settings_dict, NAME=self.path), alias='tuning')
+        tuned.ensure_connection()
+        self.addCleanup(tuned.close)
+        return tuned
+
+    def pragma(self, tuned, name):
+        with tuned.cursor() as cursor:
+            cursor.execute('PRAGMA ' + name)
+            return cursor.fetchone()[0]
+
+    def test_tuning_disabled_by_default(self):
+        self.assertEqual(self.pragma(self.connect(), 'journal_mode'),
+                         'delete')
+
+    @override_settings(SQLITE_TUNING=True,
+                       SQLITE_PRAGMAS={'cache_size': -1000,
+                                       'mmap_size': None})
+    def test_tuning(self):
+        with mock.patch.object(sqlite, '_last_maintenance', None):
+            with mock.patch.object(sqlite, 'maintain') as maintain:
+                tuned = self.connect()
+                self.connect()
+        maintain.assert_called_once_with(tuned)
+        sqlite.maintain(tuned)
+        self.assertEqual(self.pragma(tuned, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(tuned, 'synchronous'), 1)
+        self.assertEqual(self.pragma(tuned, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(tuned, 'cache_size'), -1000)
+        self.assertEqual(self.pragma(tuned, 'mmap_size'), 0)
+
+        # atomic() starts transactions with this method.
+        with CaptureQueriesContext(tuned) as queries:
+            tuned._start_transaction_under_autocommit()
+        tuned.cursor().execute('ROLLBACK')
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    @override_settings(SQLITE_MAINTENANCE_INTERVAL=3600)
+    def test_maintenance_runs_once_per_interval(self):
+        with mock.patch.object(sqlite, '_last_maintenance', None):
+            self.assertTrue(sqlite.maintenance_due())
+            self.assertFalse(sqlite.maintenance_due())
+
+    def test_bench_sqlite_writers_needs_database_file(self):
+        with self.assertRaises(CommandError):
+            call_command('bench_sqlite_writers', stdout=StringIO())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        ApplicationListViewTests.setUp(self)
+        self.project_url = reverse('projects:project-detail',
+                                   kwargs={'pk': self.project1.pk})
+        self.profile_url = reverse('projects:user-profile-detail',
+                                   kwargs={'pk': self.user3.userprofile.pk})
+        self.client.force_login(self.user3)
+
+    def get(self, url, etag=None):
+        if etag is None:
+            return self.client.get(url)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def assertUnchanged(self, url, etag):
+        self.assertEqual(self.get(url, etag).status_code, 304)
+
+    def assertChanged(self, url, etag):
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_not_modified_with_one_query(self):
+        response = self.get(self.project_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', response)
+        # Session, user and validator.
+        with self.assertNumQueries(3):
+            response = self.get(self.project_url, response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_depends_on_viewer(self):
+        etag = self.get(self.project_url)['ETag']
+        self.client.force_login(self.user2)
+        self.assertChanged(self.project_url, etag)
+
+    def test_pages_with_messages_are_rendered(self):
+        position = models.Position.objects.create(role=self.role1,
+                                                  project=self.project1)
+        etag = self.get(self.project_url)['ETag']
+        # Applying redirects back to the project page with a message.
+        self.client.post(reverse('projects:applications-create',
+                                 kwargs={'pk': self.project1.pk}),
+                         {'position': position.pk})
+        response = self.get(self.project_url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'You have successfully applied')
+
+    def test_project_page_changes(self):
+        etag = self.get(self.project_url)['ETag']
+        self.assertUnchanged(self.project_url, etag)
+
+        self.position1.related_skills.add(self.skill3)
+        self.assertChanged(self.project_url, etag)
+
+        etag = self.get(self.project_url)['ETag']
+        self.user1.userprofile.full_name = 'New Owner Name'
+        self.user1.userprofile.save()
+        self.assertChanged(self.project_url, etag)
+
+        etag = self.get(self.project_url)['ETag']
+        self.application311.delete()
+        self.assertChanged(self.project_url, etag)
+
+    def test_accepting_changes_project_and_profile_pages(self):
+        project_etag = self.get(self.project_url)['ETag']
+        profile_etag = self.get(self.profile_url)['ETag']
+        self.assertUnchanged(self.profile_url, profile_etag)
+
+        owner = self.client_class()
+        owner.force_login(self.user1)
+        owner.post(reverse('projects:applications-bulk-update',
+                           kwargs={'status': 'accept'}),
+                   {'ids': [self.application311.id]})
+
+        self.assertChanged(self.project_url, project_etag)
+        response = self.get(self.profile_url, profile_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.project1.name)
+
+    def test_index_changes_when_project_is_deleted(self):
+        url = reverse('projects:home')
+        models.flush_listings()
+        etag = self.get(url)['ETag']
+        self.assertUnchanged(url, etag)
+        models.Project.objects.filter(id=self.project3.id).delete()
+        self.assertChanged(url, etag)
+
+
+class ProjectBodyCacheTests(TestCase):
+    def setUp(self):
+        ProjectDetailViewTests.setUp(self)
+        cache.clear()
+        self.url = reverse('projects:project-detail',
+                           kwargs={'pk': self.project1.pk})
+
+    def test_body_is_rendered_once_per_version(self):
+        models.Application.objects.create(applicant=self.user2,
+                                          position=self.position1)
+        self.client.force_login(self.user1)
+        self.client.get(self.url)
+
+        self.client.force_login(self.user2)
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        self.assertContains(response, self.position1.description)
+        self.assertContains(response, 'disabled="disabled"', count=1)
+        self.assertNotContains(response, 'Edit Project')
+
+    def test_placeholders_are_filled_for_viewer(self):
+        self.client.force_login(self.user1)
+        self.client.get(self.url)
+
+        client = self.client_class(enforce_csrf_checks=True)
+        client.force_login(self.user2)
+        response = client.get(self.url)
+        project = models.Project.objects.get(pk=self.project1.pk)
+        placeholder = cache.get('project-body:{}:{}'.format(
+            project.pk, project.updated_at.isoformat()))[0]
+        self.assertNotContains(response, placeholder)
+        token = re.search(r"name='csrfmiddlewaretoken' value='([^']+)'",
+                          response.content.decode()).group(1)
+        response = client.post(
+            reverse('projects:applications-create',
+                    kwargs={'pk': self.project1.pk}),
+            {'position': self.position1.pk, 'csrfmiddlewaretoken': token}
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_owner_text_is_not_filled(self):
+        self.project1.description = (
+            '[x](https://evil.example/steal?t=csrf-token-placeholder) '
+            '<!--apply:{}-->'.format(self.position1.pk))
+        self.project1.save()
+        models.Application.objects.create(applicant=self.user2,
+                                          position=self.position1)
+        self.client.force_login(self.user2)
+        response = self.client.get(self.url)
+        self.assertContains(
+            response, 'https://evil.example/steal?t=csrf-token-placeholder')
+        # Only the Apply button of the position.
+        self.assertContains(response, 'disabled="disabled"', count=1)
+
+    def test_body_changes_with_project(self):
+        self.client.force_login(self.user2)
+        self.client.get(self.url)
+        self.project1.name = 'Renamed Project'
+        self.project1.save()
+        self.assertContains(self.client.get(self.url), 'Renamed Project')
+
+    def test_body_changes_with_role_name(self):
+        self.client.force_login(self.user2)
+        etag = self.client.get(self.url)['ETag']
+        self.role1.name = 'Renamed Role'
+        self.role1.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Renamed Role')
+
+
+class ProjectListingTests(TestCase):
+    def setUp(self):
+        ApplicationListViewTests.setUp(self)
+        models.flush_listings()
+
+    def listing(self, project):
+        return models.ProjectListing.objects.filter(project=project).first()
+
+    def test_listings_match_projects(self):
+        self.assertEqual(
+            set(models.ProjectListing.objects.values_list('project',
+                                                          flat=True)),
+            set(models.Project.objects.filter(active=True)
+                .values_list('id', flat=True)))
+        listing = self.listing(self.project1)
+        self.assertEqual(listing.name, self.project1.name)
+        self.assertEqual(listing.roles, '\nrole1\nrole3\n')
+        self.assertEqual(
+            list(listing.position_skills.order_by(
+                'position_id', 'skill_id').values_list(
+                'position_id', 'skill_id', 'skill_count')),
+            [(self.position1.id, self.skill1.id, 3),
+             (self.position1.id, self.skill2.id, 3),
+             (self.position1.id, self.skill4.id, 3),
+             (self.position11.id, None, 0)])
+        self.assertIn('description1', listing.search_text)
+
+    def test_refresh_waits_for_commit(self):
+        self.project1.name = 'Renamed'
+        self.project1.save()
+        self.role3.name = 'Designer'
+        self.role3.save()
+        self.assertEqual(self.listing(self.project1).name, 'Project1')
+
+        models.flush_listings()
+        listing = self.listing(self.project1)
+        self.assertEqual(listing.name, 'Renamed')
+        self.assertEqual(listing.roles, '\ndesigner\nrole1\n')
+
+    def test_inactive_projects_are_not_listed(self):
+        models.Position.objects.filter(project=self.project3).delete()
+        models.flush_listings()
+        self.assertIsNone(self.listing(self.project3))
+
+    def test_rebuild_listings(self):
+        models.ProjectListing.objects.filter(project=self.project1).update(
+            name='Stale')
+        models.ProjectListing.objects.filter(project=self.project3).delete()
+        out = StringIO()
+        call_command('rebuild_listings', dry_run=True, stdout=out)
+        self.assertIn('Projects with stale listings: 2', out.getvalue())
+        self.assertEqual(self.listing(self.project1).name, 'Stale')
+
+        out = StringIO()
+        call_command('rebuild_listings', batch_size=1, stdout=out)
+        self.assertIn('Projects with stale listings: 2', out.getvalue())
+        self.assertEqual(self.listing(self.project1).name, 'Project1')
+        self.assertIsNotNone(self.listing(self.project3))
+        out = StringIO()
+        call_command('rebuild_listings', stdout=out)
+        self.assertIn('Projects with stale listings: 0', out.getvalue())
+
+
+class IdentityMapTests(TestCase):
+    def setUp(self):
+        ProjectDetailViewTests.setUp(self)
+
+    def test_related_lookups_use_loaded_instances(self):
+        with identity.identity_map() as identities:
+            project = models.Project.objects.get(id=self.project1.id)
+            user = get_user_model().objects.get(id=self.user1.id)
+            position = models.Position.objects.get(id=self.position1.id)
+            with self.assertNumQueries(0):
+                self.assertIs(position.project, project)
+                self.assertIs(project.owner, user)
+            profile = models.UserProfile.objects.get(user=self.user1)
+            user = get_user_model().objects.get(id=self.user1.id)
+            with self.assertNumQueries(0):
+                self.assertIs(user.userprofile, profile)
+                self.assertIs(profile.user, user)
+        self.assertEqual(identities.hits, 3)
+        self.assertEqual(identities.loaded, 5)
+
+        position = models.Position.objects.get(id=self.position1.id)
+        with self.assertNumQueries(1):
+            position.project
+
+    def test_deleted_instances_are_forgotten(self):
+        with identity.identity_map():
+            project = models.Project.objects.get(id=self.project2.id)
+            position = models.Position.objects.create(role=self.role1,
+                                                      project=project)
+            position = models.Position.objects.get(id=position.id)
+            project.delete()
+            with self.assertRaises(models.Project.DoesNotExist):
+                position.project
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_hits_are_reported(self):
+        # The position's user is the logged in user.
+        self.position1.user = self.user1
+        self.position1.save()
+        self.client.force_login(self.user1)
+        with self.assertLogs('team_builder.timing', 'INFO') as logs:
+            response = self.client.get(reverse(
+                'projects:project-update', kwargs={'pk': self.project1.pk}))
+        line = json.loads(logs.records[0].getMessage())
+        self.assertGreater(line['identity_map_hits'], 0)
+        self.assertIn('idmap;desc="{} fetches avoided"'.format(
+            line['identity_map_hits']), response['Server-Timing'])
+
+
+class CachedUserTests(TransactionTestCase):
+    """The user cache with a cache shared between processes. Invalidation
+    happens on commit, so the changes are committed."""
+
+    def setUp(self):
+        ModelTests.setUp(self)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared = override_settings(CACHES={
+            'default': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': directory,
+            },
+        })
+        shared.enable()
+        self.addCleanup(shared.disable)
+        self.url = reverse('projects:home')
+
+    def user_queries(self):
+        """Returns the user and profile queries of a request to the home
+        page."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries
+                if 'FROM "accounts_myuser"' in query['sql'] or
+                'FROM "projects_userprofile"' in query['sql']]
+
+    def test_user_is_read_from_cache(self):
+        self.client.force_login(self.user1)
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user1)
+        self.assertContains(response, reverse(
+            'projects:user-profile-detail',
+            kwargs={'pk': self.user1.userprofile.pk}))
+
+    def test_profile_change_invalidates(self):
+        self.client.force_login(self.user1)
+        self.user_queries()
+        profile = self.user1.userprofile
+        profile.full_name = 'Changed Name'
+        profile.save()
+        self.assertEqual(len(self.user_queries()), 1)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['user'].userprofile.full_name,
+                         'Changed Name')
+
+    def test_password_change_logs_out_other_sessions(self):
+        self.client.force_login(self.user1)
+        self.user_queries()
+        self.user1.set_password('new password')
+        self.user1.save()
+        response = self.client.get(self.url)
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_invalidation_waits_for_commit(self):
+        self.client.force_login(self.user1)
+        self.user_queries()
+        version = user_cache.get_version(self.user1.pk)
+        with transaction.atomic():
+            self.user1.userprofile.save()
+            self.assertEqual(user_cache.get_version(self.user1.pk), version)
+        self.assertNotEqual(user_cache.get_version(self.user1.pk), version)
+
+    def test_login_keeps_cached_user(self):
+        self.client.force_login(self.user1)
+        self.user_queries()
+        self.client.force_login(self.user1)
+        self.assertEqual(self.user_queries(), [])
+
+    def test_local_cache_is_not_used(self):
+        with self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.client.force_login(self.user1)
+            self.user_queries()
+            # The user is read from the database again.
+            self.assertEqual(len(self.user_queries()), 1)
+
+
+class ProfileModelBackendTests(TestCase):
+    """Loading the user with the default settings, without a shared
+    cache."""
+
+    def setUp(self):
+        ModelTests.setUp(self)
+        self.url = reverse('projects:home')
+
+    def test_user_is_loaded_with_profile(self):
+        self.client.force_login(self.user1)
+        queries = CachedUserTests.user_queries(self)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('JOIN "projects_userprofile"', queries[0])
+        self.assertEqual(len(CachedUserTests.user_queries(self)), 1)
+
+    def test_model_backend_sessions_stay_logged_in(self):
+        self.client.force_login(
+            self.user1, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user1)
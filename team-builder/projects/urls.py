@@ -25,5 +25,8 @@ urlpatterns = [
         views.CreateApplicationView.as_view(), name='applications-create'),
     url(r'^projects/applications/(?P<status>accept|reject)$',
         views.ApplicationsUpdateView.as_view(), name='applications-update'),
+    url(r'^projects/applications/bulk/(?P<status>accept|reject)$',
+        views.ApplicationsBulkUpdateView.as_view(),
+        name='applications-bulk-update'),
     url(r'^projects/$', views.IndexView.as_view(), name='home'),
 ]
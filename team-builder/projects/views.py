@@ -1,20 +1,37 @@
+import calendar
+from collections import Counter
+from functools import reduce
+import hashlib
 import json
+import operator
+import re
 
 from django.conf import settings
 from django.contrib import messages
-from django.core.mail import EmailMessage
+from django.core.cache import cache
 from django.core.urlresolvers import reverse_lazy
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import (Case, Count, IntegerField, Max,
+                              prefetch_related_objects, Q, Value, When)
+from django.db.models.functions import Lower
 from django.http import HttpResponse, HttpResponseRedirect, Http404
+from django.middleware.csrf import get_token
 from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import get_random_string
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
 from django.views import generic
 
 
 from braces.views import LoginRequiredMixin
-from pusher import Pusher
+
+from team_builder.routers import ReplicaReadMixin
 
 from . import forms
+from . import mail
 from . import models
+from . import notifications
 from . import utils
 
 
@@ -34,31 +51,114 @@ def context_from_values_list(initial_list, additional_value):
     return values
 
 
-class IndexView(generic.ListView):
-    """Index view."""
+class ConditionalGetMixin(object):
+    """
+    Answers GET requests with 304 Not Modified if the client's copy of the
+    page is still current, before any other query or rendering.
+
+    get_validator() returns values that change whenever the page does, read
+    with one query, or None. The weak ETag combines them with the viewer and
+    the CSRF cookie, whose token is in the page's forms. Pages with pending
+    messages are always rendered.
+    """
+
+    def get_validator(self):
+        """Returns the validator of the page. Subclasses override it; None
+        renders the page as usual."""
+        return None
+
+    def get_etag(self, validator):
+        key = repr((
+            self.__class__.__name__,
+            validator,
+            self.request.user.pk,
+            # Set from the CSRF cookie, or when the page creates a token.
+            self.request.META.get('CSRF_COOKIE'),
+        ))
+        return hashlib.md5(key.encode()).hexdigest()
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or len(
+                messages.get_messages(request)):
+            return super(ConditionalGetMixin, self).dispatch(request, *args,
+                                                             **kwargs)
+        validator = self.get_validator()
+        if validator is None:
+            return super(ConditionalGetMixin, self).dispatch(request, *args,
+                                                             **kwargs)
+        etag = self.get_etag(validator)
+        times = [value for value in validator if hasattr(value, 'timetuple')]
+        last_modified = (calendar.timegm(max(times).utctimetuple())
+                         if times else None)
+
+        # Last-Modified alone does not identify the viewer, so only
+        # If-None-Match is answered.
+        if request.META.get('HTTP_IF_NONE_MATCH'):
+            response = get_conditional_response(request, etag=etag,
+                                                last_modified=last_modified)
+        else:
+            response = None
+        if response is None:
+            response = super(ConditionalGetMixin, self).dispatch(
+                request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            # Rendering may have created the CSRF token.
+            etag = self.get_etag(validator)
+        response['ETag'] = 'W/' + quote_etag(etag)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ProjectListingMixin(object):
+    """Lists projects from their ProjectListing rows. The projects in the
+    context have only the listed fields loaded."""
     template_name = 'projects/index.html'
     context_object_name = 'projects'
-    model = models.Project
+    model = models.ProjectListing
     paginate_by = 20
 
+    def get_needs(self, listings):
+        """Returns the role names of the listings for the filter list."""
+        roles = [role for roles in listings.values_list('roles', flat=True)
+                 for role in roles.split('\n') if role]
+        return context_from_values_list(initial_list=roles,
+                                        additional_value='all needs')
+
     def get_context_data(self, **kwargs):
-        context = super(IndexView, self).get_context_data()
+        context = super(ProjectListingMixin, self).get_context_data(**kwargs)
+        context['projects'] = context['object_list'] = [
+            listing.as_project() for listing in context['object_list']
+        ]
+        return context
 
-        queryset = self.model.objects.filter(active=True)
-        # Get project needs
+
+class IndexView(ReplicaReadMixin, ConditionalGetMixin, ProjectListingMixin,
+                generic.ListView):
+    """Index view."""
+
+    def get_validator(self):
+        # Listings of deleted and inactive projects are deleted.
+        listings = models.ProjectListing.objects.aggregate(
+            Max('refreshed_at'), Count('project'))
+        return listings['refreshed_at__max'], listings['project__count']
+
+    def get_listings(self):
+        """Returns the listings matching the search term."""
+        listings = models.ProjectListing.objects.all()
         term = self.request.GET.get('q')
         if term:
-            queryset = queryset.filter(
-                Q(name__icontains=term) |
-                Q(description__icontains=term)
-            )
-        positions = models.Position.objects.filter(
-            project__in=queryset
-        ).values_list('role__name', flat=True)
-        context['needs'] = context_from_values_list(
-            initial_list=positions,
-            additional_value='all needs'
-        )
+            listings = listings.filter(search_text__contains=term.lower())
+        return listings
+
+    def get_context_data(self, **kwargs):
+        context = super(IndexView, self).get_context_data()
+
+        # Get project needs
+        context['needs'] = self.get_needs(self.get_listings())
 
         # Get position to filter by
         if not self.request.GET.get('position'):
@@ -74,75 +174,43 @@ class IndexView(generic.ListView):
         return context
 
     def get_queryset(self):
-        queryset = self.model.objects.filter(active=True).prefetch_related(
-            'positions',
-            'positions__role'
-        )
-
-        term = self.request.GET.get('q')
-        if term:
-            queryset = queryset.filter(
-                Q(name__icontains=term) |
-                Q(description__icontains=term)
-            )
+        queryset = self.get_listings().order_by('project')
 
         if self.request.GET.get('position'):
             position = self.request.GET.get('position')
             queryset = queryset.filter(
-                positions__role__name__iexact=position
-            ).distinct()
+                roles__contains='\n{}\n'.format(position.lower())
+            )
         return queryset
 
 
-class ForMeView(LoginRequiredMixin, generic.ListView):
+class ForMeView(ReplicaReadMixin, LoginRequiredMixin, ProjectListingMixin,
+                generic.ListView):
     """View to list projects that have positions fitting a user."""
-    template_name = 'projects/index.html'
-    context_object_name = 'projects'
-    model = models.Project
     login_url = reverse_lazy('accounts:sign-in')
-    paginate_by = 20
 
     def get(self, request, *args, **kwargs):
-        self.for_me_projects = self.get_for_me(
-            request,
-            self.model.objects.filter(active=True)
-        )
+        self.for_me_listings = self.get_for_me(request)
         return super(ForMeView, self).get(request, *args, **kwargs)
 
-    def get_for_me(self, request, queryset):
-        """Get projects that have positions fitting a User."""
-        user = request.user
-        user_skills = user.userprofile.skills.all().values_list('name',
-                                                                flat=True)
-        user_skills = set_from_list(user_skills)
-        positions = models.Position.objects.all().prefetch_related(
-            'related_skills')
-        positions_need_me = []
-        for position in positions:
-            position_skills = [skill.name for skill in
-                               position.related_skills.all()]
-            position_skills = set_from_list(position_skills)
-            missing_skills = [skill for skill in position_skills if skill not
-                              in user_skills]
-            if not missing_skills:
-                positions_need_me.append(position)
-
-        return queryset.filter(
-            positions__in=positions_need_me
-        ).distinct()
+    def get_for_me(self, request):
+        """Get listings of projects that have positions fitting a User."""
+        # Skills match case-insensitively.
+        user_skills = request.user.userprofile.skills.annotate(
+            lower_name=Lower('name')
+        ).values('lower_name')
+        skill_ids = models.Skill.objects.annotate(
+            lower_name=Lower('name')
+        ).filter(
+            lower_name__in=user_skills
+        ).values('id')
+        return models.ProjectListing.objects.for_skills(skill_ids)
 
     def get_context_data(self, **kwargs):
         context = super(ForMeView, self).get_context_data()
 
         # Get project needs
-        queryset = self.for_me_projects
-        positions = models.Position.objects.filter(
-            project__in=queryset
-        ).values_list('role__name', flat=True)
-        context['needs'] = context_from_values_list(
-            initial_list=positions,
-            additional_value='all needs'
-        )
+        context['needs'] = self.get_needs(self.for_me_listings)
 
         # Get position to filter by
         if not self.request.GET.get('position'):
@@ -154,38 +222,86 @@ class ForMeView(LoginRequiredMixin, generic.ListView):
         return context
 
     def get_queryset(self):
-        queryset = self.for_me_projects.prefetch_related(
-            'positions',
-            'positions__role'
-        )
+        queryset = self.for_me_listings.order_by('project')
 
         if self.request.GET.get('position'):
             position = self.request.GET.get('position')
             queryset = queryset.filter(
-                positions__role__name__icontains=position
-            ).distinct()
+                roles__contains='\n{}\n'.format(position.lower())
+            )
         return queryset
 
 
-class ProjectDetailView(LoginRequiredMixin, generic.DetailView):
+class ProjectDetailView(ReplicaReadMixin, LoginRequiredMixin,
+                        ConditionalGetMixin, generic.DetailView):
     """Project detail view."""
     model = models.Project
     template_name = 'projects/project.html'
     login_url = reverse_lazy('accounts:sign-in')
 
+    def get_validator(self):
+        return self.model.objects.filter(
+            pk=self.kwargs['pk']
+        ).values_list('updated_at').first()
+
     def get_queryset(self):
         return self.model.objects.all().select_related(
             'owner',
             'owner__userprofile',
-        ).prefetch_related(
-            'positions',
-            'positions__related_skills',
-            'positions__role',
-            'positions__user',
-            'positions__applications',
-            'positions__applications__applicant'
         )
 
+    def get_project_body(self):
+        """Returns (placeholder, body), the part of the page that is the same
+        for every viewer, from the cache if this version of the project was
+        rendered before. The body has the placeholder where the CSRF token
+        goes and placeholder:position id where an Apply button may be
+        disabled. The placeholder is made at random for each render, so text
+        written by the owner cannot contain it."""
+        key = 'project-body:{}:{}'.format(self.object.pk,
+                                          self.object.updated_at.isoformat())
+        cached = cache.get(key)
+        if cached is None:
+            prefetch_related_objects(
+                [self.object],
+                'positions',
+                'positions__related_skills',
+                'positions__role',
+                'positions__user',
+            )
+            placeholder = get_random_string(32)
+            cached = (placeholder, render_to_string(
+                'projects/project_body.html', {
+                    'project': self.object,
+                    'csrf_token': placeholder,
+                    'placeholder': placeholder,
+                }
+            ))
+            cache.set(key, cached, settings.PROJECT_BODY_CACHE_TIMEOUT)
+        return cached
+
+    def get_context_data(self, **kwargs):
+        context = super(ProjectDetailView, self).get_context_data(**kwargs)
+        # Ids of the positions the current user has already applied for.
+        applied_positions = set(
+            models.Application.objects.filter(
+                applicant=self.request.user,
+                position__project=self.object,
+            ).values_list('position_id', flat=True)
+        )
+        token = get_token(self.request)
+
+        def fill(match):
+            if match.group(1) is None:
+                return token
+            if int(match.group(1)) in applied_positions:
+                return 'disabled="disabled"'
+            return ''
+
+        placeholder, body = self.get_project_body()
+        body = re.sub(re.escape(placeholder) + r'(?::(\d+))?', fill, body)
+        context['project_body'] = mark_safe(body)
+        return context
+
 
 class ProjectUpdateView(LoginRequiredMixin, generic.UpdateView):
     """View to update a project."""
@@ -209,6 +325,14 @@ class ProjectUpdateView(LoginRequiredMixin, generic.UpdateView):
         else:
             return None
 
+    def get_position_queryset(self):
+        """Positions of the formset, with what their forms display."""
+        return models.Position.objects.select_related(
+            'role'
+        ).prefetch_related(
+            'related_skills'
+        )
+
     def get(self, request, *args, **kwargs):
         """
         Handles GET requests and instantiates prefilled versions of the form
@@ -218,6 +342,7 @@ class ProjectUpdateView(LoginRequiredMixin, generic.UpdateView):
         form = self.get_form()
         position_formset = forms.ProjectFormSet(
             instance=self.object,
+            queryset=self.get_position_queryset(),
         )
 
         return self.render_to_response(
@@ -235,6 +360,7 @@ class ProjectUpdateView(LoginRequiredMixin, generic.UpdateView):
         position_formset = forms.ProjectFormSet(
             self.request.POST,
             instance=self.object,
+            queryset=self.get_position_queryset(),
         )
 
         if form.is_valid() and position_formset.is_valid():
@@ -246,27 +372,30 @@ class ProjectUpdateView(LoginRequiredMixin, generic.UpdateView):
         """
         Called if all forms are valid. Updates or creates a Project instance
         along with associated Positions and then redirects to a success page.
+        Everything is saved in one transaction, so the listing is refreshed
+        once, after the commit.
         """
 
         self.object = self.get_object()
 
-        if self.object is not None:
-            form.save()
-        else:
-            self.object = form.save(commit=False)
-            self.object.owner = self.request.user
-            self.object.save()
+        with transaction.atomic():
+            if self.object is not None:
+                form.save()
+            else:
+                self.object = form.save(commit=False)
+                self.object.owner = self.request.user
+                self.object.save()
 
-        positions = position_formset.save(commit=False)
+            positions = position_formset.save(commit=False)
 
-        for position in positions:
-            position.project = self.object
-            position.save()
+            for position in positions:
+                position.project = self.object
+                position.save()
 
-        for position in position_formset.deleted_objects:
-            position.delete()
+            for position in position_formset.deleted_objects:
+                position.delete()
 
-        position_formset.save_m2m()
+            position_formset.save_m2m()
 
         return HttpResponseRedirect(self.get_success_url())
 
@@ -311,11 +440,22 @@ class ProjectDeleteView(LoginRequiredMixin, generic.DeleteView):
                             content_type='application/json')
 
 
-class UserProfileDetailView(LoginRequiredMixin, generic.DetailView):
+class UserProfileDetailView(ReplicaReadMixin, LoginRequiredMixin,
+                            ConditionalGetMixin, generic.DetailView):
     model = models.UserProfile
     template_name = 'projects/profile.html'
     login_url = reverse_lazy('accounts:sign-in')
 
+    def get_validator(self):
+        # The page lists the user's own projects and the projects with
+        # positions of the user.
+        return self.model.objects.filter(
+            pk=self.kwargs['pk']
+        ).annotate(
+            owned=Max('user__projects__updated_at'),
+            worked=Max('user__positions__project__updated_at'),
+        ).values_list('updated_at', 'owned', 'worked').first()
+
     def get_queryset(self):
         queryset = models.UserProfile.objects.all().select_related(
             'user',
@@ -371,6 +511,10 @@ class UserProfileUpdateView(LoginRequiredMixin, generic.UpdateView):
         obj = queryset.get(user=user)
         return obj
 
+    def get_skill_queryset(self):
+        """Skills of the formset, with their names."""
+        return models.UserProfileSkill.objects.select_related('skill')
+
     def get(self, request, *args, **kwargs):
         """
         Handles GET requests and instantiates prefilled versions of the form
@@ -378,7 +522,10 @@ class UserProfileUpdateView(LoginRequiredMixin, generic.UpdateView):
         """
         self.object = self.get_object()
         form = self.get_form()
-        skill_formset = forms.UserProfileSkillFormSet(instance=self.object)
+        skill_formset = forms.UserProfileSkillFormSet(
+            instance=self.object,
+            queryset=self.get_skill_queryset(),
+        )
         return self.render_to_response(
             self.get_context_data(form=form,
                                   skill_formset=skill_formset))
@@ -394,6 +541,7 @@ class UserProfileUpdateView(LoginRequiredMixin, generic.UpdateView):
         skill_formset = forms.UserProfileSkillFormSet(
             self.request.POST,
             instance=self.object,
+            queryset=self.get_skill_queryset(),
         )
 
         if form.is_valid() and skill_formset.is_valid():
@@ -405,30 +553,64 @@ class UserProfileUpdateView(LoginRequiredMixin, generic.UpdateView):
         """
         Called if all forms are valid. Updates a UserProfile instance
         with the associated Skills and then redirects to a success page.
+        Skills are saved with a fixed number of queries.
         """
-        # Save UserProfileForm
-        form.save()
+        with transaction.atomic(), models.defer_skill_cleanup():
+            # Save UserProfileForm
+            form.save()
 
-        # For each skill form in the formset
-        for skill_form in skill_formset:
-            # If skill form is not in the deleted forms
-            if skill_form not in skill_formset.deleted_forms:
+            deleted_ids = []
+            skill_names = []
+            # For each skill form in the formset
+            for skill_form in skill_formset:
+                instance = skill_form.instance
+                # If skill form is in the deleted forms, delete its instance
+                if skill_form in skill_formset.deleted_forms:
+                    if instance.pk:
+                        deleted_ids.append(instance.pk)
                 # If there are data in the form
-                if skill_form.cleaned_data:
+                elif skill_form.cleaned_data:
+                    skill_name = skill_form.cleaned_data['skill_name']
                     # If the form instance has a pk but no skill name data,
                     # delete form instance
-                    if skill_form.instance.pk and (
-                            not skill_form.cleaned_data['skill_name']):
-                        skill_form.instance.delete()
-                    # Otherwise save the form
+                    if not skill_name:
+                        if instance.pk:
+                            deleted_ids.append(instance.pk)
+                    # Otherwise save the skill
                     else:
-                        skill_form.save()
-            # If skill form is in the deleted forms
-            else:
-                # If there is an instance associated with the form, delete
-                # form instance
-                if skill_form.instance.pk:
-                    skill_form.instance.delete()
+                        skill_names.append((instance, skill_name))
+
+            skills = models.Skill.objects.get_or_create_names(
+                [skill_name for instance, skill_name in skill_names])
+            new_skills = []
+            changed_skills = {}
+            released_skill_ids = []
+            for instance, skill_name in skill_names:
+                skill = skills[skill_name.lower()]
+                if not instance.pk:
+                    new_skills.append(models.UserProfileSkill(
+                        user_profile=self.object,
+                        skill=skill,
+                    ))
+                elif instance.skill_id != skill.id:
+                    changed_skills[instance.pk] = skill.id
+                    released_skill_ids.append(instance.skill_id)
+
+            models.UserProfileSkill.objects.bulk_create(new_skills)
+            if changed_skills:
+                models.UserProfileSkill.objects.filter(
+                    id__in=changed_skills.keys()
+                ).update(skill=Case(
+                    *[When(id=pk, then=Value(skill_id))
+                      for pk, skill_id in changed_skills.items()],
+                    output_field=IntegerField()
+                ))
+            models.UserProfileSkill.objects.filter(
+                id__in=deleted_ids
+            ).delete()
+            # Delete the replaced skills nobody uses any more.
+            models.release_skills(released_skill_ids)
+
         messages.success(request, 'User Profile successfully saved.')
         return HttpResponseRedirect(self.get_success_url())
 
@@ -463,35 +645,42 @@ class CreateApplicationView(LoginRequiredMixin, generic.View):
         return {'application': application}
 
     def send_email(self, application):
-        """Send email."""
+        """Queue email to the project owner."""
         context = self.get_email_context(application)
-        subject = render_to_string(self.email_subject_template, context)
-        # Force subject to a single line to avoid header-injection issues.
-        subject = ''.join(subject.splitlines())
-        message = render_to_string(self.email_body_template, context)
-
-        email = EmailMessage(
+        subject, message = mail.render_email(self.email_subject_template,
+                                             self.email_body_template,
+                                             context)
+        mail.queue_email(
             subject=subject,
             body=message,
-            to=(application.position.project.owner.email,)
+            to=(application.position.project.owner.email,),
+            dedupe_key='new-application-{}'.format(application.id),
         )
-        email.send()
 
     def post(self, request, *args, **kwargs):
         form = self.form_class(data=request.POST, request=request)
         if form.is_valid():
 
-            application = form.save(commit=False)
-            application.applicant = request.user
-            application.save()
+            try:
+                with transaction.atomic():
+                    application = form.save(commit=False)
+                    application.applicant = request.user
+                    application.save()
+
+                    self.send_email(application)
+            except IntegrityError:
+                # A concurrent request has already created the application.
+                messages.error(
+                    request,
+                    'You have already applied for this position.'
+                )
+                return HttpResponseRedirect(self.get_success_url())
 
             messages.success(
                 request,
                 ('You have successfully applied for ' +
                  application.position.role.name + ' position.')
             )
-
-            self.send_email(application)
         else:
             messages.error(
                 request,
@@ -507,44 +696,102 @@ class ApplicationsListView(LoginRequiredMixin, generic.ListView):
     context_object_name = 'applications'
     paginate_by = 20
     login_url = reverse_lazy('accounts:sign-in')
+    statuses = (
+        ('new applications', 'n'),
+        ('accepted', 'a'),
+        ('rejected', 'r'),
+    )
+
+    def get_status_term(self):
+        """Returns the status value to filter by or None."""
+        status = self.request.GET.get('status')
+        if not status:
+            return None
+        return dict(self.statuses).get(status, '')
+
+    def get_counts(self):
+        """
+        Counts the owner's applications per project, per role and per status
+        with one grouped query. Each count takes the other two filters into
+        account. The number of new applications is the sum of the positions'
+        new_application_count counters. Returns project names, role names of
+        the filtered project and the counts.
+        """
+        rows = models.Position.objects.filter(
+            project__owner=self.request.user
+        ).values_list(
+            'id',
+            'new_application_count',
+            'project__name',
+            'role__name',
+            'applications__status',
+        ).annotate(
+            count=Count('applications')
+        ).order_by()
+
+        project = (self.request.GET.get('project') or '').lower()
+        position = (self.request.GET.get('position') or '').lower()
+        term = self.get_status_term()
+        labels = {value: label for label, value in self.statuses}
+
+        projects, needs = [], []
+        project_counts, need_counts, status_counts = (Counter(), Counter(),
+                                                      Counter())
+        new_counts = {}
+        for (position_id, new_count, project_name, role_name, status,
+             count) in rows:
+            new_counts[position_id] = new_count
+            project_name = project_name.lower()
+            role_name = (role_name or '').lower()
+            in_project = not project or project_name == project
+            in_position = not position or role_name == position
+            in_status = term is None or status == term
+
+            projects.append(project_name)
+            if in_project:
+                needs.append(role_name)
+            if status is None:
+                # Position without applications.
+                continue
+            if in_position and in_status:
+                project_counts[project_name] += count
+                project_counts['all projects'] += count
+            if in_project and in_status:
+                need_counts[role_name] += count
+                need_counts['all needs'] += count
+            if in_project and in_position:
+                status_counts[labels[status]] += count
+                status_counts['all applications'] += count
+
+        return {
+            'projects': projects,
+            'needs': needs,
+            'project_counts': project_counts,
+            'need_counts': need_counts,
+            'status_counts': status_counts,
+            'new_applications': sum(new_counts.values()),
+        }
 
     def get_context_data(self, **kwargs):
         context = super(ApplicationsListView, self).get_context_data()
+        counts = self.get_counts()
+        context.update(counts)
 
         # Get projects
-        projects = models.Project.objects.filter(
-            owner=self.request.user
-        ).values_list('name', flat=True)
         context['projects'] = context_from_values_list(
-            initial_list=projects,
+            initial_list=counts['projects'],
             additional_value='all projects'
         )
 
         # Get project needs
-        project = self.request.GET.get('project')
-        if project:
-            queryset = models.Project.objects.filter(
-                owner=self.request.user,
-                name__iexact=project,
-            )
-        else:
-            queryset = models.Project.objects.filter(owner=self.request.user)
-
-        positions = models.Position.objects.filter(
-            project__in=queryset
-        ).values_list('role__name', flat=True)
         context['needs'] = context_from_values_list(
-            initial_list=positions,
+            initial_list=counts['needs'],
             additional_value='all needs'
         )
 
         # Get statuses
-        context['statuses'] = [
-            'all applications',
-            'new applications',
-            'accepted',
-            'rejected',
-        ]
+        context['statuses'] = ['all applications'] + [
+            label for label, value in self.statuses]
 
         # Get position to filter by
         if not self.request.GET.get('position'):
@@ -571,8 +818,7 @@ class ApplicationsListView(LoginRequiredMixin, generic.ListView):
             position__project__owner=self.request.user
         ).select_related(
             'applicant',
-            'applicant__userprofile'
-        ).prefetch_related(
+            'applicant__userprofile',
             'position',
             'position__role',
             'position__project'
@@ -582,27 +828,17 @@ class ApplicationsListView(LoginRequiredMixin, generic.ListView):
             position = self.request.GET.get('position')
             queryset = queryset.filter(
                 position__role__name__iexact=position
-            ).distinct()
+            )
 
         if self.request.GET.get('project'):
             project = self.request.GET.get('project')
             queryset = queryset.filter(
                 position__project__name__iexact=project
-            ).distinct()
+            )
 
-        if self.request.GET.get('status'):
-            status = self.request.GET.get('status')
-            if status:
-                term = ''
-                if status == 'new applications':
-                    term = 'n'
-                elif status == 'accepted':
-                    term = 'a'
-                elif status == 'rejected':
-                    term = 'r'
-                queryset = queryset.filter(
-                    status=term
-                ).distinct()
+        term = self.get_status_term()
+        if term is not None:
+            queryset = queryset.filter(status=term)
 
         return queryset
 
@@ -634,123 +870,224 @@ class ApplicationsUpdateView(LoginRequiredMixin, generic.View):
         """Build the template context used for the email."""
         return {'application': application, 'status': status}
 
-    def send_email(self, application, status):
-        """Send email."""
+    def get_email(self, application, status):
+        """Build the email to the applicant."""
         context = self.get_email_context(application, status)
-        subject = render_to_string(self.email_subject_template, context)
-        # Force subject to a single line to avoid header-injection issues.
-        subject = ''.join(subject.splitlines())
-        message = render_to_string(self.email_body_template, context)
+        subject, message = mail.render_email(self.email_subject_template,
+                                             self.email_body_template,
+                                             context)
+        return {
+            'subject': subject,
+            'body': message,
+            'to': (application.applicant.email,),
+            'dedupe_key': 'application-{}-{}'.format(application.id, status),
+        }
 
-        email = EmailMessage(
-            subject=subject,
-            body=message,
-            to=(application.applicant.email,)
+    def send_email(self, application, status):
+        """Queue email to the applicant."""
+        mail.queue_emails([self.get_email(application, status)])
+
+    def get_queryset(self):
+        """Applications to the current user's projects, with everything
+        needed for emails and flash messages joined in."""
+        return self.model.objects.filter(
+            position__project__owner=self.request.user
+        ).select_related(
+            'applicant',
+            'applicant__userprofile',
+            'position',
+            'position__role',
+            'position__project',
         )
-        email.send()
 
     def get_object(self, pk):
         try:
-            obj = self.model.objects.get(
-                id=pk,
-                position__project__owner=self.request.user
-            )
-        except self.model.DoesNotExist():
+            obj = self.get_queryset().get(id=pk)
+        except (self.model.DoesNotExist, ValueError):
             raise Http404
         else:
             return obj
 
     def send_push_notification(self, application, status):
-        """Send push notification regarding the application status update."""
+        """Queue push notification regarding the application status update.
+        The notification is sent by the dispatcher after the transaction
+        commits."""
         context = self.get_email_context(application, status)
         subject = render_to_string(self.notification_subject_template, context)
         # Force subject to a single line to avoid header-injection issues.
         subject = ''.join(subject.splitlines())
         message = render_to_string(self.notification_body_template, context)
 
-        push = Pusher(
-            app_id=settings.PUSHER_APP_ID,
-            key=settings.PUSHER_KEY,
-            secret=settings.PUSHER_SECRET,
-            host=settings.PUSHER_HOST,
-        )
-
-        push.trigger(
+        notifications.dispatcher.push(
             'team-builder-'+str(application.applicant.id),
             'new_notification',
             {'title': subject, 'message': message}
         )
 
-    def post(self, request, *args, **kwargs):
-        status = self.kwargs.get('status')
-        pk = self.request.POST.get('id')
-        application = self.get_object(pk=pk)
+    def accept(self, applications):
+        """
+        Accepts applications: sets the applicants as position users and
+        rejects the rest of not yet rejected applications for the same
+        positions. Only the first application per position is accepted.
+        Returns a list of (application, status) pairs to notify.
+        """
+        accepted = {}
+        for application in applications:
+            accepted.setdefault(application.position_id, application)
+        accepted_ids = [app.id for app in accepted.values()]
+
+        # Set status rejected for the rest of not yet rejected applications
+        # for the same positions.
+        rejected = list(self.get_queryset().filter(
+            ~Q(id__in=accepted_ids),
+            ~Q(status='r'),
+            position__in=accepted.keys(),
+        ))
+
+        # Counter changes: filled positions and handled new applications.
+        open_positions = Counter()
+        new_applications = Counter()
+        for app in accepted.values():
+            if app.position.user_id is None:
+                open_positions[app.position.project_id] -= 1
+        for app in list(accepted.values()) + rejected:
+            if app.status == 'n':
+                new_applications[app.position_id] -= 1
+
+        # Update status of the applications
+        self.model.objects.filter(id__in=accepted_ids).update(status='a')
+        self.model.objects.filter(
+            id__in=[app.id for app in rejected]
+        ).update(status='r')
+
+        # Update positions (add a user to every position)
+        models.Position.objects.filter(id__in=accepted.keys()).update(
+            user=Case(
+                *[When(id=position_id, then=Value(app.applicant_id))
+                  for position_id, app in accepted.items()],
+                output_field=IntegerField()
+            )
+        )
+        models.Position.objects.adjust_application_counts(
+            new=new_applications)
+        models.Project.objects.adjust_open_positions(open_positions)
+        # The queryset updates do not update the pages of the projects and
+        # of the former and new position users.
+        models.touch(
+            project_ids=[app.position.project_id
+                         for app in list(accepted.values()) + rejected],
+            position_ids=accepted.keys(),
+            user_ids=([app.position.user_id for app in accepted.values()] +
+                      [app.applicant_id for app in accepted.values()]),
+        )
 
+        for app in accepted.values():
+            app.status = 'a'
+            app.position.user_id = app.applicant_id
+        for app in rejected:
+            app.status = 'r'
+
+        return ([(app, 'accept') for app in accepted.values()] +
+                [(app, 'reject') for app in rejected])
+
+    def reject(self, applications):
+        """
+        Rejects applications. If an applicant was before accepted, i.e. was
+        set as a position user, the position user is set to NULL.
+        Returns a list of (application, status) pairs to notify.
+        """
+        open_positions = Counter()
+        new_applications = Counter()
+        for app in applications:
+            if app.position.user_id == app.applicant_id:
+                open_positions[app.position.project_id] += 1
+            if app.status == 'n':
+                new_applications[app.position_id] -= 1
+
+        self.model.objects.filter(
+            id__in=[app.id for app in applications]
+        ).update(status='r')
+
+        models.Position.objects.filter(
+            reduce(operator.or_, [
+                Q(id=app.position_id, user_id=app.applicant_id)
+                for app in applications
+            ])
+        ).update(user=None)
+        models.Position.objects.adjust_application_counts(
+            new=new_applications)
+        models.Project.objects.adjust_open_positions(open_positions)
+        removed = [app for app in applications
+                   if app.position.user_id == app.applicant_id]
+        models.touch(
+            project_ids=[app.position.project_id for app in applications],
+            position_ids=[app.position_id for app in removed],
+            user_ids=[app.applicant_id for app in removed],
+        )
+
+        for app in applications:
+            app.status = 'r'
+            if app.position.user_id == app.applicant_id:
+                app.position.user_id = None
+
+        return [(app, 'reject') for app in applications]
+
+    def lock(self, applications):
+        """
+        Locks the positions of the applications and returns the
+        applications read again, in the same order. Concurrent updates of
+        the same positions wait for each other, so the statuses and position
+        users the counter changes are derived from are current.
+        """
+        list(models.Position.objects.select_for_update().filter(
+            id__in={app.position_id for app in applications}
+        ).order_by('id').values_list('id'))
+        current = self.get_queryset().in_bulk([app.id for app in applications])
+        return [current[app.id] for app in applications if app.id in current]
+
+    def has_status(self, application, status):
+        """Returns True if the application is accepted, with the applicant
+        as position user, or rejected, without, already."""
+        is_user = application.position.user_id == application.applicant_id
         if status == 'accept':
-            # Update status of the application
-            application.status = 'a'
-            application.save()
-
-            # Update position (add a user to the position)
-            position = application.position
-            position.user = application.applicant
-            position.save()
-
-            # Set status rejected for the rest of not yet rejected applications
-            # for the same position.
-            applications = models.Application.objects.filter(
-                ~Q(id=pk),
-                ~Q(status='r'),
-                position=position,
-            )
+            return application.status == 'a' and is_user
+        return application.status == 'r' and not is_user
 
-            for app in applications:
-                app.status = 'r'
-                app.save()
-
-                # Send email to all rejected applicants
-                self.send_email(application=app, status='reject')
-
-                # Send push notification to the applicant
-                if settings.USE_PUSHER:
-                    self.send_push_notification(
-                        application=app,
-                        status='reject'
-                    )
-
-        elif status == 'reject':
-            # Update status of the application
-            application.status = 'r'
-            application.save()
-
-            # If this application was before accepted, i.e. if the applicant
-            # was set as a position user, set position user to NULL
-            position = application.position
-            if position.user and position.user == application.applicant:
-                position.user = None
-                position.save()
+    def update_applications(self, applications, status):
+        """
+        Accepts or rejects the applications and notifies the applicants. The
+        number of queries does not depend on the number of applications.
+        Project.active is derived from Project.open_positions. Applications
+        that have the status already are skipped. Returns the list of
+        (application, status) pairs of the changed applications.
+        """
+        with transaction.atomic():
+            applications = [app for app in self.lock(applications)
+                            if not self.has_status(app, status)]
+            if not applications:
+                return []
+            if status == 'accept':
+                notified = self.accept(applications)
+            else:
+                notified = self.reject(applications)
 
-        # Check whether the project is still active (has unfilled positions)
-        # and mark appropriately.
-        project = application.position.project
-        unfilled_positions = 0
-        for pos in project.positions.all():
-            if not pos.user:
-                unfilled_positions += 1
+            # Send emails to the applicants
+            mail.queue_emails([self.get_email(app, app_status)
+                               for app, app_status in notified])
 
-        if unfilled_positions and not project.active:
-            project.active = True
-            project.save()
-        elif not unfilled_positions and project.active:
-            project.active = False
-            project.save()
+            # Send push notifications to the applicants
+            if settings.USE_PUSHER:
+                for app, app_status in notified:
+                    self.send_push_notification(application=app,
+                                                status=app_status)
+        return notified
 
-        # Send email to the applicant
-        self.send_email(application=application, status=status)
+    def post(self, request, *args, **kwargs):
+        status = self.kwargs.get('status')
+        pk = self.request.POST.get('id')
+        application = self.get_object(pk=pk)
 
-        # Send push notification to the applicant
-        if settings.USE_PUSHER:
-            self.send_push_notification(application=application, status=status)
+        self.update_applications([application], status)
 
         # Flash message
         flash_message = (application.applicant.userprofile.full_name +
@@ -762,3 +1099,38 @@ class ApplicationsUpdateView(LoginRequiredMixin, generic.View):
         messages.success(request, flash_message)
 
         return HttpResponseRedirect(self.get_success_url())
+
+
+class ApplicationsBulkUpdateView(ApplicationsUpdateView):
+    """View to accept or reject several applications at once. Applications
+    are accepted in the order they were made, so of several selected
+    applications for a position the earliest one is accepted."""
+
+    def post(self, request, *args, **kwargs):
+        status = self.kwargs.get('status')
+        ids = [pk for pk in self.request.POST.getlist('ids') if pk.isdigit()]
+        applications = list(self.get_queryset().filter(
+            id__in=ids).order_by('id'))
+
+        if not applications:
+            messages.error(request, 'No applications were selected.')
+            return HttpResponseRedirect(self.get_success_url())
+
+        notified = self.update_applications(applications, status)
+        counts = Counter(app_status for app, app_status in notified)
+        if not counts[status]:
+            messages.info(
+                request,
+                'The selected applications have been {}ed already.'.format(
+                    status)
+            )
+        else:
+            flash_message = '{} application(s) have been {}ed.'.format(
+                counts[status], status)
+            if status == 'accept' and counts['reject']:
+                flash_message += (
+                    ' {} other application(s) for the same positions have '
+                    'been rejected.'.format(counts['reject']))
+            messages.success(request, flash_message)
+
+        return HttpResponseRedirect(self.get_success_url())
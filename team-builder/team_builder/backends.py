@@ -0,0 +1,23 @@
+"""
+Authentication backends.
+
+``ProfileModelBackend`` loads the session's user with the profile that
+``layout.html`` shows in one query. Django's ``ModelBackend`` stays in
+AUTHENTICATION_BACKENDS for sessions that logged in with it.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+class ProfileModelBackend(ModelBackend):
+    # Relations of the user loaded with it.
+    related = ('userprofile',)
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related(
+                *self.related).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,75 @@
+"""
+Backport of Django 2.0's ``connection.execute_wrapper()``.
+
+Wrappers are called as ``wrapper(execute, sql, params, many, context)`` for
+every query run on the connection while the context manager is active.
+"""
+import functools
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends import utils
+
+
+class WrappedCursorMixin(object):
+    """Passes queries through the execute wrappers of the connection."""
+
+    def execute(self, sql, params=None):
+        if not self.db.execute_wrappers:
+            return super(WrappedCursorMixin, self).execute(sql, params)
+        return self._execute_with_wrappers(
+            sql, params, False, super(WrappedCursorMixin, self).execute)
+
+    def executemany(self, sql, param_list):
+        if not self.db.execute_wrappers:
+            return super(WrappedCursorMixin, self).executemany(sql,
+                                                               param_list)
+        return self._execute_with_wrappers(
+            sql, param_list, True,
+            super(WrappedCursorMixin, self).executemany)
+
+    def _execute_with_wrappers(self, sql, params, many, execute):
+        def executor(sql, params, many, context):
+            return execute(sql, params)
+
+        context = {'connection': self.db, 'cursor': self}
+        for wrapper in reversed(self.db.execute_wrappers):
+            executor = functools.partial(wrapper, executor)
+        return executor(sql, params, many, context)
+
+
+class CursorWrapper(WrappedCursorMixin, utils.CursorWrapper):
+    pass
+
+
+class CursorDebugWrapper(WrappedCursorMixin, utils.CursorDebugWrapper):
+    pass
+
+
+def install(connection):
+    """Makes the cursors of a connection run its execute wrappers."""
+    if hasattr(connection, 'execute_wrappers'):
+        return
+    connection.execute_wrappers = []
+    connection.make_cursor = functools.partial(CursorWrapper,
+                                               db=connection)
+    connection.make_debug_cursor = functools.partial(CursorDebugWrapper,
+                                                     db=connection)
+
+
+@contextmanager
+def execute_wrapper(wrapper, using=None):
+    """Runs wrapper around every query of the current thread's connections
+    (or only the ``using`` connection) inside the block."""
+    if using is None:
+        wrapped = connections.all()
+    else:
+        wrapped = [connections[using]]
+    for connection in wrapped:
+        install(connection)
+        connection.execute_wrappers.append(wrapper)
+    try:
+        yield
+    finally:
+        for connection in wrapped:
+            connection.execute_wrappers.remove(wrapper)
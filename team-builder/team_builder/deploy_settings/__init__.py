@@ -1,3 +1,5 @@
+import os
+
 import dj_database_url
 
 from team_builder.settings import *
@@ -5,6 +7,36 @@ from team_builder.settings import *
 DEBUG = False
 TEMPLATE_DEBUG = DEBUG
 
+# The debug toolbar is only used in development.
+INSTALLED_APPS.remove('debug_toolbar')
+MIDDLEWARE.remove('team_builder.middleware.AtopdedTo110DebugMiddleware')
+
+SERVER_TIMING_SAMPLE_RATE = 0.1
+SERVER_TIMING_HEADER = False
+
+# Only applies if DATABASE_URL points at an SQLite file.
+SQLITE_TUNING = True
+
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '/tmp/profiles')
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'team_builder.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 ALLOWED_HOSTS = [
     'localhost',
     '.herokuapp.com',
@@ -15,4 +47,12 @@ SECRET_KEY = get_env_variable('SECRET_KEY')
 db_from_env = dj_database_url.config()
 DATABASES['default'].update(db_from_env)
 
+# Read replicas as a comma separated list of database URLs.
+del DATABASES['replica']
+for number, url in enumerate(
+        filter(None, os.environ.get('REPLICA_DATABASE_URLS', '').split(','))):
+    alias = 'replica{}'.format(number)
+    DATABASES[alias] = dj_database_url.parse(url)
+    DATABASE_REPLICAS.append(alias)
+
 STATICFILES_STORAGE = "whitenoise.django.GzipManifestStaticFilesStorage"
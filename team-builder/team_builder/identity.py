@@ -0,0 +1,155 @@
+"""
+Request-scoped identity map.
+
+Inside ``identity_map()`` blocks, every instance of the IDENTITY_MAP_MODELS
+that is loaded or saved is remembered by primary key and one-to-one fields.
+Foreign keys and reverse one-to-one relations to these models look there
+before querying, so related lookups fetch each object once per block and
+return the same instance wherever it was loaded. ``IdentityMapMiddleware``
+wraps every request in a block.
+
+Querysets still query, and update() does not change remembered instances.
+Code that reads rows it changed with update() should reload them.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db.models.fields.related_descriptors import (
+    ForwardManyToOneDescriptor, ReverseOneToOneDescriptor,
+)
+from django.db.models.signals import post_delete, post_init, post_save
+
+
+_local = threading.local()
+
+
+class IdentityMap(object):
+    """Instances of one block by (model label, attname, value), with the
+    number of instances loaded and of fetches avoided."""
+
+    def __init__(self):
+        self.instances = {}
+        self.loaded = 0
+        self.hits = 0
+
+    def keys(self, instance):
+        opts = instance._meta
+        return [(opts.label, field.attname, getattr(instance, field.attname))
+                for field in opts.concrete_fields
+                if field.primary_key or field.one_to_one]
+
+    def add(self, instance):
+        self.loaded += 1
+        # The last loaded instance is the freshest.
+        for key in self.keys(instance):
+            self.instances[key] = instance
+
+    def discard(self, instance):
+        # Other instances of a deleted row are gone as well.
+        for key in self.keys(instance):
+            self.instances.pop(key, None)
+
+    def get(self, model, attname, value):
+        instance = self.instances.get((model._meta.label, attname, value))
+        if instance is not None:
+            self.hits += 1
+        return instance
+
+    def stats(self):
+        return {'loaded': self.loaded, 'hits': self.hits}
+
+
+def get_current():
+    """Returns the IdentityMap of the current thread, or None outside
+    identity_map() blocks."""
+    return getattr(_local, 'identity_map', None)
+
+
+@contextmanager
+def identity_map():
+    """Remembers the instances loaded inside the block and yields the
+    IdentityMap."""
+    previous = get_current()
+    _local.identity_map = IdentityMap()
+    try:
+        yield _local.identity_map
+    finally:
+        _local.identity_map = previous
+
+
+class IdentityMapForwardDescriptor(ForwardManyToOneDescriptor):
+    """Foreign key accessor that looks in the identity map first."""
+
+    def __get__(self, instance, cls=None):
+        identities = get_current()
+        if (instance is not None and identities is not None and
+                not hasattr(instance, self.cache_name)):
+            value = getattr(instance, self.field.attname)
+            related = None
+            if value is not None:
+                related = identities.get(self.field.related_model,
+                                         self.field.target_field.attname,
+                                         value)
+            if related is not None:
+                setattr(instance, self.cache_name, related)
+                if not self.field.remote_field.multiple:
+                    setattr(related, self.field.remote_field.get_cache_name(),
+                            instance)
+        return super(IdentityMapForwardDescriptor, self).__get__(instance, cls)
+
+
+class IdentityMapReverseOneToOneDescriptor(ReverseOneToOneDescriptor):
+    """Reverse one-to-one accessor that looks in the identity map first."""
+
+    def __get__(self, instance, cls=None):
+        identities = get_current()
+        if (instance is not None and identities is not None and
+                not hasattr(instance, self.cache_name)):
+            field = self.related.field
+            related = identities.get(
+                self.related.related_model, field.attname,
+                getattr(instance, field.target_field.attname))
+            if related is not None:
+                setattr(instance, self.cache_name, related)
+                setattr(related, field.get_cache_name(), instance)
+        return super(IdentityMapReverseOneToOneDescriptor, self).__get__(
+            instance, cls)
+
+
+def remember(sender, instance, **kwargs):
+    identities = get_current()
+    if (identities is not None and instance.pk is not None and
+            not instance.get_deferred_fields()):
+        identities.add(instance)
+
+
+def forget(sender, instance, **kwargs):
+    identities = get_current()
+    if identities is not None:
+        identities.discard(instance)
+
+
+def install(model_labels):
+    """Remembers the instances of the models and replaces the accessors of
+    relations to them."""
+    tracked = {apps.get_model(label) for label in model_labels}
+    for model in tracked:
+        uid = 'team_builder.identity.' + model._meta.label
+        post_init.connect(remember, sender=model, dispatch_uid=uid)
+        post_save.connect(remember, sender=model, dispatch_uid=uid)
+        post_delete.connect(forget, sender=model, dispatch_uid=uid)
+        for field in model._meta.concrete_fields:
+            if field.one_to_one and not field.remote_field.is_hidden():
+                setattr(field.related_model,
+                        field.remote_field.get_accessor_name(),
+                        IdentityMapReverseOneToOneDescriptor(
+                            field.remote_field))
+
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if (field.is_relation and field.related_model in tracked and
+                    type(model.__dict__.get(field.name)) is
+                    ForwardManyToOneDescriptor):
+                setattr(model, field.name,
+                        IdentityMapForwardDescriptor(field))
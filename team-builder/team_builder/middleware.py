@@ -1,6 +1,267 @@
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.base import Template
 from django.utils.deprecation import MiddlewareMixin
-from debug_toolbar.middleware import DebugToolbarMiddleware
+from django.utils.functional import SimpleLazyObject
+
+from . import db
+from . import identity
+from . import profiling
+from . import routers
+from . import slow_queries
+from . import user_cache
+
+try:
+    from debug_toolbar.middleware import DebugToolbarMiddleware
+except ImportError:
+    # The toolbar is only installed for development.
+    DebugToolbarMiddleware = None
+
+
+logger = logging.getLogger('team_builder.timing')
+
+_local = threading.local()
+
+
+if DebugToolbarMiddleware is not None:
+    class AtopdedTo110DebugMiddleware(MiddlewareMixin, DebugToolbarMiddleware):
+        pass
+
+
+class RequestTimings(object):
+    """Query count, SQL time and template time of one request, in
+    seconds."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.view_start = None
+        self.view = None
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper timing every query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - start
+            self.queries += 1
+
+
+def _timed_render(render):
+    def timed_render(template, context):
+        timings = getattr(_local, 'timings', None)
+        if timings is None:
+            return render(template, context)
+        # Included and extended templates are part of the outer render.
+        timings._template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(template, context)
+        finally:
+            timings._template_depth -= 1
+            if not timings._template_depth:
+                timings.template += time.perf_counter() - start
+    timed_render.timed = True
+    return timed_render
+
+
+class ServerTimingMiddleware(object):
+    """Measures the query count, SQL, template, view and total time of
+    sampled requests. Logs them as JSON to the team_builder.timing logger and
+    adds a Server-Timing header if SERVER_TIMING_HEADER is set.
+
+    SERVER_TIMING_SAMPLE_RATE is the share of requests measured (0 to 1).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(Template.render, 'timed', False):
+            Template.render = _timed_render(Template.render)
+
+    def __call__(self, request):
+        rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 1.0)
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+
+        timings = _local.timings = RequestTimings()
+        start = time.perf_counter()
+        try:
+            with db.execute_wrapper(timings):
+                response = self.get_response(request)
+        finally:
+            _local.timings = None
+        end = time.perf_counter()
+        total = end - start
+        if timings.view_start is not None:
+            # Time from the view call to the rendered response, without the
+            # template rendering.
+            timings.view = end - timings.view_start - timings.template
+
+        identities = getattr(request, 'identity_map', None)
+        if getattr(settings, 'SERVER_TIMING_HEADER', False):
+            response['Server-Timing'] = self.header(timings, total,
+                                                    identities)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.queries,
+            'sql_ms': round(timings.sql * 1000, 2),
+            'template_ms': round(timings.template * 1000, 2),
+            'view_ms': (round(timings.view * 1000, 2)
+                        if timings.view is not None else None),
+            'total_ms': round(total * 1000, 2),
+            'identity_map_hits': (identities.hits
+                                  if identities is not None else None),
+        }, sort_keys=True))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings.view_start = time.perf_counter()
+
+    def header(self, timings, total, identities=None):
+        """Formats the timings as a Server-Timing header value."""
+        metrics = [
+            'sql;dur={:.2f};desc="{} queries"'.format(timings.sql * 1000,
+                                                      timings.queries),
+            'tpl;dur={:.2f}'.format(timings.template * 1000),
+        ]
+        if timings.view is not None:
+            metrics.append('view;dur={:.2f}'.format(timings.view * 1000))
+        metrics.append('total;dur={:.2f}'.format(total * 1000))
+        if identities is not None:
+            metrics.append('idmap;desc="{} fetches avoided"'.format(
+                identities.hits))
+        return ', '.join(metrics)
+
+
+class IdentityMapMiddleware(object):
+    """Wraps requests in an identity map block of team_builder.identity and
+    sets request.identity_map to its IdentityMap, whose hits count the
+    fetches avoided. Disabled if IDENTITY_MAP_MODELS is empty."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'IDENTITY_MAP_MODELS', ()):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity.identity_map() as identities:
+            request.identity_map = identities
+            return self.get_response(request)
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware that loads request.user with
+    team_builder.user_cache, from the cache if possible."""
+
+    def process_request(self, request):
+        super(CachedAuthenticationMiddleware, self).process_request(request)
+        request.user = SimpleLazyObject(lambda: self.get_user(request))
+
+    def get_user(self, request):
+        if not hasattr(request, '_cached_user'):
+            request._cached_user = user_cache.get_user(request)
+        return request._cached_user
+
+
+class ReplicaStickinessMiddleware(object):
+    """Sets the sticky cookie of team_builder.routers on responses to
+    writing requests, so the client reads from the primary database for the
+    next REPLICA_STICKY_SECONDS. Disabled if there are no DATABASE_REPLICAS.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(
+                routers.STICKY_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 10),
+                httponly=True)
+        return response
+
+
+class SlowQueryLogMiddleware(object):
+    """Logs queries slower than SLOW_QUERY_THRESHOLD milliseconds to
+    SLOW_QUERY_LOG_FILE. Disabled if SLOW_QUERY_THRESHOLD is None."""
+
+    def __init__(self, get_response):
+        threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD', None)
+        if threshold is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.log = slow_queries.SlowQueryLog(threshold,
+                                             settings.SLOW_QUERY_LOG_FILE)
+
+    def __call__(self, request):
+        slow_queries.set_view(None)
+        with db.execute_wrapper(self.log):
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        slow_queries.set_view('{}.{}'.format(view.__module__,
+                                             view.__name__))
+
+
+class ProfilingMiddleware(object):
+    """Profiles single requests on demand. A request is profiled if its
+    X-Profile header matches PROFILING_TOKEN, or if a staff user adds
+    ?profile=1 to the URL. The pstats file, collapsed stacks and request
+    details are saved in PROFILING_DIR under an id returned in the X-Profile-Id
+    response header. Disabled if PROFILING_DIR is None.
+
+    PROFILING_INTERVAL is the sampling interval in seconds.
+    """
+
+    def __init__(self, get_response):
+        self.directory = getattr(settings, 'PROFILING_DIR', None)
+        if self.directory is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.token = getattr(settings, 'PROFILING_TOKEN', None)
+        self.interval = getattr(settings, 'PROFILING_INTERVAL', 0.001)
+
+    def __call__(self, request):
+        if not self.requested(request):
+            return self.get_response(request)
 
+        with profiling.RequestProfile(self.interval) as profile:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.view_name if match is not None else None
+        response['X-Profile-Id'] = profile.save(
+            self.directory, url_name or 'unresolved', {
+                'url_name': url_name,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'user': request.user.pk,
+            })
+        return response
 
-class AtopdedTo110DebugMiddleware(MiddlewareMixin, DebugToolbarMiddleware):
-    pass
+    def requested(self, request):
+        header = request.META.get('HTTP_X_PROFILE')
+        if header and self.token:
+            return hmac.compare_digest(header.encode(),
+                                       self.token.encode())
+        return (request.GET.get('profile') == '1' and
+                request.user.is_staff)
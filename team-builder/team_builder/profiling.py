@@ -0,0 +1,98 @@
+"""
+Request profiling.
+
+``RequestProfile`` runs a block of code under cProfile and a sampling
+profiler at the same time. The cProfile statistics are saved as a pstats file
+(read it with ``python -m pstats`` or snakeviz) and the samples as collapsed
+stacks (``root;caller;function count`` lines), the input format of
+flamegraph.pl and speedscope.
+"""
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class StackSampler(object):
+    """Records the stack of one thread every interval seconds from a
+    background thread."""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Returns the samples as collapsed stack lines."""
+        return ''.join('{} {}\n'.format(stack, count)
+                       for stack, count in sorted(self.samples.items()))
+
+
+class RequestProfile(object):
+    """Context manager profiling the current thread with cProfile and a
+    StackSampler."""
+
+    def __init__(self, interval=0.001):
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.start
+
+    def save(self, directory, name, metadata):
+        """Writes <id>.prof, <id>.collapsed and <id>.json with metadata to
+        directory. The id is made of the current time and name. Returns the
+        id."""
+        os.makedirs(directory, exist_ok=True)
+        base = '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'),
+                              re.sub(r'[^\w.-]+', '-', name).strip('-'))
+        profile_id, suffix = base, 1
+        while os.path.exists(os.path.join(directory, profile_id + '.prof')):
+            suffix += 1
+            profile_id = '{}-{}'.format(base, suffix)
+        path = os.path.join(directory, profile_id)
+
+        self.profiler.dump_stats(path + '.prof')
+        with open(path + '.collapsed', 'w') as collapsed:
+            collapsed.write(self.sampler.collapsed())
+        metadata = dict(metadata, duration_ms=round(self.duration * 1000, 2),
+                        samples=sum(self.sampler.samples.values()))
+        with open(path + '.json', 'w') as output:
+            json.dump(metadata, output, indent=2, sort_keys=True)
+        return profile_id
@@ -0,0 +1,72 @@
+"""
+Read replicas.
+
+``ReplicaRouter`` sends reads to one of the DATABASE_REPLICAS aliases inside
+``replica_reads()`` blocks and everything else to the default database.
+Views opt in with ``ReplicaReadMixin``, which reads from a replica for GET
+and HEAD requests, unless the client wrote something in the last
+REPLICA_STICKY_SECONDS (see ``ReplicaStickinessMiddleware``) and could
+otherwise miss its own changes while replicas catch up.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Cookie set after a write to keep the client's reads on the primary.
+STICKY_COOKIE = 'use_primary'
+
+_local = threading.local()
+
+
+@contextmanager
+def replica_reads():
+    """Lets the router send the reads of the current thread to replicas
+    inside the block."""
+    previous = getattr(_local, 'replica_reads', False)
+    _local.replica_reads = True
+    try:
+        yield
+    finally:
+        _local.replica_reads = previous
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if (not replicas or not getattr(_local, 'replica_reads', False) or
+                # Reads inside a transaction must see its writes.
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadMixin(object):
+    """Reads from a replica for GET and HEAD requests of clients without the
+    sticky cookie. The response is rendered inside the replica block, as
+    templates evaluate most querysets."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD') or
+                STICKY_COOKIE in request.COOKIES):
+            return super(ReplicaReadMixin, self).dispatch(request, *args,
+                                                          **kwargs)
+        with replica_reads():
+            response = super(ReplicaReadMixin, self).dispatch(request, *args,
+                                                              **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
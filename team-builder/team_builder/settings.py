@@ -54,17 +54,22 @@ INSTALLED_APPS = [
     'debug_toolbar',
     'storages',
     'accounts',
-    'projects',
+    'projects.apps.ProjectsConfig',
 ]
 
 MIDDLEWARE = [
+    'team_builder.middleware.ServerTimingMiddleware',
+    'team_builder.middleware.SlowQueryLogMiddleware',
+    'team_builder.middleware.IdentityMapMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'team_builder.middleware.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'team_builder.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'team_builder.middleware.ProfilingMiddleware',
 ]
 MIDDLEWARE += ['team_builder.middleware.AtopdedTo110DebugMiddleware']
 
@@ -97,8 +102,42 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Local stand-in for a read replica, filled by the sync_replicas
+    # command. Tests read the default database through it.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# Aliases of the replicas that views with ReplicaReadMixin read from, e.g.
+# ['replica']. Clients read from the default database for
+# REPLICA_STICKY_SECONDS after a write.
+DATABASE_ROUTERS = ['team_builder.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_STICKY_SECONDS = 10
+
+# Tunes SQLite database files for concurrent requests, see
+# team_builder.sqlite. SQLITE_PRAGMAS overrides single PRAGMAs.
+SQLITE_TUNING = False
+SQLITE_PRAGMAS = {}
+SQLITE_MAINTENANCE_INTERVAL = 3600
+
+# The shared body of project pages is cached for
+# PROJECT_BODY_CACHE_TIMEOUT seconds per version of the project. Use a
+# shared cache such as memcached when running several processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
 }
+PROJECT_BODY_CACHE_TIMEOUT = 24 * 60 * 60
+# The logged in user and profile are cached for AUTH_USER_CACHE_TIMEOUT
+# seconds if the cache is shared between processes, see
+# team_builder.user_cache.
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
 
 AUTH_USER_MODEL = 'accounts.MyUser'
 
@@ -120,9 +159,12 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-# AUTHENTICATION_BACKENDS = (
-#     'django.contrib.auth.backends.RemoteUserBackend',
-# )
+# ProfileModelBackend loads the user with the profile, see
+# team_builder.backends.
+AUTHENTICATION_BACKENDS = (
+    'team_builder.backends.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+)
 
 
 # Internationalization
@@ -166,7 +208,52 @@ EMAIL_HOST_USER = 'yourusername@gmail.com'
 EMAIL_HOST_PASSWORD = 'yourpassword'
 EMAIL_PORT = 587
 
+# Emails are queued in projects.OutboundEmail and delivered by the
+# send_queued_emails command (use --backend file to write them to
+# EMAIL_FILE_PATH instead of sending them).
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+# Retry delays in seconds, doubled after every failed attempt.
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 3600
+# Seconds a worker has to send the emails it claimed before other workers
+# may send them again.
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 600
+
+# Share of requests whose query count, SQL, template and view time are
+# logged to the team_builder.timing logger (0 to 1), and whether to send
+# them to the client in a Server-Timing header.
+SERVER_TIMING_SAMPLE_RATE = 1.0
+SERVER_TIMING_HEADER = DEBUG
+
+# Queries slower than SLOW_QUERY_THRESHOLD milliseconds are appended to
+# SLOW_QUERY_LOG_FILE, see the slow_query_report command. None disables the
+# log.
+SLOW_QUERY_THRESHOLD = None
+SLOW_QUERY_LOG_FILE = os.path.join(BASE_DIR, 'slow_queries.log')
+
+# Instances of these models are loaded at most once per request through
+# foreign keys and one-to-one relations, see team_builder.identity. An empty
+# list disables the identity map.
+IDENTITY_MAP_MODELS = [
+    'accounts.MyUser',
+    'projects.UserProfile',
+    'projects.Project',
+    'projects.Position',
+]
+
+# Requests with an X-Profile header matching PROFILING_TOKEN, or with
+# ?profile=1 from a staff user, are profiled into PROFILING_DIR. None
+# disables profiling.
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_TOKEN = None
+PROFILING_INTERVAL = 0.001
+
 USE_PUSHER = False
+# Push notifications are sent by projects.notifications.dispatcher. Set
+# PUSHER_APP_ID, PUSHER_KEY, PUSHER_SECRET and PUSHER_HOST in local settings,
+# and PUSHER_PORT/PUSHER_SSL to use the pusher_stub command locally.
 
 # needed to make this work with bootstrap labels
 from django.contrib.messages import constants as messages
@@ -0,0 +1,141 @@
+"""
+Slow query log.
+
+``SlowQueryLog`` is an execute wrapper (see ``team_builder.db``) that appends
+every query slower than a threshold to a file as a JSON line, with the
+normalized SQL, parameters, duration, calling line and view. The plan of
+SELECT queries is captured with EXPLAIN the first time a query shape is seen
+and whenever it gets slower than before. The ``slow_query_report``
+management command aggregates the file.
+"""
+import json
+import os
+import re
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+
+_local = threading.local()
+
+# Maximum number of query shapes whose slowest duration is remembered.
+MAX_SHAPES = 1000
+
+
+def normalize(sql):
+    """Returns the shape of a query: literals and IN lists are collapsed,
+    so queries that only differ in their parameters are grouped."""
+    sql = re.sub(r"'(?:[^']|'')*'", "'?'", sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    sql = re.sub(r'\((?:(?:%s|\?), )+(?:%s|\?)\)', '(...)', sql)
+    return re.sub(r'(?: UNION ALL SELECT [%s?, ]+)+', ' UNION ALL ...', sql)
+
+
+def short_params(params, limit=20):
+    """Returns a short JSON-serializable version of query parameters."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        params = list(params.values())
+    values = []
+    for value in list(params)[:limit]:
+        if not isinstance(value, (int, float, bool, type(None))):
+            value = str(value)[:100]
+        values.append(value)
+    if len(params) > limit:
+        values.append('... {} more'.format(len(params) - limit))
+    return values
+
+
+def caller():
+    """Returns 'path:line in function' of the innermost project frame that
+    is not part of the database instrumentation."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    for filename, line, function, text in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(filename)
+        if not filename.startswith(settings.BASE_DIR):
+            continue
+        if os.path.dirname(filename) == here and (
+                os.path.basename(filename) in ('db.py', 'slow_queries.py',
+                                               'middleware.py')):
+            continue
+        return '{}:{} in {}'.format(
+            os.path.relpath(filename, settings.BASE_DIR), line, function)
+    return None
+
+
+def set_view(view):
+    """Remembers the view of the current thread's request for the log."""
+    _local.view = view
+
+
+class SlowQueryLog(object):
+    """Execute wrapper logging queries slower than threshold milliseconds to
+    path."""
+
+    def __init__(self, threshold, path):
+        self.threshold = threshold
+        self.path = path
+        self.slowest = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'explaining', False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - start) * 1000
+        if duration >= self.threshold:
+            self.log(sql, params, many, duration, context['connection'])
+        return result
+
+    def log(self, sql, params, many, duration, connection):
+        shape = normalize(sql)
+        entry = {
+            'time': time.time(),
+            'sql': shape,
+            'params': None if many else short_params(params),
+            'duration_ms': round(duration, 2),
+            'caller': caller(),
+            'view': getattr(_local, 'view', None),
+            'vendor': connection.vendor,
+        }
+        with self.lock:
+            slowest = self.slowest.get(shape)
+            if slowest is None and len(self.slowest) >= MAX_SHAPES:
+                explain = False
+            else:
+                explain = slowest is None or duration > slowest
+                if explain:
+                    self.slowest[shape] = duration
+        if explain and not many and sql.lstrip()[:6].upper() == 'SELECT':
+            entry['explain'] = self.explain(sql, params, connection)
+        line = json.dumps(entry, sort_keys=True)
+        with self.lock:
+            with open(self.path, 'a') as log:
+                log.write(line + '\n')
+
+    def explain(self, sql, params, connection):
+        """Returns the query plan of a query or None. The EXPLAIN runs in a
+        savepoint, so if it fails the request's transaction can go on."""
+        if connection.vendor == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        else:
+            prefix = 'EXPLAIN '
+        _local.explaining = True
+        try:
+            with transaction.atomic(using=connection.alias), \
+                    connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+        except DatabaseError:
+            return None
+        finally:
+            _local.explaining = False
+        if connection.vendor == 'sqlite':
+            return '\n'.join(str(row[-1]) for row in rows)
+        return '\n'.join(' | '.join(str(column) for column in row)
+                         for row in rows)
@@ -0,0 +1,105 @@
+"""
+SQLite tuning for concurrent use.
+
+``configure()`` is a ``connection_created`` receiver. If SQLITE_TUNING is set,
+it sets the PRAGMAS (overridden by SQLITE_PRAGMAS) on new connections to
+SQLite database files:
+
+* WAL journaling lets readers and one writer work at the same time, and
+  ``synchronous=NORMAL`` is safe with it while syncing less often.
+* Writers wait up to ``busy_timeout`` milliseconds for a lock instead of
+  failing with "database is locked".
+* ``atomic`` blocks start with BEGIN IMMEDIATE. A deferred transaction that
+  reads first and writes later can't wait for the write lock if another
+  writer committed in between, and fails at once.
+
+Every SQLITE_MAINTENANCE_INTERVAL seconds a new connection also runs
+``PRAGMA optimize`` and checkpoints the WAL file.
+
+``copy_sqlite()`` copies a live database, for the sync_replicas and
+bench_sqlite_writers commands.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    # Negative sizes are in KiB.
+    ('cache_size', -20000),
+    ('mmap_size', 128 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+    # Size the WAL file is truncated to after checkpoints.
+    ('journal_size_limit', 64 * 1024 * 1024),
+)
+
+_lock = threading.Lock()
+_last_maintenance = None
+
+
+def get_pragmas():
+    """Returns the PRAGMAS with SQLITE_PRAGMAS applied. A value of None
+    leaves a PRAGMA at its default."""
+    pragmas = dict(PRAGMAS)
+    pragmas.update(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    return [(name, value) for name, value in pragmas.items()
+            if value is not None]
+
+
+def maintenance_due():
+    """Returns True once every SQLITE_MAINTENANCE_INTERVAL seconds per
+    process."""
+    global _last_maintenance
+    interval = getattr(settings, 'SQLITE_MAINTENANCE_INTERVAL', 3600)
+    now = time.monotonic()
+    with _lock:
+        if (interval is None or _last_maintenance is not None and
+                now - _last_maintenance < interval):
+            return False
+        _last_maintenance = now
+        return True
+
+
+def maintain(connection):
+    """Updates the query planner statistics that need it and moves the WAL
+    file into the database."""
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA optimize')
+        cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+def _begin_immediate(connection):
+    def start_transaction_under_autocommit():
+        connection.cursor().execute('BEGIN IMMEDIATE')
+    return start_transaction_under_autocommit
+
+
+def configure(sender, connection, **kwargs):
+    if (connection.vendor != 'sqlite' or
+            not getattr(settings, 'SQLITE_TUNING', False) or
+            connection.is_in_memory_db(connection.settings_dict['NAME'])):
+        return
+    with connection.cursor() as cursor:
+        for name, value in get_pragmas():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+    connection._start_transaction_under_autocommit = _begin_immediate(
+        connection)
+    if maintenance_due():
+        maintain(connection)
+
+
+def copy_sqlite(source, path):
+    """Writes a consistent copy of the SQLite database of connection source
+    to path. The copy replaces path atomically, so readers see either the
+    old or the new copy."""
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    with source.cursor() as cursor:
+        cursor.execute('VACUUM INTO %s', [temporary])
+    os.replace(temporary, path)
@@ -0,0 +1,122 @@
+"""
+Cached loading of the logged in user.
+
+``get_user()`` replaces ``django.contrib.auth.get_user()`` for
+``CachedAuthenticationMiddleware``. It keeps the user, with the profile
+``layout.html`` shows, in the cache for AUTH_USER_CACHE_TIMEOUT seconds, so
+most requests read the user without queries. Entries are keyed by the user's
+version and the session's auth hash: ``invalidate()`` replaces the version when
+a change of the user or the profile is committed, and a password change makes
+the hash of existing sessions fail as before.
+
+Other processes must see the invalidation, so the cache is only used with a
+shared backend such as memcached. With a process-local backend ``get_user()``
+is ``django.contrib.auth.get_user()``. Either way the user is read from the
+database by ``team_builder.backends.ProfileModelBackend``, which loads the
+profile in the same query.
+"""
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib import auth
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.crypto import constant_time_compare
+
+from . import identity
+
+
+# Backends whose entries other processes cannot see.
+LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def enabled():
+    """Returns True if the default cache is shared between processes."""
+    backend = settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND']
+    return backend not in LOCAL_BACKENDS
+
+
+def version_key(user_id):
+    return 'auth-user-version:{}'.format(user_id)
+
+
+def get_version(user_id):
+    """Returns the current version of a user's entries. A missing version,
+    for instance after an eviction, is replaced by a new one, so older
+    entries are never read again."""
+    version = cache.get(version_key(user_id))
+    if version is None:
+        cache.add(version_key(user_id), uuid.uuid4().hex, None)
+        version = cache.get(version_key(user_id))
+    return version
+
+
+def get_user(request):
+    """Returns the user of the request's session, from the cache if
+    possible."""
+    if not enabled():
+        return auth.get_user(request)
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+        session_hash = request.session[auth.HASH_SESSION_KEY]
+    except KeyError:
+        return auth.get_user(request)
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    key = 'auth-user:{}:{}:{}'.format(user_id, get_version(user_id),
+                                      session_hash)
+    user = cache.get(key)
+    if user is None or not constant_time_compare(
+            session_hash, user.get_session_auth_hash()):
+        # Verifies the session and logs out stale ones.
+        user = auth.get_user(request)
+        if not user.is_authenticated:
+            return user
+        try:
+            # Loaded already unless the session's backend is ModelBackend.
+            user.userprofile
+        except ObjectDoesNotExist:
+            pass
+        cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+    user.backend = backend_path
+
+    identities = identity.get_current()
+    if identities is not None:
+        identities.add(user)
+    return user
+
+
+def invalidate(user_id):
+    """Makes the cached entries of a user stale."""
+    cache.set(version_key(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate_user(sender, instance, **kwargs):
+    """Invalidates the cached user when a change of it or its profile is
+    committed. Invalidating earlier would let a concurrent request cache the
+    old row again."""
+    # Every login saves last_login, which no page shows.
+    if (not enabled() or
+            kwargs.get('update_fields') == frozenset(['last_login'])):
+        return
+    if sender is apps.get_model(settings.AUTH_USER_MODEL):
+        user_id = instance.pk
+    else:
+        user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate(user_id))
+
+
+def install(profile_model):
+    """Connects the invalidation to the user model and profile_model."""
+    for model in (settings.AUTH_USER_MODEL, profile_model):
+        uid = 'team_builder.user_cache.' + model
+        post_save.connect(invalidate_user, sender=model, dispatch_uid=uid)
+        post_delete.connect(invalidate_user, sender=model, dispatch_uid=uid)